@@ -1,10 +1,46 @@
-from flask import Flask, request, send_file, abort, jsonify
+from a2wsgi import WSGIMiddleware
+from flask import Flask, request, send_file, abort, jsonify, stream_with_context, g, has_request_context
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from werkzeug.exceptions import HTTPException, ClientDisconnected
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, Epilogue, Field, File, Data
+from werkzeug.wsgi import FileWrapper
+import asyncio
+import base64
+import contextvars
+import io
+import signal
 import subprocess
+import sys
 import tempfile
 import os
 import logging
+import mmap
 import xml.etree.ElementTree as ET
+import contextlib
 import hmac
+import importlib.util
+import itertools
+import hashlib
+import gzip
+import json
+import queue
+import re
+import resource
+import select
+import shutil
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+import weakref
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 from typing import Optional
 
 app = Flask(__name__)
@@ -35,6 +71,53 @@ ICC_PROFILE_PATH = '/opt/mustang/sRGB.icc' # Wird für diesen Endpunkt nicht dir
 MUSTANG_CLI_JAR = '/opt/mustang/Mustang-CLI.jar'
 MUSTANG_TAG_PATH = '/opt/mustang/mustang_tag.txt'
 MUSTANG_HELP_PATH = '/opt/mustang/mustang_help.txt'
+# Compiled worker/MustangWorker.java (see Dockerfile)
+MUSTANG_WORKER_CLASSPATH = '/opt/mustang/worker'
+
+# Warm Mustang JVMs (0 = disabled, every call starts `java -jar` like before)
+MUSTANG_WORKER_POOL_SIZE = int(os.environ.get('MUSTANG_WORKER_POOL_SIZE', '2'))
+MUSTANG_WORKER_MAX_JOBS = int(os.environ.get('MUSTANG_WORKER_MAX_JOBS', '200'))
+MUSTANG_WORKER_MAX_HEAP_MB = int(os.environ.get('MUSTANG_WORKER_MAX_HEAP_MB', '768'))
+MUSTANG_WORKER_ACQUIRE_TIMEOUT = float(os.environ.get('MUSTANG_WORKER_ACQUIRE_TIMEOUT', '10'))
+MUSTANG_WORKER_JAVA_OPTS = os.environ.get('MUSTANG_WORKER_JAVA_OPTS', '-Xmx1g').split()
+
+# ───── JVM Launcher (CDS-Archive + Flags für kurzlebige Prozesse) ─────
+# Archives are produced at build time by cds/train.sh; a missing archive just means a normal JVM start
+MUSTANG_CDS_ARCHIVE = os.environ.get('MUSTANG_CDS_ARCHIVE', '/opt/mustang/cds/mustang.jsa')
+VERAPDF_CDS_ARCHIVE = os.environ.get('VERAPDF_CDS_ARCHIVE', '/opt/mustang/cds/verapdf.jsa')
+# One-shot CLI runs are short: C1 only, serial GC, no perf-data file
+MUSTANG_JAVA_OPTS = os.environ.get(
+    'MUSTANG_JAVA_OPTS', '-XX:TieredStopAtLevel=1 -XX:+UseSerialGC -XX:-UsePerfData').split()
+VERAPDF_JAVA_OPTS = os.environ.get(
+    'VERAPDF_JAVA_OPTS', '-XX:TieredStopAtLevel=1 -XX:+UseSerialGC -XX:-UsePerfData').split()
+
+def _jvm_opts(cds_archive: str, extra: list[str]) -> list[str]:
+    """
+    Common JVM options. JVM warnings (e.g. a CDS archive that no longer matches the jar) go to
+    stderr so they never end up in stdout reports; -Xshare:auto ignores unusable archives.
+    """
+    opts = ['-Xshare:auto', '-Xlog:all=warning:stderr', *extra]
+    if cds_archive and os.path.isfile(cds_archive):
+        opts.append(f'-XX:SharedArchiveFile={cds_archive}')
+    return opts
+
+def _mustang_cli_cmd(args: list[str]) -> list[str]:
+    return ['java', *_jvm_opts(MUSTANG_CDS_ARCHIVE, MUSTANG_JAVA_OPTS), '-jar', MUSTANG_CLI_JAR, *args]
+
+def _mustang_worker_cmd() -> list[str]:
+    # Long-lived: keep C2/default GC, only share the archive (classpath starts with the archived jar)
+    return [
+        'java', *_jvm_opts(MUSTANG_CDS_ARCHIVE, MUSTANG_WORKER_JAVA_OPTS),
+        '-Djava.security.manager=allow',
+        '-cp', f'{MUSTANG_CLI_JAR}{os.pathsep}{MUSTANG_WORKER_CLASSPATH}',
+        'MustangWorker'
+    ]
+
+def _verapdf_env() -> dict:
+    """Environment for the verapdf launcher script, which passes JAVA_OPTS to its JVM."""
+    env = dict(os.environ)
+    env['JAVA_OPTS'] = ' '.join([*_jvm_opts(VERAPDF_CDS_ARCHIVE, VERAPDF_JAVA_OPTS), env.get('JAVA_OPTS', '')]).strip()
+    return env
 
 def _safe_read_text(path: str, max_bytes: int = 32_000) -> Optional[str]:
     try:
@@ -48,7 +131,8 @@ def _safe_read_text(path: str, max_bytes: int = 32_000) -> Optional[str]:
 
 def _run_version_cmd(cmd: list[str], timeout: int = 3) -> Optional[str]:
     try:
-        p = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        p = _run_process(cmd, timeout)
+        p.release()
         out = (p.stdout or "").strip()
         err = (p.stderr or "").strip()
         # Some tools (java -version) print to stderr
@@ -58,10 +142,10 @@ def _run_version_cmd(cmd: list[str], timeout: int = 3) -> Optional[str]:
         app.logger.warning(f"Version cmd failed ({cmd}): {e}")
         return None
 
-def _try_parse_json(text: str) -> Optional[dict]:
+def _try_parse_json_file(path: str, object_hook=None) -> Optional[dict]:
     try:
-        import json
-        return json.loads(text)
+        with open(path, 'rb') as f:
+            return json.load(f, object_hook=object_hook)
     except Exception:
         return None
 
@@ -100,6 +184,7 @@ def version():
     - Java runtime version
     - Ghostscript version
     - veraPDF CLI version (if installed)
+    - XSD/Schematron artefacts of the fast validation engine (if installed)
     """
     return jsonify({
         "ok": True,
@@ -116,7 +201,8 @@ def version():
         "verapdf": {
             "version": _run_version_cmd(["verapdf", "--version"]),
             "helpUsageLine": (_run_version_cmd(["verapdf", "--help"], timeout=2) or "").splitlines()[0:1]
-        }
+        },
+        "fast_validation": _fast_validation_status()
     }), 200
 
 def _tail(text: str, max_len: int = 8000) -> str:
@@ -124,445 +210,4438 @@ def _tail(text: str, max_len: int = 8000) -> str:
         return ""
     return text[-max_len:] if len(text) > max_len else text
 
-def _extract_validation_xml(text: str) -> Optional[str]:
+_FINDINGS_MODES = ('summary', 'errors', 'all')
+_REPORT_CHUNK = 64 * 1024
+_REPORT_END_TAG = "</validation>"
+
+class MustangReportParser:
     """
-    Mustang CLI prints an XML report to stdout, but may also emit log lines before/after.
-    We extract the first XML declaration and the last closing </validation> tag.
+    Incremental parser for Mustang's <validation> report (XMLPullParser).
+
+    Mustang CLI prints the XML report to stdout, but may also emit log lines before/after:
+    everything before the first XML declaration is skipped, feeding stops at the closing
+    </validation>. Findings are handed out as soon as their element is complete and then
+    dropped from the tree, so memory stays bounded by the current element path.
     """
-    if not text:
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._pending = ''
+        self._fed_tail = ''
+        self._path: list[ET.Element] = []
+        self._messages_depth: Optional[int] = None
+        self._status: dict[int, Optional[str]] = {}
+        self.started = False
+        self.done = False
+        self.filename: Optional[str] = None
+        self.datetime: Optional[str] = None
+        self.counts: dict[str, int] = {}
+
+    @property
+    def status(self) -> Optional[str]:
+        # Prefer the summary inside <xml>, then the top-level summary, then any other
+        for rank in sorted(self._status):
+            return self._status[rank]
         return None
-    start = text.find("<?xml")
-    if start < 0:
+
+    def feed(self, text: str):
+        """Feeds a chunk of tool output; yields the findings completed by it (raises ET.ParseError)."""
+        if self.done or not text:
+            return
+        if not self.started:
+            text = self._pending + text
+            start = text.find("<?xml")
+            if start < 0:
+                # Keep a partial "<?xml" at the chunk boundary
+                self._pending = text[-4:]
+                return
+            self.started = True
+            self._pending = ''
+            text = text[start:]
+        # The closing tag may be split across chunks: search it together with the end of the last one
+        carried = self._fed_tail + text
+        end = carried.find(_REPORT_END_TAG)
+        if end >= 0:
+            text = text[:end + len(_REPORT_END_TAG) - len(self._fed_tail)]
+        self._fed_tail = carried[-(len(_REPORT_END_TAG) - 1):]
+        self._parser.feed(text)
+        yield from self._read_events()
+
+    def feed_file(self, f):
+        while not self.done:
+            chunk = f.read(_REPORT_CHUNK)
+            if not chunk:
+                return
+            yield from self.feed(chunk)
+
+    def _read_events(self):
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                self._path.append(elem)
+                depth = len(self._path)
+                if depth == 1:
+                    self.filename = elem.get("filename")
+                    self.datetime = elem.get("datetime")
+                elif elem.tag == 'messages' and (depth == 2 or (depth == 3 and self._path[1].tag == 'xml')):
+                    # Findings can appear under <xml><messages> and/or top-level <messages>
+                    self._messages_depth = depth
+                continue
+
+            depth = len(self._path)
+            self._path.pop()
+            if depth == 1:
+                self.done = True
+                return
+            if self._messages_depth is not None and depth == self._messages_depth + 1:
+                self.counts[elem.tag] = self.counts.get(elem.tag, 0) + 1
+                yield {
+                    "tag": elem.tag,
+                    "attributes": dict(elem.attrib),
+                    "text": (elem.text or "").strip()
+                }
+            elif depth == self._messages_depth:
+                self._messages_depth = None
+            elif elem.tag == 'summary':
+                parent = self._path[-1].tag
+                rank = 0 if parent == 'xml' and depth == 3 else 1 if depth == 2 else 2
+                self._status.setdefault(rank, elem.get("status"))
+            # Completed subtrees are not needed any more
+            self._path[-1].remove(elem)
+
+def _iter_mustang_findings(result: "ToolResult", parser: MustangReportParser):
+    """Findings from Mustang's spooled stdout; falls back to stderr when stdout carries no report (rare)."""
+    for open_output in (result.open_stdout, result.open_stderr):
+        with open_output() as f:
+            yield from parser.feed_file(f)
+        if parser.started:
+            return
+
+def _wanted_finding(finding: dict, mode: str) -> bool:
+    return mode == 'all' or (mode == 'errors' and finding["tag"] == 'error')
+
+def _select_findings(findings, mode: str, max_findings: Optional[int]):
+    """Filters by findings mode and stops collecting after max_findings. Returns (list, truncated)."""
+    selected, truncated = [], False
+    for finding in findings:
+        if not _wanted_finding(finding, mode):
+            continue
+        if max_findings is not None and len(selected) >= max_findings:
+            # Keep consuming: counts and the summary status come after the messages
+            truncated = True
+            continue
+        selected.append(finding)
+    return selected, truncated
+
+# ───── Pre-Flight (Eingangsprüfung vor dem JVM-Start) ─────
+# Trivially broken uploads are rejected in Python within milliseconds instead of costing a Mustang run
+PREFLIGHT_ENABLED = os.environ.get('PREFLIGHT_ENABLED', '1') != '0'
+_PREFLIGHT_CHUNK = 1024 * 1024
+_PDF_HEADER_WINDOW = 1024  # PDF readers accept junk before %PDF- within the first KB
+
+_XML_SYNTAXES = {
+    '{urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100}CrossIndustryInvoice': 'CII',
+    '{urn:ferd:CrossIndustryDocument:invoice:1p0}CrossIndustryDocument': 'CII',
+    '{urn:oasis:names:specification:ubl:schema:xsd:Invoice-2}Invoice': 'UBL',
+    '{urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2}CreditNote': 'UBL',
+}
+
+# Guideline/CustomizationID fragment → Mustang profile (first match wins, most specific first)
+_GUIDELINE_PROFILES = (
+    ('xrechnung', 'XRECHNUNG'),
+    ('extended', 'EXTENDED'),
+    ('basicwl', 'BASICWL'),
+    ('minimum', 'MINIMUM'),
+    ('basic', 'BASIC'),
+    ('comfort', 'COMFORT'),
+    ('en16931', 'EN16931'),
+)
+
+# Embedded file streams are never inside object streams, so their dictionary shows up in the raw bytes.
+# /AF only as a key (followed by an array or a reference), not as the prefix of /AFRelationship.
+_EMBEDDED_INVOICE_RE = re.compile(
+    rb'/EmbeddedFile|#2Fxml|/AF[\x00\t\n\x0c\r ]*\[|/AF[\x00\t\n\x0c\r ]+\d+[\x00\t\n\x0c\r ]+\d+[\x00\t\n\x0c\r ]+R')
+_EMBEDDED_INVOICE_CARRY = 64  # longest marker incl. "/AF <obj> <gen> R"
+
+class PreflightError(Exception):
+    """Input rejected before any tool runs; error is a stable code, details go into the response."""
+
+    def __init__(self, error: str, message: str, **details):
+        super().__init__(message)
+        self.error = error
+        self.message = message
+        self.details = details
+
+    def body(self) -> dict:
+        return {"ok": False, "status": "invalid", "error": self.error, "message": self.message,
+                "preflight": self.details}
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def _profile_from_guideline(guideline: Optional[str]) -> Optional[str]:
+    if not guideline:
         return None
-    end = text.rfind("</validation>")
-    if end < 0 or end <= start:
+    lowered = guideline.lower()
+    for marker, profile in _GUIDELINE_PROFILES:
+        if marker in lowered:
+            return PROFILE_MAPPING.get(profile, profile)
+    return None
+
+def _preflight_xml(path, header_only: bool = False) -> dict:
+    """
+    path may also be a binary file object; header_only stops at the guideline ID (profile detection
+    without checking the rest of the document). Streaming well-formedness check (iterparse, elements cleared as they close), CII/UBL from the
+    root element and the guideline ID (CII GuidelineSpecifiedDocumentContextParameter/ID, UBL CustomizationID).
+    Other roots (e.g. Order-X) are left to Mustang: syntax and profile stay None.
+    """
+    syntax = guideline = root = None
+    path_names: list[str] = []
+    try:
+        for event, elem in ET.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                if not path_names:
+                    root = elem.tag
+                    syntax = _XML_SYNTAXES.get(root)
+                    if syntax is None and header_only:
+                        break
+                path_names.append(_local_name(elem.tag))
+                continue
+            name = path_names.pop()
+            if syntax and guideline is None and elem.text and (
+                    (name == 'ID' and path_names[-1:] == ['GuidelineSpecifiedDocumentContextParameter'])
+                    or (name == 'CustomizationID' and len(path_names) == 1)):
+                guideline = elem.text.strip()
+                if header_only:
+                    break
+            elem.clear()
+    except ET.ParseError as e:
+        line, column = e.position
+        raise PreflightError('xml_not_well_formed', f"XML ist nicht wohlgeformt: {e}",
+                             type='xml', line=line, column=column)
+    return {"type": "xml", "syntax": syntax, "root": root, "guideline_id": guideline,
+            "profile": _profile_from_guideline(guideline)}
+
+def _preflight_pdf(path: str, require_invoice: bool = True) -> dict:
+    """%PDF- header and (optionally) any trace of an embedded file, scanned chunk by chunk."""
+    with open(path, 'rb') as f:
+        if b'%PDF-' not in f.read(_PDF_HEADER_WINDOW):
+            raise PreflightError('not_a_pdf', "Datei ist kein PDF (kein %PDF-Header).", type='pdf')
+        if not require_invoice:
+            return {"type": "pdf"}
+        f.seek(0)
+        carry = b''
+        while True:
+            chunk = f.read(_PREFLIGHT_CHUNK)
+            if not chunk:
+                break
+            window = carry + chunk
+            if _EMBEDDED_INVOICE_RE.search(window):
+                return {"type": "pdf", "embedded_files": True}
+            carry = window[-_EMBEDDED_INVOICE_CARRY:]
+    raise PreflightError('no_embedded_invoice',
+                         "PDF enthält keine eingebettete Rechnung (keine EmbeddedFiles/AF).", type='pdf')
+
+def _preflight_document(path: str) -> Optional[dict]:
+    """Pre-flight for /validate by file extension (see _with_document_extension). None if disabled."""
+    if not PREFLIGHT_ENABLED:
         return None
-    end += len("</validation>")
-    return text[start:end]
+    if path.endswith('.pdf'):
+        return _preflight_pdf(path)
+    return _preflight_xml(path)
 
-def _parse_mustang_validation_report(xml_report: str) -> dict:
-    root = ET.fromstring(xml_report)
+# ───── Metriken (Prometheus) & Server-Timing ─────
+_SIZE_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 2.5e8)
+_TOOL_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 180)
 
-    # Prefer the summary inside <xml>, fall back to the top-level summary
-    summary_el = root.find("./xml/summary") or root.find("./summary") or root.find(".//summary")
-    status = summary_el.get("status") if summary_el is not None else None
+REQUEST_DURATION = Histogram(
+    'mustang_api_request_duration_seconds', 'HTTP request latency', ['endpoint', 'method', 'status'],
+    buckets=_TOOL_BUCKETS)
+UPLOAD_SIZE = Histogram(
+    'mustang_api_upload_size_bytes', 'Request body size', ['endpoint'], buckets=_SIZE_BUCKETS)
+TOOL_DURATION = Histogram(
+    'mustang_api_tool_duration_seconds', 'Backend tool runtime (incl. process spawn)', ['tool'],
+    buckets=_TOOL_BUCKETS)
+TOOL_EXIT_CODES = Counter(
+    'mustang_api_tool_exit_codes_total', 'Backend tool exit codes (timeout = killed after timeout)', ['tool', 'code'])
+TOOL_CPU_SECONDS = Histogram(
+    'mustang_api_tool_cpu_seconds', 'CPU time (user + system) per one-shot tool process', ['tool'],
+    buckets=_TOOL_BUCKETS)
+TOOL_MAX_RSS = Histogram(
+    'mustang_api_tool_max_rss_bytes', 'Peak RSS per one-shot tool process', ['tool'],
+    buckets=(1.6e7, 3.2e7, 6.4e7, 1.28e8, 2.56e8, 5.12e8, 1e9, 2e9, 4e9))
+TOOL_OUTPUT_SIZE = Histogram(
+    'mustang_api_tool_output_bytes', 'Spooled output per one-shot tool process', ['tool', 'stream'],
+    buckets=_SIZE_BUCKETS)
+VALIDATION_RESULTS = Counter(
+    'mustang_api_validation_results_total', 'Validation outcome per tool run', ['endpoint', 'status'])
+RESULT_CACHE_LOOKUPS = Counter(
+    'mustang_api_result_cache_lookups_total', 'Result cache lookups by state', ['endpoint', 'state'])
+VERAPDF_BATCH_SIZE = Histogram(
+    'mustang_api_verapdf_batch_size', 'PDFs per coalesced veraPDF run', buckets=(1, 2, 4, 8, 16, 32))
+ADMISSION_WAIT = Histogram(
+    'mustang_api_admission_wait_seconds', 'Queue wait before a tool may run', ['tool'],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
 
-    findings = []
-    # Findings can appear under <xml><messages> and/or top-level <messages>
-    for path in ("./xml/messages", "./messages"):
-        msgs = root.find(path)
-        if msgs is None:
-            continue
-        for item in list(msgs):
-            findings.append({
-                "tag": item.tag,
-                "attributes": dict(item.attrib),
-                "text": (item.text or "").strip()
-            })
+class _StateCollector:
+    """Exports admission-queue and cache occupancy at scrape time."""
 
-    return {
-        "filename": root.get("filename"),
-        "datetime": root.get("datetime"),
-        "status": status,
-        "findings": findings
-    }
+    def describe(self):
+        # Registered before _admission/_result_cache exist; skip the registry's probe collect()
+        return []
 
-# ───── MustangCLI-Endpunkt (Diagrammerstellung - wie zuvor) ─────
-@app.route('/generate', methods=['POST'])
-def generate():
-    java_src = request.data
-    if not java_src:
-        app.logger.error("MustangCLI /generate: Keine Daten im Request Body.")
-        abort(400, "Keine Daten im Request Body für /generate.")
+    def collect(self):
+        running = GaugeMetricFamily('mustang_api_admission_running', 'Running tool calls', labels=['tool'])
+        queued = GaugeMetricFamily('mustang_api_admission_queued', 'Waiting tool calls', labels=['tool'])
+        reserved = GaugeMetricFamily('mustang_api_admission_reserved_bytes', 'Reserved memory estimate', labels=['tool'])
+        rejected = CounterMetricFamily('mustang_api_admission_rejected', 'Shed tool calls (503)', labels=['tool'])
+        for name, gate in _admission.gates.items():
+            running.add_metric([name], gate.running)
+            queued.add_metric([name], gate.queued)
+            reserved.add_metric([name], gate.reserved_bytes)
+            rejected.add_metric([name], gate.rejected_total)
+        yield from (running, queued, reserved, rejected)
+        yield GaugeMetricFamily('mustang_api_admission_budget_bytes', 'Admission memory budget',
+                                value=_admission.budget_bytes)
+        ws = _workspaces.stats()
+        active = GaugeMetricFamily('mustang_api_workspaces_active', 'Open workspaces', labels=['tier'])
+        allocated = CounterMetricFamily('mustang_api_workspaces_allocated', 'Allocated workspaces', labels=['tier'])
+        for tier in ('ram', 'disk'):
+            active.add_metric([tier], ws['active'][tier])
+            allocated.add_metric([tier], ws['allocated_total'][tier])
+        yield from (active, allocated)
+        yield GaugeMetricFamily('mustang_api_workspace_ram_reserved_bytes', 'Reserved bytes on the RAM mount',
+                                value=ws['ram_reserved_bytes'])
+        worker_jobs = GaugeMetricFamily('mustang_api_worker_jobs', 'Jobs run by a live pool worker', labels=['tool', 'pid'])
+        recycled = CounterMetricFamily('mustang_api_worker_recycled', 'Retired pool workers', labels=['tool'])
+        for tool, pool in (('mustang', _mustang_pool), ('fast', _fast_pool)):
+            if pool is None:
+                continue
+            stats = pool.stats()
+            for worker in stats['workers']:
+                worker_jobs.add_metric([tool, str(worker['pid'])], worker['jobs'])
+            recycled.add_metric([tool], stats['recycled_total'])
+        yield from (worker_jobs, recycled)
+        if _result_cache is not None:
+            cache = _result_cache.stats()
+            yield GaugeMetricFamily('mustang_api_result_cache_entries', 'Entries in the memory tier',
+                                    value=cache['entries'])
+            yield GaugeMetricFamily('mustang_api_result_cache_memory_bytes', 'Bytes in the memory tier',
+                                    value=cache['memory_bytes'])
+            yield GaugeMetricFamily('mustang_api_result_cache_disk_bytes', 'Bytes in the disk tier',
+                                    value=cache['disk_bytes'])
 
-    with tempfile.TemporaryDirectory() as tmp:
-        src = os.path.join(tmp, 'Input.java')
-        out = os.path.join(tmp, 'diagram.png')
-        with open(src, 'wb') as f:
-            f.write(java_src)
+REGISTRY.register(_StateCollector())
 
-        if os.path.getsize(src) == 0:
-            app.logger.error("MustangCLI /generate: Geschriebene Input.java Datei ist leer.")
-            abort(500, "Temporäre Input.java Datei ist leer.")
+@contextlib.contextmanager
+def _timed(phase: str):
+    """Adds the block's duration to the Server-Timing phase of the current request (no-op outside requests)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_timing(phase, time.perf_counter() - started)
 
-        # Annahme: Die 'generate'-Aktion von MustangCLI hat eine andere Syntax
-        cmd = ['java', '-jar', MUSTANG_CLI_JAR, 'generate', src, '--output', out]
-        app.logger.info(f"MustangCLI /generate: Führe Befehl aus: {' '.join(cmd)}")
-        try:
-            result = subprocess.run(cmd, check=True, timeout=60, capture_output=True, text=True)
-            app.logger.info(f"MustangCLI /generate STDOUT: {result.stdout}")
-            if result.stderr:
-                app.logger.info(f"MustangCLI /generate STDERR: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            error_message = f"MustangCLI-Fehler (Code {e.returncode}): {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
-            app.logger.error(f"MustangCLI /generate Fehler: {error_message}")
-            abort(500, error_message)
-        except subprocess.TimeoutExpired as e:
-            error_message = f"MustangCLI Timeout: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
-            app.logger.error(f"MustangCLI /generate Timeout: {error_message}")
-            abort(500, error_message)
+def _add_timing(phase: str, seconds: float):
+    if has_request_context():
+        timings = g.setdefault('server_timing', {})
+        timings[phase] = timings.get(phase, 0.0) + seconds
 
-        if not os.path.exists(out) or os.path.getsize(out) == 0:
-            app.logger.error("MustangCLI /generate: Ausgabedatei wurde nicht erstellt oder ist leer.")
-            abort(500, "MustangCLI Ausgabedatei wurde nicht erstellt oder ist leer.")
-        return send_file(out, mimetype='image/png')
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    if request.method == 'POST' and request.content_length:
+        UPLOAD_SIZE.labels(_metrics_endpoint()).observe(request.content_length)
 
-# ───── PDF → PDF/A-3-Konvertierung (Ghostscript - wie zuvor) ─────
-@app.route('/convert_pdfa3', methods=['POST'])
-def convert_pdfa3():
-    ctype = request.content_type or ''
-    pdf_data = None
+def _metrics_endpoint() -> str:
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
 
-    if ctype.startswith('multipart/form-data'):
-        if 'file' not in request.files:
-            app.logger.error("PDF/A-3 /convert_pdfa3: Kein File-Feld 'file'.")
-            abort(400, "Kein File-Feld 'file' gefunden")
-        pdf_file_storage = request.files['file']
-        pdf_data = pdf_file_storage.read()
-        if not pdf_data:
-            app.logger.error("PDF/A-3 /convert_pdfa3: Hochgeladene PDF ist leer.")
-            abort(400, "Hochgeladene PDF-Datei ist leer.")
-    elif ctype == 'application/pdf':
-        pdf_data = request.get_data()
-        if not pdf_data:
-            app.logger.error("PDF/A-3 /convert_pdfa3: Gesendete PDF-Daten sind leer.")
-            abort(400, "Gesendete PDF-Daten sind leer.")
-    else:
-        app.logger.error(f"PDF/A-3 /convert_pdfa3: Ungültiger CT: {ctype}")
-        abort(400, f"Content-Type muss application/pdf oder multipart/form-data sein, war aber '{ctype}'")
+@app.after_request
+def _add_server_timing(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    timings = g.get('server_timing', {})
+    parts = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    response.headers['Server-Timing'] = ', '.join(parts)
+    REQUEST_DURATION.labels(_metrics_endpoint(), request.method, str(response.status_code)).observe(total)
+    return response
 
-    with tempfile.TemporaryDirectory() as tmp:
-        inp = os.path.join(tmp, 'in.pdf')
-        out = os.path.join(tmp, 'out_pdfa3.pdf')
-        with open(inp, 'wb') as f:
-            f.write(pdf_data)
-        if os.path.getsize(inp) == 0:
-            abort(500, "Temporäre Eingabe-PDF ist leer.")
-        
-        # ICC Profil Pfad prüfen, aber nur wenn er nicht leer ist
-        # if ICC_PROFILE_PATH and not os.path.exists(ICC_PROFILE_PATH):
-        #     error_message = f"ICC-Profil nicht gefunden: {ICC_PROFILE_PATH}"
-        #     app.logger.error(error_message)
-        #     abort(500, error_message)
-
-        gs_cmd = [
-            'gs', '-dPDFA=3', '-dPDFACompatibilityPolicy=1', '-dBATCH',
-            '-dNOPAUSE', '-sDEVICE=pdfwrite', '-dEmbedAllFonts=true',
-            '-dSubsetFonts=true', '-sProcessColorModel=DeviceRGB',
-            # Wenn Sie das ICC-Profil Problem gelöst haben, können Sie es wieder einkommentieren:
-            # f'-sOutputICCProfile={ICC_PROFILE_PATH}',
-            f'-sOutputFile={out}', inp
-        ]
-        app.logger.info(f"Ghostscript /convert_pdfa3: Befehl: {' '.join(gs_cmd)}")
-        try:
-            result = subprocess.run(gs_cmd, check=True, timeout=120, capture_output=True, text=True)
-            if result.stdout: app.logger.info(f"GS STDOUT: {result.stdout}")
-            if result.stderr: app.logger.info(f"GS STDERR: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            error_message = f"GS-Fehler (Code {e.returncode}): {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
-            app.logger.error(error_message)
-            abort(500, error_message)
-        except subprocess.TimeoutExpired as e:
-            error_message = f"GS Timeout: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
-            app.logger.error(error_message)
-            abort(500, error_message)
-        if not os.path.exists(out) or os.path.getsize(out) == 0:
-            abort(500, "GS Ausgabedatei nicht erstellt/leer.")
-        return send_file(out, mimetype='application/pdf', as_attachment=True, download_name='output_pdfa3.pdf')
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition (Bearer token like every endpoint)."""
+    with _timed('serialize'):
+        payload = generate_latest(REGISTRY)
+    return app.response_class(payload, mimetype=CONTENT_TYPE_LATEST)
 
-# ───── Endpunkt: XML in PDF einbetten (ZUGFeRD/Factur-X mit MustangCLI) - ANGEPASST ─────
-@app.route('/embed_xml', methods=['POST'])
-def embed_xml():
-    if 'pdf_file' not in request.files or 'xml_file' not in request.files:
-        app.logger.error("MustangCLI /embed_xml: Fehlende Dateien. 'pdf_file' und 'xml_file' werden benötigt.")
-        abort(400, "Fehlende Dateien: 'pdf_file' und 'xml_file' werden benötigt.")
+# ───── Komprimierte JSON-Antworten (Accept-Encoding: zstd / gzip) ─────
+# Registered after _add_server_timing, so it runs before it and 'compress' shows up in Server-Timing
+JSON_COMPRESSION_ENABLED = os.environ.get('JSON_COMPRESSION_ENABLED', '1') != '0'
+JSON_COMPRESSION_MIN_BYTES = int(os.environ.get('JSON_COMPRESSION_MIN_BYTES', '1024'))
+JSON_COMPRESSION_GZIP_LEVEL = 6
+JSON_COMPRESSION_ZSTD_LEVEL = 3
 
-    pdf_file_storage = request.files['pdf_file']
-    xml_file_storage = request.files['xml_file']
+try:
+    import zstandard
+except ImportError:  # optional: without it only gzip is offered
+    zstandard = None
 
-    # ZUGFeRD-spezifische Parameter aus der Query-String lesen
-    # Die Default-Werte hier sollten mit der Hilfeausgabe der MustangCLI übereinstimmen
-    # Hilfe sagt für --version <1|2>. '2' ist hier für ZUGFeRD 2.x.
-    zugferd_version_param = request.args.get('version', '2') 
-    
-    # Sicherstellen, dass der Profilname exakt einem der gültigen Werte entspricht
-    # z.B. "XRechnung", "EN16931", "COMFORT" etc. (Groß-/Kleinschreibung beachten!)
-    # Als Default nehmen wir einen gängigen Wert für Deutschland.
-    zugferd_profile_param = request.args.get('profile', 'XRECHNUNG')
-    # NEU: Mapping anwenden
-    zugferd_profile_param = PROFILE_MAPPING.get(zugferd_profile_param, zugferd_profile_param)
-    
-    # Format-Parameter, 'zf' für ZUGFeRD oder 'fx' für Factur-X.
-    zugferd_format_param = request.args.get('format', 'zf')
+_JSON_ENCODINGS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
 
-    pdf_data = pdf_file_storage.read()
-    xml_data = xml_file_storage.read()
+def _compress_json(data: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=JSON_COMPRESSION_ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=JSON_COMPRESSION_GZIP_LEVEL, mtime=0)
 
-    if not pdf_data:
-        app.logger.error("MustangCLI /embed_xml: Hochgeladene PDF-Datei ist leer.")
-        abort(400, "Hochgeladene PDF-Datei ist leer.")
-    if not xml_data:
-        app.logger.error("MustangCLI /embed_xml: Hochgeladene XML-Datei ist leer.")
-        abort(400, "Hochgeladene XML-Datei ist leer.")
+@app.after_request
+def _compress_json_response(response):
+    """
+    Compresses buffered JSON responses (reports, job results, errors) when the client accepts it.
+    Streams (NDJSON, downloads) and small bodies are sent as they are.
+    """
+    if not JSON_COMPRESSION_ENABLED or response.mimetype != 'application/json':
+        return response
+    if response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(_JSON_ENCODINGS)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < JSON_COMPRESSION_MIN_BYTES:
+        return response
+    with _timed('compress'):
+        response.set_data(_compress_json(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
 
-    with tempfile.TemporaryDirectory() as tmp:
-        temp_pdf_path = os.path.join(tmp, 'source.pdf')
-        temp_xml_path = os.path.join(tmp, 'invoice.xml')
-        temp_output_pdf_path = os.path.join(tmp, 'output_with_xml.pdf')
+# ───── Admission Control (java / gs / verapdf) ─────
+# Global memory budget for all tool processes; each job reserves an estimate based on its upload size
+ADMISSION_MEMORY_BUDGET_MB = int(os.environ.get('ADMISSION_MEMORY_BUDGET_MB', '3072'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '30'))
+
+# tool: (max concurrent, max queued, base MB per process, MB per MB of input)
+_ADMISSION_DEFAULTS = {
+    'mustang': (4, 16, 400, 4.0),
+    'gs': (4, 16, 150, 3.0),
+    'verapdf': (2, 8, 500, 5.0),
+}
+
+_admission_local = threading.local()
+
+class ToolOverloaded(HTTPException):
+    """Raised when a tool's queue is full or the queue wait timed out; rendered as 503 + Retry-After."""
+    code = 503
 
-        with open(temp_pdf_path, 'wb') as f_pdf:
-            f_pdf.write(pdf_data)
-        with open(temp_xml_path, 'wb') as f_xml:
-            f_xml.write(xml_data)
-
-        # Angepasster MustangCLI Befehl basierend auf der --help Ausgabe
-        mustang_cmd = [
-            'java', '-jar', MUSTANG_CLI_JAR,
-            '--action', 'combine',           # Korrekte Aktion
-            '--source', temp_pdf_path,       # Eingabe-PDF
-            '--source-xml', temp_xml_path,   # Eingabe-XML
-            '--out', temp_output_pdf_path,   # Ausgabe-PDF
-            '--format', zugferd_format_param,# z.B. 'zf' oder 'fx'
-            '--version', zugferd_version_param, # z.B. '2'
-            '--profile', zugferd_profile_param,  # z.B. 'XRechnung'
-            # Avoid interactive prompts: pass a single empty attachment filename and disable prompting.
-            '--attachments', '',
-            '--no-additional-attachments'
-        ]
-
-        app.logger.info(f"MustangCLI /embed_xml: Führe Befehl aus: {' '.join(mustang_cmd)}")
+    def __init__(self, tool: str, retry_after: int, reason: str):
+        super().__init__(f"{tool} ist ausgelastet ({reason}), bitte später erneut versuchen.")
+        self.tool = tool
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def get_response(self, environ=None, scope=None):
+        resp = jsonify({
+            "ok": False,
+            "error": "overloaded",
+            "tool": self.tool,
+            "reason": self.reason,
+            "message": self.description,
+            "retry_after": self.retry_after
+        })
+        resp.status_code = self.code
+        resp.headers['Retry-After'] = str(self.retry_after)
+        return resp
+
+class ToolGate:
+    """Concurrency limit + bounded wait queue for one backend tool, sharing the controller's memory budget."""
+
+    def __init__(self, controller: "AdmissionController", name: str, max_concurrent: int,
+                 max_queue: int, base_mb: int, mb_per_input_mb: float):
+        self.controller = controller
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.base_bytes = base_mb * 1024 * 1024
+        self.bytes_per_input_byte = mb_per_input_mb
+        self.running = 0
+        self.queued = 0
+        self.reserved_bytes = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._avg_run_seconds = 5.0
+
+    def estimate_bytes(self, input_bytes: int) -> int:
+        return int(self.base_bytes + input_bytes * self.bytes_per_input_byte)
+
+    def _can_run(self, estimate: int) -> bool:
+        if self.running >= self.max_concurrent:
+            return False
+        # An oversized job may still run once nothing else holds memory
+        c = self.controller
+        return c.reserved_bytes + estimate <= c.budget_bytes or c.reserved_bytes == 0
+
+    def _retry_after(self) -> int:
+        backlog = self.queued + self.running + 1
+        return max(1, int(self._avg_run_seconds * backlog / self.max_concurrent + 0.5))
+
+    def _reject(self, reason: str):
+        self.rejected_total += 1
+        app.logger.warning(f"Admission {self.name}: abgelehnt ({reason}, running={self.running}, queued={self.queued})")
+        raise ToolOverloaded(self.name, self._retry_after(), reason)
+
+    @contextlib.contextmanager
+    def admit(self, input_bytes: int = 0):
+        """
+        Blocks until the tool may run. Request threads wait at most ADMISSION_QUEUE_TIMEOUT in a
+        queue of max_queue entries; background work (batch, jobs) waits without limits.
+        """
+        estimate = self.estimate_bytes(input_bytes)
+        background = getattr(_admission_local, 'background', False)
+        cond = self.controller.cond
+        started = time.monotonic()
+        with cond:
+            if not self._can_run(estimate):
+                if not background and self.queued >= self.max_queue:
+                    self._reject('queue_full')
+                self.queued += 1
+                try:
+                    deadline = None if background else started + ADMISSION_QUEUE_TIMEOUT
+                    while not self._can_run(estimate):
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self._reject('queue_timeout')
+                        cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self._take(estimate, started)
+        run_started = time.monotonic()
         try:
-            result = subprocess.run(mustang_cmd, check=True, timeout=120, capture_output=True, text=True)
-            app.logger.info(f"MustangCLI /embed_xml STDOUT: {result.stdout}")
-            if result.stderr:
-                 app.logger.info(f"MustangCLI /embed_xml STDERR: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            error_message = f"MustangCLI Fehler (Code {e.returncode}) beim Einbetten: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
-            app.logger.error(error_message)
-            abort(500, error_message)
-        except subprocess.TimeoutExpired as e:
-            error_message = f"MustangCLI Timeout beim Einbetten: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
-            app.logger.error(error_message)
-            abort(500, error_message)
-        
-        if not os.path.exists(temp_output_pdf_path) or os.path.getsize(temp_output_pdf_path) == 0:
-             app.logger.error("MustangCLI /embed_xml: Ausgabedatei wurde nicht erstellt oder ist leer.")
-             abort(500, "MustangCLI Ausgabedatei mit eingebettetem XML wurde nicht erstellt oder ist leer.")
-            
-        download_filename = f"zugferd_fmt-{zugferd_format_param}_v{zugferd_version_param}_{zugferd_profile_param}.pdf"
-        return send_file(temp_output_pdf_path, mimetype='application/pdf', as_attachment=True, download_name=download_filename)
+            yield
+        finally:
+            self._release(estimate, run_started)
 
-@app.route('/validate', methods=['POST'])
-def validate():
-    """
-    Erwartet:
-      - multipart/form-data mit Feldname 'file' (empfohlen), ODER
-      - application/pdf   (Rohdaten im Body), ODER
-      - application/xml   (Rohdaten im Body)
+    def _take(self, estimate: int, started: float):
+        """Books an admitted job (caller holds the controller lock)."""
+        waited = time.monotonic() - started
+        self.running += 1
+        self.reserved_bytes += estimate
+        self.controller.reserved_bytes += estimate
+        self.admitted_total += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        ADMISSION_WAIT.labels(self.name).observe(waited)
+        _add_timing('queue', waited)
 
-    Ruft Mustang-CLI 'validate <datei>' auf und liefert stdout/stderr/returncode zurück.
-    """
-    ctype = request.content_type or ''
-    uploaded_bytes = None
-    filename = 'invoice'
+    def _release(self, estimate: int, run_started: float):
+        with self.controller.cond:
+            self.running -= 1
+            self.reserved_bytes -= estimate
+            self.controller.reserved_bytes -= estimate
+            self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * (time.monotonic() - run_started)
+            self.controller.notify()
 
-    if ctype.startswith('multipart/form-data'):
-        if 'file' not in request.files:
-            app.logger.error("MustangCLI /validate: Kein File-Feld 'file'.")
-            abort(400, "Kein File-Feld 'file' gefunden")
-        f = request.files['file']
-        uploaded_bytes = f.read()
-        filename = f.filename or filename
-    elif ctype in ('application/pdf', 'application/xml', 'text/xml'):
-        uploaded_bytes = request.get_data()
-        # Dateiendung für temp-Datei ableiten
-        if ctype == 'application/pdf':
-            filename += '.pdf'
-        else:
-            filename += '.xml'
-    else:
-        app.logger.error(f"MustangCLI /validate: Unsupported Content-Type: {ctype}")
-        abort(400, f"Content-Type muss multipart/form-data, application/pdf oder application/xml sein (war: '{ctype}').")
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "reserved_mb": round(self.reserved_bytes / (1024 * 1024), 1),
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.admitted_total, 3) if self.admitted_total else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "avg_run_seconds": round(self._avg_run_seconds, 3),
+        }
 
-    if not uploaded_bytes:
-        abort(400, "Upload ist leer.")
+class AdmissionController:
+    def __init__(self, budget_mb: int):
+        self.cond = threading.Condition()
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.reserved_bytes = 0
+        self.gates: dict[str, ToolGate] = {}
+        for tool, (concurrent, queued, base_mb, factor) in _ADMISSION_DEFAULTS.items():
+            env = f"ADMISSION_{tool.upper()}_"
+            self.gates[tool] = ToolGate(
+                self, tool,
+                int(os.environ.get(env + 'CONCURRENCY', concurrent)),
+                int(os.environ.get(env + 'QUEUE', queued)),
+                int(os.environ.get(env + 'BASE_MB', base_mb)),
+                float(os.environ.get(env + 'MB_PER_MB', factor)),
+            )
+
+    def gate(self, tool: str) -> ToolGate:
+        return self.gates[tool]
+
+    def notify(self):
+        """Wakes all waiting threads (caller holds cond); each re-checks its gate."""
+        self.cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "memory_budget_mb": self.budget_bytes // (1024 * 1024),
+                "memory_reserved_mb": round(self.reserved_bytes / (1024 * 1024), 1),
+                "tools": {name: gate.stats() for name, gate in self.gates.items()},
+            }
+
+_admission = AdmissionController(ADMISSION_MEMORY_BUDGET_MB)
+
+@contextlib.contextmanager
+def _background_admission():
+    """Marks the current thread as background work (batch/jobs): waits for tools instead of shedding."""
+    previous = getattr(_admission_local, 'background', False)
+    _admission_local.background = True
+    try:
+        yield
+    finally:
+        _admission_local.background = previous
+
+@app.route('/admission', methods=['GET'])
+def admission_status():
+    """Current occupancy, queue depth and queue wait times per tool."""
+    workers = {tool: pool.stats() for tool, pool in (('mustang', _mustang_pool), ('fast', _fast_pool))
+               if pool is not None}
+    return jsonify({"ok": True, **_admission.stats(), "workspaces": _workspaces.stats(), "workers": workers}), 200
 
-    with tempfile.TemporaryDirectory() as tmp:
-        # sinnvolle Endung, falls nicht vorhanden
-        if not (filename.endswith('.pdf') or filename.endswith('.xml')):
-            # einfacher Heuristik-Fallback
-            filename += '.pdf' if uploaded_bytes[:5] == b'%PDF-' else '.xml'
+# ───── Workspaces (Arbeitsverzeichnisse auf tmpfs, Spill auf Platte) ─────
+# /dev/shm is a tmpfs in every Docker container (size via `shm_size` in docker-compose.yml)
+WORKSPACE_RAM_DIR = os.environ.get('WORKSPACE_RAM_DIR', '/dev/shm/mustang-api')
+WORKSPACE_DISK_DIR = os.environ.get('WORKSPACE_DISK_DIR', os.path.join(tempfile.gettempdir(), 'mustang-api'))
+WORKSPACE_RAM_QUOTA_MB = int(os.environ.get('WORKSPACE_RAM_QUOTA_MB', '512'))
+WORKSPACE_SPILL_MB = int(os.environ.get('WORKSPACE_SPILL_MB', '64'))
+# Bytes on the workspace per upload byte: input + Ghostscript/Mustang output + tool spool files
+WORKSPACE_SIZE_FACTOR = 3
 
-        input_path = os.path.join(tmp, filename)
-        with open(input_path, 'wb') as f:   
-            f.write(uploaded_bytes)
+class Workspace:
+    """One per-request/job directory; release() removes it and returns its RAM reservation."""
 
-        cmd = [
-            "java", "-jar", MUSTANG_CLI_JAR,
-            "--action", "validate",
-            "--source", input_path,
-            "--no-notices"
-        ]
-        app.logger.info(f"MustangCLI /validate: Führe Befehl aus: {' '.join(cmd)}")
+    def __init__(self, manager: "WorkspaceManager", path: str, tier: str, reserved: int):
+        self.manager = manager
+        self.path = path
+        self.tier = tier
+        self.reserved = reserved
+        self._released = False
 
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._release(self)
+
+class WorkspaceManager:
+    """
+    Allocates workspaces on the RAM mount while the quota and the mount's free space allow it,
+    otherwise (large or unknown size) on disk. Directories are named ws-<pid>-*, so sweep_orphans()
+    can remove what a crashed or killed process left behind.
+    """
+
+    def __init__(self, ram_dir: str, disk_dir: str, ram_quota_bytes: int, spill_bytes: int):
+        self.ram_dir = ram_dir if ram_quota_bytes > 0 and self._prepare(ram_dir) else None
+        self.disk_dir = disk_dir if self._prepare(disk_dir) else tempfile.gettempdir()
+        self.ram_quota_bytes = ram_quota_bytes
+        self.spill_bytes = spill_bytes
+        self._lock = threading.Lock()
+        self.ram_reserved_bytes = 0
+        self.active = {'ram': 0, 'disk': 0}
+        self.allocated_total = {'ram': 0, 'disk': 0}
+
+    @staticmethod
+    def _prepare(path: str) -> bool:
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        except subprocess.TimeoutExpired as e:
-            msg = f"MustangCLI /validate Timeout: {e}"
-            app.logger.error(msg)
-            return jsonify({"ok": False, "error": "timeout", "message": msg}), 504
-        except FileNotFoundError:
-            # Java nicht im PATH
-            msg = "Java nicht gefunden. Ist openjdk-17-jre-headless installiert und 'java' im PATH?"
-            app.logger.error(f"MustangCLI /validate: {msg}")
-            return jsonify({"ok": False, "error": "java_not_found", "message": msg}), 500
-
-        stdout = (result.stdout or "")
-        stderr = (result.stderr or "")
-
-        xml_report = _extract_validation_xml(stdout)
-        if not xml_report:
-            # Fallback: sometimes the report might be on stderr (rare)
-            xml_report = _extract_validation_xml(stderr)
-
-        if not xml_report:
-            msg = "Konnte keinen Mustang-XML-Validierungsreport aus stdout/stderr extrahieren."
-            app.logger.error(f"MustangCLI /validate: {msg}")
-            return jsonify({
-                "ok": False,
-                "error": "no_xml_report",
-                "message": msg,
-                "returncode": result.returncode,
-                "stdout_tail": _tail(stdout),
-                "stderr_tail": _tail(stderr)
-            }), 500
+            os.makedirs(path, exist_ok=True)
+            return os.access(path, os.W_OK)
+        except OSError:
+            return False
 
+    def allocate(self, expected_bytes: Optional[int]) -> Workspace:
+        """expected_bytes: upload size if known (Content-Length); unknown sizes go to disk."""
+        tier, reserved = 'disk', 0
+        if self.ram_dir is not None and expected_bytes is not None and expected_bytes <= self.spill_bytes:
+            estimate = max(expected_bytes, _SPOOL_CHUNK) * WORKSPACE_SIZE_FACTOR
+            with self._lock:
+                if (self.ram_reserved_bytes + estimate <= self.ram_quota_bytes
+                        and self._ram_free() - self.ram_reserved_bytes >= estimate):
+                    self.ram_reserved_bytes += estimate
+                    tier, reserved = 'ram', estimate
+        base = self.ram_dir if tier == 'ram' else self.disk_dir
         try:
-            report = _parse_mustang_validation_report(xml_report)
-        except ET.ParseError as e:
-            msg = f"XML-Report konnte nicht geparst werden: {e}"
-            app.logger.error(f"MustangCLI /validate: {msg}")
-            return jsonify({
-                "ok": False,
-                "error": "xml_parse_error",
-                "message": msg,
-                "returncode": result.returncode,
-                "stdout_tail": _tail(stdout),
-                "stderr_tail": _tail(stderr)
-            }), 500
-
-        status = (report.get("status") or "").lower()
-        is_valid = (status == "valid")
-
-        return jsonify({
-            "ok": is_valid,
-            "status": report.get("status"),
-            "returncode": result.returncode,
-            "report": {
-                "filename": report.get("filename"),
-                "datetime": report.get("datetime")
-            },
-            "findings": report.get("findings", [])
-        }), (200 if is_valid else 422)
+            path = tempfile.mkdtemp(prefix=f'ws-{os.getpid()}-', dir=base)
+        except OSError:
+            with self._lock:
+                self.ram_reserved_bytes -= reserved
+            raise
+        with self._lock:
+            self.active[tier] += 1
+            self.allocated_total[tier] += 1
+        return Workspace(self, path, tier, reserved)
 
-@app.route('/validate_pdfa', methods=['POST'])
-def validate_pdfa():
+    def _ram_free(self) -> int:
+        try:
+            return shutil.disk_usage(self.ram_dir).free
+        except OSError:
+            return 0
+
+    def _release(self, ws: Workspace):
+        with self._lock:
+            self.ram_reserved_bytes -= ws.reserved
+            self.active[ws.tier] -= 1
+
+    @contextlib.contextmanager
+    def workspace(self, expected_bytes: Optional[int]):
+        """Workspace directory for the block; removed on exit, also on timeouts and aborts."""
+        ws = self.allocate(expected_bytes)
+        try:
+            yield ws.path
+        finally:
+            ws.release()
+
+    def sweep_orphans(self) -> int:
+        """Removes ws-<pid>-* directories of processes that are gone (run once at startup)."""
+        removed = 0
+        for base in {d for d in (self.ram_dir, self.disk_dir) if d}:
+            for name in os.listdir(base):
+                parts = name.split('-')
+                if len(parts) < 3 or parts[0] != 'ws' or not parts[1].isdigit():
+                    continue
+                if int(parts[1]) != os.getpid() and _pid_alive(int(parts[1])):
+                    continue
+                shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ram_dir": self.ram_dir,
+                "disk_dir": self.disk_dir,
+                "ram_quota_bytes": self.ram_quota_bytes,
+                "ram_reserved_bytes": self.ram_reserved_bytes,
+                "spill_bytes": self.spill_bytes,
+                "active": dict(self.active),
+                "allocated_total": dict(self.allocated_total),
+            }
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+_workspaces = WorkspaceManager(WORKSPACE_RAM_DIR, WORKSPACE_DISK_DIR,
+                               WORKSPACE_RAM_QUOTA_MB * 1024 * 1024, WORKSPACE_SPILL_MB * 1024 * 1024)
+_orphans = _workspaces.sweep_orphans()
+if _orphans:
+    app.logger.info(f"Workspaces: {_orphans} verwaiste Arbeitsverzeichnisse entfernt")
+if _workspaces.ram_dir is None:
+    app.logger.warning(f"Workspaces: {WORKSPACE_RAM_DIR} nicht nutzbar, alle Arbeitsverzeichnisse auf Platte")
+
+def _request_workspace():
+    """Workspace sized by the request's Content-Length (chunked uploads → disk)."""
+    return _workspaces.workspace(request.content_length)
+
+# ───── Prozess-Ausführung (Ausgabe in Spool-Dateien, begrenzte Tails, Kill der Prozessgruppe) ─────
+# stdout/stderr of every tool go straight into files of a spool workspace, never through Python pipes.
+# Results keep only the tails (logs, error messages); parsers read the complete output from the files.
+TOOL_OUTPUT_TAIL_BYTES = int(os.environ.get('TOOL_OUTPUT_TAIL_BYTES', '8192'))
+# INFO log lines carry at most this many characters of a tool's output
+TOOL_LOG_TAIL_CHARS = int(os.environ.get('TOOL_LOG_TAIL_CHARS', '2000'))
+
+def _spool_paths(spool: Workspace) -> tuple[str, str]:
+    return os.path.join(spool.path, 'stdout.txt'), os.path.join(spool.path, 'stderr.txt')
+
+def _allocate_spool() -> Workspace:
+    # Output size is unknown, so spool files go to disk (page cache): a chatty tool cannot fill the RAM mount
+    return _workspaces.allocate(None)
+
+def _read_tail(path: str, max_bytes: int = TOOL_OUTPUT_TAIL_BYTES) -> str:
+    """Last max_bytes of a spool file, decoded (a multi-byte character cut at the start becomes U+FFFD)."""
+    try:
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - max_bytes))
+            data = f.read()
+    except OSError:
+        return ""
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n')
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+class ToolResult(subprocess.CompletedProcess):
+    """
+    CompletedProcess whose stdout/stderr hold only the last TOOL_OUTPUT_TAIL_BYTES of the output. The
+    complete output stays readable via open_stdout()/open_stderr() until release() (or garbage
+    collection) removes the spool workspace. cpu_seconds/max_rss_bytes come from wait4(); warm pool
+    workers run many jobs in one process and report None.
     """
-    PDF/A validation using veraPDF CLI.
 
-    Accepts:
-      - multipart/form-data with field 'file'
-      - application/pdf raw body
+    def __init__(self, args, returncode: int, spool: Workspace, cpu_seconds: Optional[float] = None,
+                 max_rss_bytes: Optional[int] = None):
+        self.stdout_path, self.stderr_path = _spool_paths(spool)
+        super().__init__(args, returncode, _read_tail(self.stdout_path), _read_tail(self.stderr_path))
+        self.stdout_bytes = _file_size(self.stdout_path)
+        self.stderr_bytes = _file_size(self.stderr_path)
+        self.cpu_seconds = cpu_seconds
+        self.max_rss_bytes = max_rss_bytes
+        self._finalizer = weakref.finalize(self, spool.release)
 
-    Returns:
-      - 200 if PDF/A conform
-      - 422 if not conform
-      - full veraPDF report parsed as JSON (format=json)
+    def open_stdout(self):
+        return open(self.stdout_path, 'r', encoding='utf-8', errors='replace')
+
+    def open_stderr(self):
+        return open(self.stderr_path, 'r', encoding='utf-8', errors='replace')
+
+    def release(self):
+        self._finalizer()
+
+def _log_tool_output(label: str, result: subprocess.CompletedProcess):
+    """INFO log of a run's output tails (never the complete output)."""
+    for stream, text in (('STDOUT', result.stdout), ('STDERR', result.stderr)):
+        if text:
+            app.logger.info(f"{label} {stream}: {_tail(text, TOOL_LOG_TAIL_CHARS)}")
+
+def _spawn_spooled(cmd: list[str], spool: Workspace, env: Optional[dict]) -> subprocess.Popen:
+    """Starts cmd in its own session (= process group) with stdout/stderr in the spool files."""
+    out_path, err_path = _spool_paths(spool)
+    with open(out_path, 'wb') as out, open(err_path, 'wb') as err:
+        return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=out, stderr=err, env=env,
+                                start_new_session=True)
+
+def _kill_process_group(proc: subprocess.Popen):
+    # JVM launchers and gs helpers share the group, so nothing survives the timeout
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _reap(proc: subprocess.Popen, flags: int = 0) -> Optional[resource.struct_rusage]:
+    """wait4() instead of Popen.wait(): the exit status comes with the child's CPU time and peak RSS."""
+    pid, status, usage = os.wait4(proc.pid, flags)
+    if pid == 0:
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+def _wait_process(proc: subprocess.Popen, timeout: float) -> resource.struct_rusage:
+    """Waits for proc's exit (a pidfd wakes up exactly at exit; polling where pidfds are missing), then reaps it."""
+    deadline = time.monotonic() + timeout
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        if pidfd is not None:
+            # poll() rather than select(): pidfds above FD_SETSIZE are normal under load
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            if not poller.poll(max(0, timeout) * 1000):
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            return _reap(proc)
+        # Same backoff as Popen.wait(timeout): 0.5 ms doubling up to 50 ms
+        delay = 0.0005
+        while (usage := _reap(proc, os.WNOHANG)) is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+        return usage
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+async def _await_process(proc: subprocess.Popen) -> resource.struct_rusage:
+    """_wait_process() on the event loop (pidfd readable at exit, polling where pidfds are missing), then reaps."""
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        delay = 0.0005
+        while (usage := _reap(proc, os.WNOHANG)) is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return usage
+    loop = asyncio.get_running_loop()
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    return _reap(proc)
+
+def _timeout_error(cmd: list[str], timeout: float, spool: Workspace) -> subprocess.TimeoutExpired:
+    out_path, err_path = _spool_paths(spool)
+    return subprocess.TimeoutExpired(cmd, timeout, output=_read_tail(out_path), stderr=_read_tail(err_path))
+
+def _tool_result(cmd: list[str], proc: subprocess.Popen, spool: Workspace,
+                 usage: resource.struct_rusage) -> ToolResult:
+    # ru_maxrss is in KiB on Linux
+    return ToolResult(cmd, proc.returncode, spool, usage.ru_utime + usage.ru_stime, usage.ru_maxrss * 1024)
+
+def _run_process(cmd: list[str], timeout: float, env: Optional[dict] = None) -> ToolResult:
     """
-    ctype = request.content_type or ''
-    pdf_data = None
+    Runs cmd with its output spooled to files (Server-Timing 'spawn'/'tool'). On timeout the whole
+    process group is killed and TimeoutExpired carries the output tails; OSError if cmd cannot start.
+    """
+    spool = _allocate_spool()
+    try:
+        with _timed('spawn'):
+            proc = _spawn_spooled(cmd, spool, env)
+        with _timed('tool'):
+            try:
+                usage = _wait_process(proc, timeout)
+            except subprocess.TimeoutExpired:
+                _kill_process_group(proc)
+                _reap(proc)
+                raise _timeout_error(cmd, timeout, spool)
+    except BaseException:
+        spool.release()
+        raise
+    return _tool_result(cmd, proc, spool, usage)
 
-    if ctype.startswith('multipart/form-data'):
-        if 'file' not in request.files:
-            abort(400, "Kein File-Feld 'file' gefunden")
-        pdf_data = request.files['file'].read()
-    elif ctype == 'application/pdf':
-        pdf_data = request.get_data()
-    else:
-        abort(400, f"Content-Type muss application/pdf oder multipart/form-data sein (war: '{ctype}')")
+async def _arun_process(cmd: list[str], timeout: float, env: Optional[dict] = None) -> ToolResult:
+    """_run_process() on the event loop; cancelling the task kills the process group as well."""
+    spool = _allocate_spool()
+    try:
+        with _timed('spawn'):
+            proc = _spawn_spooled(cmd, spool, env)
+        with _timed('tool'):
+            try:
+                usage = await asyncio.wait_for(_await_process(proc), timeout)
+            except asyncio.TimeoutError:
+                _kill_process_group(proc)
+                await _await_process(proc)
+                raise _timeout_error(cmd, timeout, spool)
+            except asyncio.CancelledError:
+                _kill_process_group(proc)
+                # Reaped off the loop: the cancellation must not wait for the killed process
+                asyncio.get_running_loop().run_in_executor(None, _reap, proc)
+                raise
+    except BaseException:
+        spool.release()
+        raise
+    return _tool_result(cmd, proc, spool, usage)
 
-    if not pdf_data:
-        abort(400, "Upload ist leer.")
+def _record_tool_run(tool: str, result: ToolResult, check: bool) -> ToolResult:
+    TOOL_EXIT_CODES.labels(tool, str(result.returncode)).inc()
+    TOOL_CPU_SECONDS.labels(tool).observe(result.cpu_seconds)
+    TOOL_MAX_RSS.labels(tool).observe(result.max_rss_bytes)
+    TOOL_OUTPUT_SIZE.labels(tool, 'stdout').observe(result.stdout_bytes)
+    TOOL_OUTPUT_SIZE.labels(tool, 'stderr').observe(result.stderr_bytes)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result
 
-    with tempfile.TemporaryDirectory() as tmp:
-        input_path = os.path.join(tmp, 'input.pdf')
-        with open(input_path, 'wb') as f:
-            f.write(pdf_data)
+def _run_tool(tool: str, cmd: list[str], timeout: float, check: bool = False,
+              env: Optional[dict] = None, owned: bool = True) -> ToolResult:
+    """
+    _run_process() with tool metrics (duration incl. spawn, exit code, CPU time, peak RSS, output size).
+    check=True raises CalledProcessError like subprocess.run. Inside a request served via ASGI the
+    process is awaited on the event loop (_arun_tool) and a client disconnect kills it; owned=False
+    marks runs shared with other requests, which one client's disconnect must not cancel.
+    """
+    served = _asgi_request.get()
+    if served is not None:
+        return served.run(_arun_tool(tool, cmd, timeout, check, env), cancel_on_disconnect=owned)
+    started = time.perf_counter()
+    try:
+        result = _run_process(cmd, timeout, env)
+    except subprocess.TimeoutExpired:
+        TOOL_EXIT_CODES.labels(tool, 'timeout').inc()
+        raise
+    finally:
+        TOOL_DURATION.labels(tool).observe(time.perf_counter() - started)
+    return _record_tool_run(tool, result, check)
 
-        # veraPDF JSON report to stdout
-        cmd = [
-            "verapdf",
-            "--format", "json",
-            input_path
-        ]
-        app.logger.info(f"veraPDF /validate_pdfa: Führe Befehl aus: {' '.join(cmd)}")
+async def _arun_tool(tool: str, cmd: list[str], timeout: float, check: bool = False,
+                     env: Optional[dict] = None) -> ToolResult:
+    """_run_tool() on the event loop (same metrics, same errors)."""
+    started = time.perf_counter()
+    try:
+        result = await _arun_process(cmd, timeout, env)
+    except subprocess.TimeoutExpired:
+        TOOL_EXIT_CODES.labels(tool, 'timeout').inc()
+        raise
+    finally:
+        TOOL_DURATION.labels(tool).observe(time.perf_counter() - started)
+    return _record_tool_run(tool, result, check)
+
+# ───── Worker-Pools (warme Mustang-JVMs / Validator-Prozesse statt Prozess pro Request) ─────
+class WorkerError(Exception):
+    """Worker process died or broke the protocol; caller falls back to the one-shot command."""
+
+class _PooledWorker:
+    """
+    One long-lived worker process speaking the READY / JOB / RESULT line protocol
+    (worker/MustangWorker.java, worker/fast_validator.py).
+    """
 
+    def __init__(self, name: str, cmd: list[str], max_jobs: int, max_memory_bytes: int,
+                 startup_timeout: float = 60):
+        self.name = name
+        self.max_jobs = max_jobs
+        self.max_memory_bytes = max_memory_bytes
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         text=True, encoding='utf-8', bufsize=1)
+        except OSError as e:
+            raise WorkerError(f"Worker konnte nicht gestartet werden: {e}") from e
+        self.jobs = 0
+        # Live JVM heap after the last GC (Mustang) or peak RSS (fast validator)
+        self.memory_bytes = 0
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=180)
+            self._await_line('READY', startup_timeout)
         except subprocess.TimeoutExpired as e:
-            msg = f"veraPDF Timeout: {e}"
-            app.logger.error(msg)
-            return jsonify({"ok": False, "error": "timeout", "message": msg}), 504
-        except FileNotFoundError:
-            msg = "veraPDF CLI nicht gefunden. Ist 'verapdf' im Container installiert?"
-            app.logger.error(msg)
-            return jsonify({"ok": False, "error": "verapdf_not_found", "message": msg}), 500
-
-        stdout = (result.stdout or "").strip()
-        stderr = (result.stderr or "").strip()
-
-        report_json = _try_parse_json(stdout)
-        if report_json is None:
-            # Some versions might write to stderr; try that as fallback
-            report_json = _try_parse_json(stderr)
-
-        if report_json is None:
-            msg = "veraPDF Report konnte nicht als JSON geparst werden."
-            app.logger.error(f"veraPDF /validate_pdfa: {msg}")
-            return jsonify({
-                "ok": False,
-                "error": "report_parse_error",
-                "message": msg,
-                "returncode": result.returncode,
-                "stdout_tail": _tail(stdout),
-                "stderr_tail": _tail(stderr)
-            }), 500
-
-        # Determine overall validity: be defensive with schema differences
-        ok = False
+            raise WorkerError(f"Worker meldet sich nicht (READY): {e}") from e
+        app.logger.info(f"{self.name}-Worker gestartet (pid {self.proc.pid})")
+
+    def _read_stdout(self):
+        for line in self.proc.stdout:
+            self._lines.put(line.rstrip('\n'))
+        self._lines.put(None)
+
+    def _await_line(self, prefix: str, timeout: float) -> str:
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                self.kill()
+                raise subprocess.TimeoutExpired(self.proc.args, timeout)
+            if line is None:
+                self.kill()
+                raise WorkerError(f"Worker beendet (Code {self.proc.poll()})")
+            if line.startswith(prefix):
+                return line
+            app.logger.warning(f"{self.name}-Worker {self.proc.pid}: unerwartete Ausgabe: {line}")
+
+    def run(self, args: list[str], timeout: float) -> ToolResult:
+        spool = _allocate_spool()
+        try:
+            out_path, err_path = _spool_paths(spool)
+            frame = ['JOB', out_path, err_path, str(len(args))]
+            frame += [urllib.parse.quote(a, safe='') for a in args]
+            try:
+                self.proc.stdin.write('\n'.join(frame) + '\n')
+                self.proc.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self.kill()
+                raise WorkerError(f"Worker nicht erreichbar: {e}") from e
+
+            line = self._await_line('RESULT ', timeout)
+            try:
+                _, code, memory = line.split()
+                returncode, self.memory_bytes = int(code) & 0xFF, int(memory)
+            except ValueError as e:
+                self.kill()
+                raise WorkerError(f"Ungültige Worker-Antwort: {line!r}") from e
+            self.jobs += 1
+        except BaseException:
+            spool.release()
+            raise
+        return ToolResult(args, returncode, spool)
+
+    def worn_out(self) -> bool:
+        return (self.jobs >= self.max_jobs
+                or self.memory_bytes > self.max_memory_bytes
+                or self.proc.poll() is not None)
+
+    def close(self):
         try:
-            report = report_json.get("report", report_json)
-            jobs = report.get("jobs") or []
-            if jobs and isinstance(jobs, list):
-                vr = jobs[0].get("validationResult")
-                if isinstance(vr, dict) and "isCompliant" in vr:
-                    ok = bool(vr.get("isCompliant"))
-                else:
-                    # If validationResult is absent, fall back to batch summary counts
-                    vs = (report.get("batchSummary") or {}).get("validationSummary") or {}
-                    total = vs.get("totalJobCount")
-                    compliant = vs.get("compliantPdfaCount")
-                    failed = vs.get("failedJobCount")
-                    parse_failed = (report.get("batchSummary") or {}).get("failedParsingJobs")
-                    if total == 1:
-                        ok = (compliant == 1) and (failed in (0, None)) and (parse_failed in (0, None))
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
         except Exception:
-            ok = False
+            self.kill()
 
-        return jsonify({
-            "ok": ok,
-            "returncode": result.returncode,
-            "verapdf": report_json
-        }), (200 if ok else 422)
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+class WorkerPool:
+    """
+    Keeps up to `size` warm workers. A worker is recycled after max_jobs jobs or above the memory
+    limit; crashed workers are discarded.
+    """
+
+    # After a failed worker start, use the one-shot command for a while instead of retrying per request
+    SPAWN_BACKOFF_SECONDS = 30
+
+    def __init__(self, name: str, size: int, factory, acquire_timeout: float):
+        self.name = name
+        self.size = size
+        self._factory = factory
+        self._acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: "queue.LifoQueue[_PooledWorker]" = queue.LifoQueue()
+        self._spawn_blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._workers: dict[int, _PooledWorker] = {}
+        self._busy: set[int] = set()
+        self.recycled_total = 0
+
+    def run(self, args: list[str], timeout: float) -> Optional[subprocess.CompletedProcess]:
+        """Returns None if no worker slot became free within the acquire timeout."""
+        if not self._slots.acquire(timeout=self._acquire_timeout):
+            return None
+        worker = None
+        try:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                if time.monotonic() < self._spawn_blocked_until:
+                    return None
+                try:
+                    worker = self._factory()
+                except WorkerError:
+                    self._spawn_blocked_until = time.monotonic() + self.SPAWN_BACKOFF_SECONDS
+                    raise
+                with self._lock:
+                    self._workers[worker.proc.pid] = worker
+            with self._lock:
+                self._busy.add(worker.proc.pid)
+            result = worker.run(args, timeout)
+            if worker.worn_out():
+                app.logger.info(f"{self.name}-Worker {worker.proc.pid} wird recycelt (jobs={worker.jobs}, "
+                                f"mem={worker.memory_bytes // (1024 * 1024)} MB)")
+                self._forget(worker)
+                worker.close()
+            else:
+                with self._lock:
+                    self._busy.discard(worker.proc.pid)
+                self._idle.put(worker)
+            worker = None
+            return result
+        finally:
+            if worker is not None:
+                self._forget(worker)
+                worker.kill()
+            self._slots.release()
+
+    def prewarm(self, count: int):
+        """Starts up to `count` idle workers in the background (workers with an expensive start)."""
+        def spawn():
+            for _ in range(count):
+                # A slot keeps requests from spawning concurrently; stop once the pool is full
+                if not self._slots.acquire(blocking=False):
+                    return
+                try:
+                    with self._lock:
+                        if len(self._workers) >= self.size:
+                            return
+                    worker = self._factory()
+                    with self._lock:
+                        self._workers[worker.proc.pid] = worker
+                    self._idle.put(worker)
+                except WorkerError as e:
+                    app.logger.warning(f"{self.name}-Worker: Vorstart fehlgeschlagen: {e}")
+                    self._spawn_blocked_until = time.monotonic() + self.SPAWN_BACKOFF_SECONDS
+                    return
+                finally:
+                    self._slots.release()
+
+        threading.Thread(target=spawn, daemon=True, name=f'{self.name}-prewarm').start()
+
+    def _forget(self, worker: _PooledWorker):
+        with self._lock:
+            self._workers.pop(worker.proc.pid, None)
+            self._busy.discard(worker.proc.pid)
+            self.recycled_total += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            workers = [{"pid": pid, "jobs": w.jobs, "memory_mb": round(w.memory_bytes / (1024 * 1024), 1),
+                        "busy": pid in self._busy} for pid, w in self._workers.items()]
+            return {"size": self.size, "recycled_total": self.recycled_total, "workers": workers}
+
+_mustang_pool = WorkerPool(
+    'Mustang', MUSTANG_WORKER_POOL_SIZE,
+    lambda: _PooledWorker('Mustang', _mustang_worker_cmd(), MUSTANG_WORKER_MAX_JOBS,
+                          MUSTANG_WORKER_MAX_HEAP_MB * 1024 * 1024),
+    MUSTANG_WORKER_ACQUIRE_TIMEOUT
+) if MUSTANG_WORKER_POOL_SIZE > 0 else None
+
+def _run_on_pool(tool: str, pool: Optional[WorkerPool], worker_args: list[str], cmd: list[str],
+                 timeout: float) -> Optional[subprocess.CompletedProcess]:
+    """
+    Runs on a warm worker; None if the pool is disabled, busy or the worker failed (caller falls back
+    to the one-shot cmd). Records tool metrics; raises subprocess.TimeoutExpired with cmd.
+    """
+    if pool is None:
+        return None
+    started = time.perf_counter()
+    result = None
+    try:
+        with _timed('tool'):
+            result = pool.run(worker_args, timeout)
+    except WorkerError as e:
+        app.logger.warning(f"{pool.name}-Worker ausgefallen, Fallback auf Einzelprozess: {e}")
+    except subprocess.TimeoutExpired:
+        TOOL_EXIT_CODES.labels(tool, 'timeout').inc()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if result is not None:
+        TOOL_DURATION.labels(tool).observe(time.perf_counter() - started)
+        TOOL_EXIT_CODES.labels(tool, str(result.returncode)).inc()
+        result.args = cmd
+    return result
+
+def _run_mustang(args: list[str], timeout: int, check: bool = False,
+                 input_bytes: int = 0) -> subprocess.CompletedProcess:
+    """
+    Runs a Mustang-CLI action on a warm worker if available, otherwise (pool disabled,
+    busy or worker crashed) via the one-shot `java -jar` path.
+    Raises subprocess.TimeoutExpired / CalledProcessError (with check=True) like subprocess.run,
+    ToolOverloaded if admission control sheds the call.
+    """
+    cmd = _mustang_cli_cmd(args)
+    with _admission.gate('mustang').admit(input_bytes):
+        result = _run_on_pool('mustang', _mustang_pool, args, cmd, timeout)
+        if result is None:
+            result = _run_tool('mustang', cmd, timeout)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+    return result
+
+def _run_gs(gs_cmd: list[str], timeout: int, check: bool = False,
+            input_bytes: int = 0) -> subprocess.CompletedProcess:
+    """Runs `gs` under the Ghostscript admission gate; raises like _run_mustang."""
+    with _admission.gate('gs').admit(input_bytes):
+        result = _run_tool('gs', gs_cmd, timeout)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, gs_cmd, result.stdout, result.stderr)
+    return result
+
+# ───── Result-Cache für /validate und /validate_pdfa ─────
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '1024'))
+RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', '64'))
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', '86400'))
+# Optional disk tier, e.g. /work/cache (empty = memory only)
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', '')
+RESULT_CACHE_DISK_MAX_MB = int(os.environ.get('RESULT_CACHE_DISK_MAX_MB', '1024'))
+
+# Only tool verdicts are cached, never timeouts or internal errors
+_CACHEABLE_STATUS = (200, 422)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[tuple[int, bytes]] = None
+        self.error: Optional[BaseException] = None
+
+class ResultCache:
+    """
+    Content-addressed cache for serialized JSON results.
+
+    - Memory tier: LRU bounded by entry count and bytes
+    - Disk tier (optional): one file per key, bounded by bytes (oldest first)
+    - TTL on both tiers
+    - Single-flight: concurrent requests for the same key run the tool only once
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int,
+                 disk_dir: str = '', disk_max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, tuple[float, int, bytes]]" = OrderedDict()
+        self._mem_bytes = 0
+        self._inflight: dict[str, _Flight] = {}
+        self._disk_bytes = 0
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            except OSError as e:
+                app.logger.warning(f"Result-Cache: Disk-Tier {self.disk_dir} deaktiviert: {e}")
+                self.disk_dir = ''
+
+    def get_or_compute(self, key: str, compute) -> tuple[int, bytes, str]:
+        """
+        compute() -> (status, json_bytes). Returns (status, json_bytes, state) with
+        state HIT (cached), COALESCED (shared with a concurrent identical request) or MISS.
+        """
+        hit = self._get(key)
+        if hit is not None:
+            return hit[0], hit[1], 'HIT'
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                # Same input, same failure: waiters get the leader's exception instead of another run
+                raise flight.error
+            return flight.result[0], flight.result[1], 'COALESCED'
+
+        try:
+            status, payload = compute()
+            flight.result = (status, payload)
+            if status in _CACHEABLE_STATUS:
+                self._put(key, status, payload)
+            return status, payload, 'MISS'
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._mem),
+                "memory_bytes": self._mem_bytes,
+                "disk_bytes": self._disk_bytes,
+                "inflight": len(self._inflight),
+            }
+
+    def _get(self, key: str) -> Optional[tuple[int, bytes]]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                created, status, payload = entry
+                if now - created <= self.ttl:
+                    self._mem.move_to_end(key)
+                    return status, payload
+                self._evict_mem(key)
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            created = os.path.getmtime(path)
+            if now - created > self.ttl:
+                self._remove_disk(path)
+                return None
+            with open(path, 'rb') as f:
+                status = int(f.readline())
+                payload = f.read()
+        except (OSError, ValueError):
+            return None
+        self._put_mem(key, created, status, payload)
+        return status, payload
+
+    def _put(self, key: str, status: int, payload: bytes):
+        created = time.time()
+        self._put_mem(key, created, status, payload)
+        if self.disk_dir:
+            self._put_disk(key, status, payload)
+
+    def _put_mem(self, key: str, created: float, status: int, payload: bytes):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._mem:
+                self._evict_mem(key)
+            self._mem[key] = (created, status, payload)
+            self._mem_bytes += len(payload)
+            while self._mem and (len(self._mem) > self.max_entries or self._mem_bytes > self.max_bytes):
+                self._evict_mem(next(iter(self._mem)))
+
+    def _evict_mem(self, key: str):
+        _, _, payload = self._mem.pop(key)
+        self._mem_bytes -= len(payload)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_files(self):
+        for dirpath, _, files in os.walk(self.disk_dir):
+            for name in files:
+                # In-flight mkstemp files belong to a writer that is about to os.replace() them
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _put_disk(self, key: str, status: int, payload: bytes):
+        path = self._disk_path(key)
+        header = f"{status}\n".encode('ascii')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(payload)
+            # An expired entry or one written by another process is replaced, not added
+            replaced = _file_size(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            app.logger.warning(f"Result-Cache: Schreiben nach {path} fehlgeschlagen: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(header) + len(payload) - replaced
+            over_quota = self._disk_bytes > self.disk_max_bytes
+        if over_quota:
+            self._shrink_disk()
+
+    def _remove_disk(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _shrink_disk(self):
+        """Drops expired entries, then the oldest ones until the disk tier is at 90% of its quota."""
+        now = time.time()
+        files = sorted(self._disk_files(), key=lambda x: x[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_max_bytes * 0.9)
+        for path, size, mtime in files:
+            if total <= target and now - mtime <= self.ttl:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+_result_cache = ResultCache(
+    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_MB * 1024 * 1024, RESULT_CACHE_TTL,
+    RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_MB * 1024 * 1024
+) if RESULT_CACHE_ENABLED else None
+
+# Toolchain identities are part of the cache key so upgrades invalidate cached results. Only known
+# identities are kept; while one is unknown, its endpoints bypass the cache. The veraPDF version is
+# probed in the background (at startup, then at most every TOOLCHAIN_PROBE_RETRY_SECONDS), never on
+# the request path.
+TOOLCHAIN_PROBE_RETRY_SECONDS = int(os.environ.get('TOOLCHAIN_PROBE_RETRY_SECONDS', '60'))
+_toolchain_ids: dict[str, str] = {}
+_toolchain_probe_lock = threading.Lock()
+_toolchain_probe_next = 0.0
+
+def _probe_verapdf_identity():
+    version = _run_version_cmd(['verapdf', '--version'], timeout=30)
+    if version:
+        _toolchain_ids['verapdf'] = f"verapdf:{version}"
+    else:
+        app.logger.warning("Result-Cache: veraPDF-Version unbekannt, validate_pdfa wird vorerst nicht gecacht")
+
+def _start_verapdf_probe():
+    """Starts a background probe unless one ran less than TOOLCHAIN_PROBE_RETRY_SECONDS ago."""
+    global _toolchain_probe_next
+    with _toolchain_probe_lock:
+        now = time.monotonic()
+        if now < _toolchain_probe_next:
+            return
+        _toolchain_probe_next = now + TOOLCHAIN_PROBE_RETRY_SECONDS
+    threading.Thread(target=_probe_verapdf_identity, daemon=True, name='toolchain-probe').start()
+
+def _toolchain_identity(endpoint: str) -> Optional[str]:
+    """Tool version that produced a result, or None while it is unknown."""
+    if endpoint == 'validate_pdfa':
+        identity = _toolchain_ids.get('verapdf')
+        if identity is None:
+            _start_verapdf_probe()
+        return identity
+    identity = _toolchain_ids.get('mustang')
+    if identity is None:
+        # A file read, cheap enough to retry on every request until the tag shows up
+        tag = _safe_read_text(MUSTANG_TAG_PATH)
+        if tag is None:
+            return None
+        identity = _toolchain_ids['mustang'] = f"mustang:{tag}"
+    return identity
+
+if _result_cache is not None:
+    _start_verapdf_probe()
+
+def _cached_result(endpoint: str, content_sha256: str, key_parts: list[str], compute) -> tuple[int, bytes, str]:
+    """
+    compute() -> (dict, status). Returns (status, json_bytes, cache_state), served from the
+    cache when possible (keyed on the upload's SHA-256 hex digest, endpoint, toolchain identity and key_parts).
+    """
+    def compute_serialized() -> tuple[int, bytes]:
+        body, status = compute()
+        VALIDATION_RESULTS.labels(endpoint, _validation_status_label(body)).inc()
+        with _timed('serialize'):
+            return status, app.json.dumps(body).encode('utf-8')
+
+    key = _result_cache_key(endpoint, content_sha256, key_parts) if _result_cache is not None else None
+    if key is None:
+        status, payload = compute_serialized()
+        cache_state = 'BYPASS'
+    else:
+        status, payload, cache_state = _result_cache.get_or_compute(key, compute_serialized)
+    RESULT_CACHE_LOOKUPS.labels(endpoint, cache_state).inc()
+    return status, payload, cache_state
+
+def _result_cache_key(endpoint: str, content_sha256: str, key_parts: list[str]) -> Optional[str]:
+    """None while the toolchain identity is unknown: such results must not be cached."""
+    identity = _toolchain_identity(endpoint)
+    if identity is None:
+        return None
+    h = hashlib.sha256(content_sha256.encode('ascii'))
+    for part in [endpoint, identity, *key_parts]:
+        h.update(b'\0' + part.encode('utf-8'))
+    return h.hexdigest()
+
+def _validation_status_label(body: dict) -> str:
+    """valid | invalid | <error code> (e.g. timeout, no_xml_report) for the validation metrics."""
+    if body.get("error"):
+        return str(body["error"])
+    return "valid" if body.get("ok") else "invalid"
+
+def _cached_json_response(endpoint: str, content_sha256: str, key_parts: list[str], compute):
+    """Like _cached_result, as a JSON response with the cache state in X-Cache."""
+    status, payload, cache_state = _cached_result(endpoint, content_sha256, key_parts, compute)
+    return _json_payload_response(status, payload, cache_state)
+
+def _json_payload_response(status: int, payload: bytes, cache_state: str):
+    resp = app.response_class(payload, status=status, mimetype='application/json')
+    resp.headers['X-Cache'] = cache_state
+    return resp
+
+# ───── Upload-Spooling (Request-Body → Datei, nie komplett im Speicher) ─────
+# Enforced before the body is read (Content-Length) and while streaming (chunked uploads) → 413
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', '256'))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024 if MAX_UPLOAD_MB > 0 else None
+_SPOOL_CHUNK = 64 * 1024
+_SNIFF_BYTES = 8
+
+@app.before_request
+def _enforce_upload_limit():
+    limit = app.config['MAX_CONTENT_LENGTH']
+    if limit and request.content_length and request.content_length > limit:
+        abort(413, f"Upload größer als {MAX_UPLOAD_MB} MB (MAX_UPLOAD_MB).")
+
+class SpooledUpload:
+    """An upload written to disk chunk by chunk; keeps size, SHA-256 and the first bytes for sniffing."""
+
+    def __init__(self, path: str, field: Optional[str] = None, filename: Optional[str] = None):
+        self.path = path
+        self.field = field
+        self.filename = filename
+        self.size = 0
+        self.head = b''
+        self._hash = hashlib.sha256()
+        self._file = open(path, 'wb')
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+
+    def write(self, data: bytes):
+        if len(self.head) < _SNIFF_BYTES:
+            self.head += data[:_SNIFF_BYTES - len(self.head)]
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def copy_from(self, stream):
+        while True:
+            chunk = stream.read(_SPOOL_CHUNK)
+            if not chunk:
+                break
+            self.write(chunk)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _spool_body(path: str) -> SpooledUpload:
+    """Streams the raw request body to path."""
+    upload = SpooledUpload(path)
+    try:
+        with _timed('upload'):
+            upload.copy_from(request.stream)
+    finally:
+        upload.close()
+    return upload
+
+class _MultipartSpooler:
+    """
+    Drives a MultipartDecoder over body chunks and writes file parts to disk. target(field, filename,
+    index) returns the path for a file part or None to skip it; index counts the parts spooled so far.
+    Form fields are ignored.
+    """
+
+    def __init__(self, boundary: Optional[str], target):
+        if not boundary:
+            abort(400, "multipart/form-data ohne boundary")
+        self.decoder = MultipartDecoder(boundary.encode('latin-1'))
+        self.target = target
+        self.uploads: list[SpooledUpload] = []
+        self._current: Optional[SpooledUpload] = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Processes one chunk (b'' = end of body). True once the closing boundary has been seen."""
+        try:
+            self.decoder.receive_data(chunk or None)
+            event = self.decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    path = self.target(event.name, event.filename, len(self.uploads))
+                    if path is not None:
+                        self._current = SpooledUpload(path, event.name, event.filename)
+                        self.uploads.append(self._current)
+                elif isinstance(event, Field):
+                    self._current = None
+                elif isinstance(event, Data) and self._current is not None:
+                    self._current.write(event.data)
+                    if not event.more_data:
+                        self._current.close()
+                        self._current = None
+                event = self.decoder.next_event()
+        except ValueError as e:
+            abort(400, f"Multipart-Body konnte nicht gelesen werden: {e}")
+        return isinstance(event, Epilogue)
+
+    def close(self):
+        for upload in self.uploads:
+            upload.close()
+
+def _spool_multipart(target) -> list[SpooledUpload]:
+    """
+    Streams a multipart/form-data body part by part to disk (MultipartDecoder, never the whole body
+    or a whole part in memory). See _MultipartSpooler for target.
+    """
+    spooler = _MultipartSpooler(request.mimetype_params.get('boundary'), target)
+    try:
+        with _timed('upload'):
+            while True:
+                chunk = request.stream.read(_SPOOL_CHUNK)
+                if spooler.feed(chunk) or not chunk:
+                    break
+    finally:
+        spooler.close()
+    return spooler.uploads
+
+def _request_files_target(paths: dict[str, str]):
+    """target for _MultipartSpooler: the first file part of each field in paths ({field: target path})."""
+    taken = set()
+
+    def target(field, filename, index):
+        if field not in paths or field in taken:
+            return None
+        taken.add(field)
+        return paths[field]
+    return target
+
+def _spool_request_files(paths: dict[str, str]) -> dict[str, SpooledUpload]:
+    """Spools the first file part of each field in paths ({field: target path}); missing fields are absent."""
+    if not (request.content_type or '').startswith('multipart/form-data'):
+        return {}
+    return {upload.field: upload for upload in _spool_multipart(_request_files_target(paths))}
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_SPOOL_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ───── MustangCLI-Endpunkt (Diagrammerstellung - wie zuvor) ─────
+@app.route('/generate', methods=['POST'])
+def generate():
+    with _request_workspace() as tmp:
+        src = os.path.join(tmp, 'Input.java')
+        out = os.path.join(tmp, 'diagram.png')
+        upload = _spool_body(src)
+        if upload.size == 0:
+            app.logger.error("MustangCLI /generate: Keine Daten im Request Body.")
+            abort(400, "Keine Daten im Request Body für /generate.")
+
+        # Annahme: Die 'generate'-Aktion von MustangCLI hat eine andere Syntax
+        mustang_args = ['generate', src, '--output', out]
+        app.logger.info(f"MustangCLI /generate: Führe Aktion aus: {' '.join(mustang_args)}")
+        try:
+            result = _run_mustang(mustang_args, timeout=60, check=True, input_bytes=upload.size)
+            _log_tool_output("MustangCLI /generate", result)
+        except subprocess.CalledProcessError as e:
+            error_message = f"MustangCLI-Fehler (Code {e.returncode}): {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
+            app.logger.error(f"MustangCLI /generate Fehler: {error_message}")
+            abort(500, error_message)
+        except subprocess.TimeoutExpired as e:
+            error_message = f"MustangCLI Timeout: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
+            app.logger.error(f"MustangCLI /generate Timeout: {error_message}")
+            abort(500, error_message)
+
+        if not os.path.exists(out) or os.path.getsize(out) == 0:
+            app.logger.error("MustangCLI /generate: Ausgabedatei wurde nicht erstellt oder ist leer.")
+            abort(500, "MustangCLI Ausgabedatei wurde nicht erstellt oder ist leer.")
+        return send_file(out, mimetype='image/png')
+
+# ───── PDF → PDF/A-3-Konvertierung (Ghostscript - wie zuvor) ─────
+# auto = PDFs that already declare PDF/A-3 (XMP pdfaid + basic structure) are returned unchanged,
+# strict = same, but only if veraPDF (result cache) confirms it, force = always Ghostscript
+CONVERT_PDFA3_MODE = os.environ.get('CONVERT_PDFA3_MODE', 'auto')
+_PDFA3_MODES = ('auto', 'strict', 'force')
+_PDFA3_CONFORMANCE = ('A', 'B', 'U')
+
+@app.route('/convert_pdfa3', methods=['POST'])
+def convert_pdfa3():
+    """
+    PDF → PDF/A-3 via Ghostscript.
+
+    Query:
+      - mode=auto (default, CONVERT_PDFA3_MODE): skip Ghostscript if the PDF already is PDF/A-3
+      - mode=strict: skip only if veraPDF also confirms compliance
+      - mode=force: always convert
+
+    Returns the PDF; X-PDFA-Conversion: skipped|converted, X-PDFA-Check: detected flavour or reason.
+    """
+    multipart = _check_convert_pdfa3_content_type()
+    mode = _convert_pdfa3_mode()
+
+    with _request_workspace() as tmp:
+        inp = os.path.join(tmp, 'in.pdf')
+        out = os.path.join(tmp, 'out_pdfa3.pdf')
+        if multipart:
+            upload = _spool_request_files({'file': inp}).get('file')
+        else:
+            upload = _spool_body(inp)
+        _check_convert_pdfa3_upload(multipart, upload)
+        skip, check = _pdfa3_skip_check(inp, mode, upload.sha256)
+        if not skip:
+            _convert_pdfa3_file(inp, out)
+        return _pdfa3_response(inp if skip else out, skip, check)
+
+def _convert_pdfa3_mode() -> str:
+    mode = request.args.get('mode', CONVERT_PDFA3_MODE)
+    if mode not in _PDFA3_MODES:
+        abort(400, f"Ungültiger Wert für 'mode': '{mode}' (erlaubt: {', '.join(_PDFA3_MODES)})")
+    return mode
+
+def _pdfa3_response(path: str, skipped: bool, check: str):
+    resp = send_file(path, mimetype='application/pdf', as_attachment=True, download_name='output_pdfa3.pdf')
+    resp.headers['X-PDFA-Conversion'] = 'skipped' if skipped else 'converted'
+    resp.headers['X-PDFA-Check'] = check
+    return resp
+
+def _pdfa3_structure_check(path: str) -> tuple[bool, str]:
+    """
+    (True, e.g. 'pdfa-3b') if the XMP declares PDF/A-3 and the basics a PDF/A file needs are there
+    (intact xref, no encryption, document ID, GTS_PDFA1 output intent with ICC profile);
+    otherwise (False, reason code).
+    """
+    try:
+        with _timed('preflight'), PdfDocument(path) as pdf:
+            if pdf.xref_repaired:
+                return False, 'xref_repaired'
+            pdfaid = _xmp_metadata(pdf.xmp())["pdfaid"] or {}
+            part, conformance = pdfaid.get('part'), (pdfaid.get('conformance') or '').upper()
+            if part is None:
+                return False, 'no_pdfaid'
+            if part != '3' or conformance not in _PDFA3_CONFORMANCE:
+                return False, f"pdfa-{part}{conformance.lower()}"
+            if 'ID' not in pdf.trailer:
+                return False, 'no_document_id'
+            intents = pdf.resolve(pdf.catalog.get('OutputIntents'))
+            for intent in intents if isinstance(intents, list) else []:
+                intent = pdf.resolve(intent)
+                if isinstance(intent, dict) and intent.get('S') == 'GTS_PDFA1' and 'DestOutputProfile' in intent:
+                    break
+            else:
+                return False, 'no_output_intent'
+    except PdfError as e:
+        return False, e.error
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return False, 'pdf_parse_error'
+    return True, f"pdfa-3{conformance.lower()}"
+
+def _pdfa3_skip_check(path: str, mode: str, content_sha256: Optional[str] = None) -> tuple[bool, str]:
+    """(skip Ghostscript?, X-PDFA-Check value) for the mode; strict asks veraPDF through the result cache."""
+    if mode == 'force':
+        return False, 'forced'
+    skip, check = _pdfa3_structure_check(path)
+    if skip and mode == 'strict':
+        status, _, _ = _cached_result('validate_pdfa', content_sha256 or _file_sha256(path), _verapdf_key_parts('summary'),
+                                      lambda: _validate_with_verapdf(path, 'summary'))
+        if status != 200:
+            return False, 'verapdf_not_compliant' if status == 422 else 'verapdf_error'
+    if skip:
+        app.logger.info(f"PDF/A-3 /convert_pdfa3: Bereits PDF/A-3 ({check}), Ghostscript übersprungen")
+    return skip, check
+
+def _check_convert_pdfa3_content_type() -> bool:
+    """400 unless application/pdf or multipart/form-data; True for multipart."""
+    ctype = request.content_type or ''
+    if not (ctype.startswith('multipart/form-data') or ctype == 'application/pdf'):
+        app.logger.error(f"PDF/A-3 /convert_pdfa3: Ungültiger CT: {ctype}")
+        abort(400, f"Content-Type muss application/pdf oder multipart/form-data sein, war aber '{ctype}'")
+    return ctype.startswith('multipart/form-data')
+
+def _check_convert_pdfa3_upload(multipart: bool, upload: Optional[SpooledUpload]):
+    if multipart:
+        if upload is None:
+            app.logger.error("PDF/A-3 /convert_pdfa3: Kein File-Feld 'file'.")
+            abort(400, "Kein File-Feld 'file' gefunden")
+        if upload.size == 0:
+            app.logger.error("PDF/A-3 /convert_pdfa3: Hochgeladene PDF ist leer.")
+            abort(400, "Hochgeladene PDF-Datei ist leer.")
+    elif upload.size == 0:
+        app.logger.error("PDF/A-3 /convert_pdfa3: Gesendete PDF-Daten sind leer.")
+        abort(400, "Gesendete PDF-Daten sind leer.")
+
+def _convert_pdfa3_file(inp: str, out: str):
+    """Ghostscript PDF → PDF/A-3 from file to file; aborts with 500 on failure."""
+    gs_cmd = _pdfa3_gs_cmd(inp, out)
+    try:
+        result = _run_gs(gs_cmd, timeout=120, check=True, input_bytes=os.path.getsize(inp))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        _abort_gs_failure(e)
+    _check_pdfa3_output(result, out)
+
+def _pdfa3_gs_cmd(inp: str, out: str) -> list[str]:
+    # ICC Profil Pfad prüfen, aber nur wenn er nicht leer ist
+    # if ICC_PROFILE_PATH and not os.path.exists(ICC_PROFILE_PATH):
+    #     error_message = f"ICC-Profil nicht gefunden: {ICC_PROFILE_PATH}"
+    #     app.logger.error(error_message)
+    #     abort(500, error_message)
+
+    gs_cmd = [
+        'gs', '-dPDFA=3', '-dPDFACompatibilityPolicy=1', '-dBATCH',
+        '-dNOPAUSE', '-sDEVICE=pdfwrite', '-dEmbedAllFonts=true',
+        '-dSubsetFonts=true', '-sProcessColorModel=DeviceRGB',
+        # Wenn Sie das ICC-Profil Problem gelöst haben, können Sie es wieder einkommentieren:
+        # f'-sOutputICCProfile={ICC_PROFILE_PATH}',
+        f'-sOutputFile={out}', inp
+    ]
+    app.logger.info(f"Ghostscript /convert_pdfa3: Befehl: {' '.join(gs_cmd)}")
+    return gs_cmd
+
+def _abort_gs_failure(e: subprocess.SubprocessError):
+    if isinstance(e, subprocess.CalledProcessError):
+        error_message = f"GS-Fehler (Code {e.returncode}): {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
+    else:
+        error_message = f"GS Timeout: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
+    app.logger.error(error_message)
+    abort(500, error_message)
+
+def _check_pdfa3_output(result: subprocess.CompletedProcess, out: str):
+    _log_tool_output("GS", result)
+    if not os.path.exists(out) or os.path.getsize(out) == 0:
+        abort(500, "GS Ausgabedatei nicht erstellt/leer.")
+
+# ───── Endpunkt: XML in PDF einbetten (ZUGFeRD/Factur-X mit MustangCLI) - ANGEPASST ─────
+@app.route('/embed_xml', methods=['POST'])
+def embed_xml():
+    zugferd_format_param, zugferd_version_param, zugferd_profile_param = _embed_xml_params()
+
+    with _request_workspace() as tmp:
+        temp_pdf_path = os.path.join(tmp, 'source.pdf')
+        temp_xml_path = os.path.join(tmp, 'invoice.xml')
+        temp_output_pdf_path = os.path.join(tmp, 'output_with_xml.pdf')
+
+        uploads = _spool_request_files({'pdf_file': temp_pdf_path, 'xml_file': temp_xml_path})
+        _check_embed_uploads(uploads)
+        zugferd_profile_param = _preflight_embed_inputs(temp_pdf_path, temp_xml_path, zugferd_profile_param)
+
+        _embed_xml_file(temp_pdf_path, temp_xml_path, temp_output_pdf_path,
+                        zugferd_format_param, zugferd_version_param, zugferd_profile_param)
+
+        download_filename = _embed_xml_download_name(zugferd_format_param, zugferd_version_param, zugferd_profile_param)
+        return send_file(temp_output_pdf_path, mimetype='application/pdf', as_attachment=True, download_name=download_filename)
+
+def _check_embed_uploads(uploads: dict[str, SpooledUpload]):
+    if 'pdf_file' not in uploads or 'xml_file' not in uploads:
+        app.logger.error("MustangCLI /embed_xml: Fehlende Dateien. 'pdf_file' und 'xml_file' werden benötigt.")
+        abort(400, "Fehlende Dateien: 'pdf_file' und 'xml_file' werden benötigt.")
+    if uploads['pdf_file'].size == 0:
+        app.logger.error("MustangCLI /embed_xml: Hochgeladene PDF-Datei ist leer.")
+        abort(400, "Hochgeladene PDF-Datei ist leer.")
+    if uploads['xml_file'].size == 0:
+        app.logger.error("MustangCLI /embed_xml: Hochgeladene XML-Datei ist leer.")
+        abort(400, "Hochgeladene XML-Datei ist leer.")
+
+def _embed_xml_params() -> tuple[str, str, Optional[str]]:
+    """Returns (format, version, profile) from the query string; profile None if not given."""
+    # ZUGFeRD-spezifische Parameter aus der Query-String lesen
+    # Die Default-Werte hier sollten mit der Hilfeausgabe der MustangCLI übereinstimmen
+    # Hilfe sagt für --version <1|2>. '2' ist hier für ZUGFeRD 2.x.
+    zugferd_version_param = request.args.get('version', '2')
+
+    # Sicherstellen, dass der Profilname exakt einem der gültigen Werte entspricht
+    # z.B. "XRechnung", "EN16931", "COMFORT" etc. (Groß-/Kleinschreibung beachten!)
+    # Als Default nehmen wir einen gängigen Wert für Deutschland.
+    # Ohne 'profile' wird es nach dem Upload aus dem XML erkannt (_preflight_embed_inputs).
+    zugferd_profile_param = request.args.get('profile')
+    # NEU: Mapping anwenden
+    if zugferd_profile_param:
+        zugferd_profile_param = PROFILE_MAPPING.get(zugferd_profile_param, zugferd_profile_param)
+
+    # Format-Parameter, 'zf' für ZUGFeRD oder 'fx' für Factur-X.
+    zugferd_format_param = request.args.get('format', 'zf')
+    return zugferd_format_param, zugferd_version_param, zugferd_profile_param
+
+def _preflight_embed_inputs(pdf_path: str, xml_path: str, profile: Optional[str]) -> str:
+    """
+    Rejects a non-PDF source and malformed/non-invoice XML with 400 before Mustang starts and
+    returns the profile: explicit ?profile=, else from the XML's guideline ID, else XRECHNUNG.
+    """
+    detected = None
+    if PREFLIGHT_ENABLED or not profile:
+        try:
+            with _timed('preflight'):
+                if PREFLIGHT_ENABLED:
+                    _preflight_pdf(pdf_path, require_invoice=False)
+                detected = _preflight_xml(xml_path)["profile"]
+        except PreflightError as e:
+            if PREFLIGHT_ENABLED:
+                app.logger.error(f"MustangCLI /embed_xml: Pre-Flight abgelehnt ({e.error}): {e.message}")
+                abort(400, e.message)
+    if profile:
+        return profile
+    if detected:
+        app.logger.info(f"MustangCLI /embed_xml: Profil aus dem XML erkannt: {detected}")
+        return detected
+    return PROFILE_MAPPING['XRECHNUNG']
+
+def _embed_xml_download_name(fmt: str, version: str, profile: str) -> str:
+    return f"zugferd_fmt-{fmt}_v{version}_{profile}.pdf"
+
+def _embed_xml_file(pdf_path: str, xml_path: str, out_path: str, fmt: str, version: str, profile: str):
+    """Mustang `combine` from file to file; aborts with 500 on failure."""
+    mustang_args = _embed_xml_args(pdf_path, xml_path, out_path, fmt, version, profile)
+    try:
+        input_bytes = os.path.getsize(pdf_path) + os.path.getsize(xml_path)
+        result = _run_mustang(mustang_args, timeout=120, check=True, input_bytes=input_bytes)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        _abort_embed_failure(e)
+    _check_embed_output(result, out_path)
+
+def _embed_xml_args(pdf_path: str, xml_path: str, out_path: str, fmt: str, version: str, profile: str) -> list[str]:
+    # Angepasster MustangCLI Befehl basierend auf der --help Ausgabe
+    mustang_args = [
+        '--action', 'combine',           # Korrekte Aktion
+        '--source', pdf_path,            # Eingabe-PDF
+        '--source-xml', xml_path,        # Eingabe-XML
+        '--out', out_path,               # Ausgabe-PDF
+        '--format', fmt,                 # z.B. 'zf' oder 'fx'
+        '--version', version,            # z.B. '2'
+        '--profile', profile,            # z.B. 'XRechnung'
+        # Avoid interactive prompts: pass a single empty attachment filename and disable prompting.
+        '--attachments', '',
+        '--no-additional-attachments'
+    ]
+    app.logger.info(f"MustangCLI /embed_xml: Führe Aktion aus: {' '.join(mustang_args)}")
+    return mustang_args
+
+def _abort_embed_failure(e: subprocess.SubprocessError):
+    if isinstance(e, subprocess.CalledProcessError):
+        error_message = f"MustangCLI Fehler (Code {e.returncode}) beim Einbetten: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
+    else:
+        error_message = f"MustangCLI Timeout beim Einbetten: {e}\nBefehl: {' '.join(e.cmd)}\nStdout: {e.stdout}\nStderr: {e.stderr}"
+    app.logger.error(error_message)
+    abort(500, error_message)
+
+def _check_embed_output(result: subprocess.CompletedProcess, out_path: str):
+    _log_tool_output("MustangCLI /embed_xml", result)
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+         app.logger.error("MustangCLI /embed_xml: Ausgabedatei wurde nicht erstellt oder ist leer.")
+         abort(500, "MustangCLI Ausgabedatei mit eingebettetem XML wurde nicht erstellt oder ist leer.")
+
+@app.route('/validate', methods=['POST'])
+def validate():
+    """
+    Erwartet:
+      - multipart/form-data mit Feldname 'file' (empfohlen), ODER
+      - application/pdf   (Rohdaten im Body), ODER
+      - application/xml   (Rohdaten im Body)
+
+    Ruft Mustang-CLI 'validate <datei>' auf und liefert stdout/stderr/returncode zurück.
+    Ergebnisse werden über den Result-Cache wiederverwendet (Header X-Cache).
+
+    Query-Parameter 'findings': all (Default) | errors | summary, 'max_findings': N.
+    'engine': mustang | fast (XSD + Schematron ohne JVM für XML-Rechnungen, Default VALIDATE_ENGINE).
+    Mit 'Accept: application/x-ndjson' wird der Report als NDJSON gestreamt.
+    """
+    findings, max_findings = _findings_params()
+    engine = _validate_engine()
+    multipart = _check_validate_content_type()
+    stream = _wants_ndjson()
+
+    with _request_workspace() as tmp:
+        upload_path = os.path.join(tmp, 'upload')
+        if multipart:
+            upload = _spool_request_files({'file': upload_path}).get('file')
+        else:
+            upload = _spool_body(upload_path)
+        input_path = _validate_input_path(multipart, upload)
+
+        if stream:
+            # Report wird beim Parsen gestreamt, ohne Result-Cache
+            preflight, error = _validate_preflight(input_path)
+            if not error:
+                result, error, engine_info = _run_validate_engine(input_path, upload.size, preflight, engine)
+            if error:
+                return jsonify(error[0]), error[1]
+            return _mustang_ndjson_response(result, findings, max_findings, engine_info)
+
+        return _json_payload_response(*_cached_validation(
+            upload.sha256, _validate_key_parts(input_path, findings, max_findings, engine),
+            input_path, upload.size, findings, max_findings, engine
+        ))
+
+def _check_validate_content_type() -> bool:
+    """400 unless multipart/form-data, application/pdf or application/xml; True for multipart."""
+    ctype = request.content_type or ''
+    if not (ctype.startswith('multipart/form-data') or ctype in ('application/pdf', 'application/xml', 'text/xml')):
+        app.logger.error(f"MustangCLI /validate: Unsupported Content-Type: {ctype}")
+        abort(400, f"Content-Type muss multipart/form-data, application/pdf oder application/xml sein (war: '{ctype}').")
+    return ctype.startswith('multipart/form-data')
+
+def _wants_ndjson() -> bool:
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def _validate_input_path(multipart: bool, upload: Optional[SpooledUpload]) -> str:
+    """Renames the spooled upload to the file name Mustang should see (it appears in the report)."""
+    filename = 'invoice'
+    if multipart:
+        if upload is None:
+            app.logger.error("MustangCLI /validate: Kein File-Feld 'file'.")
+            abort(400, "Kein File-Feld 'file' gefunden")
+        filename = os.path.basename(upload.filename or '') or filename
+    # Dateiendung für temp-Datei ableiten
+    elif request.content_type == 'application/pdf':
+        filename += '.pdf'
+    else:
+        filename += '.xml'
+
+    if upload.size == 0:
+        abort(400, "Upload ist leer.")
+
+    # Nur die ersten Bytes entscheiden über PDF/XML; Mustang liest die Datei selbst
+    filename = _with_document_extension(filename, upload.head)
+    input_path = os.path.join(os.path.dirname(upload.path), filename)
+    os.rename(upload.path, input_path)
+    return input_path
+
+def _validate_key_parts(input_path: str, findings: str, max_findings: Optional[int],
+                        engine: str = 'mustang') -> list[str]:
+    # Der Mustang-Report enthält den Dateinamen, daher ist er Teil des Cache-Keys
+    key_parts = [os.path.basename(input_path)]
+    if findings != 'all' or max_findings is not None:
+        key_parts += [f"findings={findings}", f"max_findings={max_findings}"]
+    if engine == 'fast':
+        # Other rule artefacts, other results; a fallback to Mustang is cached under this key as well
+        key_parts.append(f"engine=fast:{_fast_validation_status()['artifacts']}")
+    return key_parts
+
+def _mustang_ndjson_response(result: subprocess.CompletedProcess, findings: str, max_findings: Optional[int],
+                             engine_info: Optional[dict] = None):
+    resp = app.response_class(
+        stream_with_context(_stream_mustang_validation(result, findings, max_findings, engine_info)),
+        mimetype='application/x-ndjson'
+    )
+    resp.headers['X-Cache'] = 'BYPASS'
+    return resp
+
+def _findings_params() -> tuple[str, Optional[int]]:
+    """?findings=summary|errors|all and ?max_findings=N for /validate."""
+    findings = request.args.get('findings', 'all')
+    if findings not in _FINDINGS_MODES:
+        abort(400, f"Ungültiger findings-Modus '{findings}' (erlaubt: {', '.join(_FINDINGS_MODES)})")
+    max_findings = request.args.get('max_findings')
+    if max_findings is None:
+        return findings, None
+    try:
+        limit = int(max_findings)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        abort(400, f"max_findings muss eine Zahl >= 0 sein (war: '{max_findings}').")
+    return findings, limit
+
+def _with_document_extension(filename: str, head: bytes) -> str:
+    # sinnvolle Endung, falls nicht vorhanden
+    if not (filename.endswith('.pdf') or filename.endswith('.xml')):
+        # einfacher Heuristik-Fallback
+        filename += '.pdf' if head[:5] == b'%PDF-' else '.xml'
+    return filename
+
+def _validate_preflight(input_path: str):
+    """Pre-flight for /validate. Returns (info, None) or (None, (error_body, 422))."""
+    try:
+        with _timed('preflight'):
+            return _preflight_document(input_path), None
+    except PreflightError as e:
+        app.logger.info(f"MustangCLI /validate: Pre-Flight abgelehnt ({e.error}): {e.message}")
+        return None, (e.body(), 422)
+
+def _run_mustang_validate(input_path: str, input_bytes: int):
+    """Mustang `validate` on a spooled file. Returns (result, None) or (None, (error_body, status))."""
+    try:
+        return _run_mustang(_mustang_validate_args(input_path), timeout=120, input_bytes=input_bytes), None
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        return None, _mustang_validate_error(e)
+
+def _mustang_validate_args(input_path: str) -> list[str]:
+    mustang_args = [
+        "--action", "validate",
+        "--source", input_path,
+        "--no-notices"
+    ]
+    app.logger.info(f"MustangCLI /validate: Führe Aktion aus: {' '.join(mustang_args)}")
+    return mustang_args
+
+def _mustang_validate_error(e: Exception) -> tuple[dict, int]:
+    if isinstance(e, subprocess.TimeoutExpired):
+        msg = f"MustangCLI /validate Timeout: {e}"
+        app.logger.error(msg)
+        return {"ok": False, "error": "timeout", "message": msg}, 504
+    # Java nicht im PATH
+    msg = "Java nicht gefunden. Ist openjdk-17-jre-headless installiert und 'java' im PATH?"
+    app.logger.error(f"MustangCLI /validate: {msg}")
+    return {"ok": False, "error": "java_not_found", "message": msg}, 500
+
+def _mustang_report_error(result: subprocess.CompletedProcess, error: str, msg: str) -> tuple[dict, int]:
+    app.logger.error(f"MustangCLI /validate: {msg}")
+    return {
+        "ok": False,
+        "error": error,
+        "message": msg,
+        "returncode": result.returncode,
+        "stdout_tail": _tail(result.stdout or ""),
+        "stderr_tail": _tail(result.stderr or "")
+    }, 500
+
+def _mustang_report_body(result: subprocess.CompletedProcess, parser: MustangReportParser) -> tuple[dict, int]:
+    """Summary part of the /validate response once the parser has consumed the whole report."""
+    if not parser.started or not parser.done:
+        return _mustang_report_error(
+            result, "no_xml_report", "Konnte keinen Mustang-XML-Validierungsreport aus stdout/stderr extrahieren.")
+
+    status = (parser.status or "").lower()
+    is_valid = (status == "valid")
+    return {
+        "ok": is_valid,
+        "status": parser.status,
+        "returncode": result.returncode,
+        "report": {
+            "filename": parser.filename,
+            "datetime": parser.datetime
+        },
+        "finding_counts": parser.counts
+    }, (200 if is_valid else 422)
+
+def _cached_validation(content_sha256: str, key_parts: list[str], input_path: str, input_bytes: int,
+                       findings: str = 'all', max_findings: Optional[int] = None,
+                       engine: str = 'mustang') -> tuple[int, bytes, str]:
+    """
+    _cached_result() for /validate. Pre-flight rejects are answered before the cache (X-Cache: BYPASS),
+    so only results of a tool run are stored.
+    """
+    preflight, error = _validate_preflight(input_path)
+    if error:
+        body, status = error
+        VALIDATION_RESULTS.labels('validate', _validation_status_label(body)).inc()
+        return status, app.json.dumps(body).encode('utf-8'), 'BYPASS'
+    return _cached_result('validate', content_sha256, key_parts, lambda: _validate_with_mustang(
+        input_path, input_bytes, preflight, findings, max_findings, engine))
+
+def _validate_with_mustang(input_path: str, input_bytes: int, preflight: Optional[dict], findings: str = 'all',
+                           max_findings: Optional[int] = None, engine: str = 'mustang') -> tuple[dict, int]:
+    """
+    Mustang `validate` (or the fast engine) on a spooled file that passed _validate_preflight(); the
+    file name appears in the report.
+    """
+    result, error, engine_info = _run_validate_engine(input_path, input_bytes, preflight, engine)
+    if error:
+        return error
+    return _mustang_validation_body(result, preflight, findings, max_findings, engine_info)
+
+def _mustang_validation_body(result: subprocess.CompletedProcess, preflight: Optional[dict], findings: str,
+                             max_findings: Optional[int], engine_info: Optional[dict] = None) -> tuple[dict, int]:
+    parser = MustangReportParser()
+    try:
+        with _timed('parse'):
+            selected, truncated = _select_findings(
+                _iter_mustang_findings(result, parser), findings, max_findings)
+    except ET.ParseError as e:
+        return _mustang_report_error(result, "xml_parse_error", f"XML-Report konnte nicht geparst werden: {e}")
+
+    body, status = _mustang_report_body(result, parser)
+    if body.get("error"):
+        return body, status
+    body.update(engine_info or {})
+    if preflight:
+        body["preflight"] = preflight
+    body["findings"] = selected
+    if findings != 'all' or max_findings is not None:
+        body["findings_mode"] = findings
+        body["findings_truncated"] = truncated
+    return body, status
+
+def _stream_mustang_validation(result: subprocess.CompletedProcess, findings: str, max_findings: Optional[int],
+                               engine_info: Optional[dict] = None):
+    """NDJSON: one line {"finding": {...}} per finding while parsing, then {"summary": {...}}."""
+    parser = MustangReportParser()
+    emitted, truncated = 0, False
+    try:
+        for finding in _iter_mustang_findings(result, parser):
+            if not _wanted_finding(finding, findings):
+                continue
+            if max_findings is not None and emitted >= max_findings:
+                truncated = True
+                continue
+            emitted += 1
+            yield json.dumps({"finding": finding}, ensure_ascii=False) + "\n"
+        body, status = _mustang_report_body(result, parser)
+    except ET.ParseError as e:
+        body, status = _mustang_report_error(result, "xml_parse_error", f"XML-Report konnte nicht geparst werden: {e}")
+    VALIDATION_RESULTS.labels('validate', _validation_status_label(body)).inc()
+    if not body.get("error"):
+        body.update(engine_info or {})
+        body.update(findings_mode=findings, findings_emitted=emitted, findings_truncated=truncated)
+    yield json.dumps({"summary": {"http_status": status, **body}}, ensure_ascii=False) + "\n"
+
+# ───── Fast-Engine für /validate (XSD + Schematron in warmen Python-Workern, ohne JVM) ─────
+# XML-Rechnungen (CII/UBL, EN16931 und XRechnung) prüft worker/fast_validator.py: XSDs und kompilierte
+# Schematron-XSLTs bleiben pro Worker geladen, der Report hat Mustangs Form (gleicher Parser, gleiche findings).
+# PDFs, andere Profile und ein nicht verfügbarer oder ausgelasteter Fast-Pool laufen über Mustang.
+VALIDATE_ENGINE = os.environ.get('VALIDATE_ENGINE', 'mustang')
+FAST_VALIDATION_DIR = os.environ.get('FAST_VALIDATION_DIR', '/opt/validation')
+FAST_VALIDATION_POOL_SIZE = int(os.environ.get('FAST_VALIDATION_POOL_SIZE', '2'))
+FAST_VALIDATION_MAX_JOBS = int(os.environ.get('FAST_VALIDATION_MAX_JOBS', '1000'))
+FAST_VALIDATION_MAX_RSS_MB = int(os.environ.get('FAST_VALIDATION_MAX_RSS_MB', '1536'))
+FAST_VALIDATION_ACQUIRE_TIMEOUT = float(os.environ.get('FAST_VALIDATION_ACQUIRE_TIMEOUT', '10'))
+FAST_VALIDATION_TIMEOUT = float(os.environ.get('FAST_VALIDATION_TIMEOUT', '60'))
+# Start the workers with the service, so the first request does not pay for compiling the XSLTs
+FAST_VALIDATION_PREWARM = os.environ.get('FAST_VALIDATION_PREWARM', '1') == '1'
+FAST_WORKER_SCRIPT = '/opt/mustang/worker/fast_validator.py'
+# Written at build time (Dockerfile): versions of the XSD/schematron artefacts, part of the cache key
+FAST_VALIDATION_VERSIONS_PATH = os.path.join(FAST_VALIDATION_DIR, 'VERSIONS.txt')
+
+_VALIDATE_ENGINES = ('mustang', 'fast')
+# Profile (pre-flight) → rule set of the fast engine; XRechnung runs EN16931 + XRechnung schematron
+_FAST_RULESETS = {'COMFORT': 'en16931', 'XRECHNUNG': 'xrechnung'}
+_EN16931_GUIDELINE = 'urn:cen.eu:en16931:2017'
+
+# lxml and saxonche are optional (image: pip install); without them or the artefacts everything stays on Mustang
+FAST_VALIDATION_AVAILABLE = (
+    all(importlib.util.find_spec(module) is not None for module in ('lxml', 'saxonche'))
+    and os.path.isfile(FAST_VALIDATION_VERSIONS_PATH)
+)
+
+_fast_pool = WorkerPool(
+    'Fast-Validator', FAST_VALIDATION_POOL_SIZE,
+    lambda: _PooledWorker('Fast-Validator', [sys.executable, FAST_WORKER_SCRIPT], FAST_VALIDATION_MAX_JOBS,
+                          FAST_VALIDATION_MAX_RSS_MB * 1024 * 1024, startup_timeout=120),
+    FAST_VALIDATION_ACQUIRE_TIMEOUT
+) if FAST_VALIDATION_AVAILABLE and FAST_VALIDATION_POOL_SIZE > 0 else None
+
+if _fast_pool is not None and FAST_VALIDATION_PREWARM:
+    _fast_pool.prewarm(FAST_VALIDATION_POOL_SIZE)
+
+def _validate_engine() -> str:
+    """?engine=mustang|fast for /validate (default VALIDATE_ENGINE)."""
+    engine = request.args.get('engine', VALIDATE_ENGINE)
+    if engine not in _VALIDATE_ENGINES:
+        abort(400, f"Ungültige engine '{engine}' (erlaubt: {', '.join(_VALIDATE_ENGINES)})")
+    return engine
+
+def _fast_validation_args(input_path: str, preflight: Optional[dict]) -> tuple[Optional[list[str]], Optional[str]]:
+    """Worker arguments if the fast engine covers the document, else (None, fallback reason)."""
+    if _fast_pool is None:
+        return None, 'unavailable'
+    if not input_path.endswith('.xml'):
+        return None, 'not_xml'
+    if preflight is None:
+        # Pre-flight disabled: only the header is needed for syntax and profile
+        try:
+            preflight = _preflight_xml(input_path, header_only=True)
+        except PreflightError:
+            return None, 'unsupported_document'
+    rule_set = _FAST_RULESETS.get(preflight.get("profile"))
+    if rule_set is None or not (preflight.get("guideline_id") or '').startswith(_EN16931_GUIDELINE):
+        return None, 'unsupported_profile'
+    return ['--source', input_path, '--syntax', preflight["syntax"], '--rules', rule_set], None
+
+def _fast_validate_result(result: Optional[subprocess.CompletedProcess]):
+    """(result, None) for a written report, else (None, fallback reason)."""
+    if result is None:
+        return None, 'worker_unavailable'
+    if result.returncode != 0:
+        app.logger.warning(f"Fast-Validator: Dokument nicht prüfbar, Fallback auf Mustang: {_tail(result.stderr, 2000)}")
+        return None, 'engine_error'
+    return result, None
+
+def _run_fast_validate(input_path: str, preflight: Optional[dict]):
+    """Fast engine on a warm worker. Returns (result, None) or (None, fallback reason)."""
+    args, reason = _fast_validation_args(input_path, preflight)
+    if args is None:
+        return None, reason
+    try:
+        result = _run_on_pool('fast', _fast_pool, args, [sys.executable, FAST_WORKER_SCRIPT, *args],
+                              FAST_VALIDATION_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return None, 'timeout'
+    return _fast_validate_result(result)
+
+def _run_validate_engine(input_path: str, input_bytes: int, preflight: Optional[dict], engine: str):
+    """
+    Report for /validate from the requested engine; engine=fast falls back to Mustang.
+    Returns (result, error, engine_info) with error = (error_body, status) as in _run_mustang_validate.
+    """
+    if engine == 'fast':
+        result, reason = _run_fast_validate(input_path, preflight)
+        if result is not None:
+            return result, None, {"engine": "fast"}
+        app.logger.info(f"/validate: engine=fast nicht möglich ({reason}), Fallback auf Mustang")
+        result, error = _run_mustang_validate(input_path, input_bytes)
+        return result, error, {"engine": "mustang", "engine_fallback": reason}
+    result, error = _run_mustang_validate(input_path, input_bytes)
+    return result, error, {"engine": "mustang"}
+
+def _fast_validation_status() -> dict:
+    return {
+        "available": FAST_VALIDATION_AVAILABLE,
+        "default_engine": VALIDATE_ENGINE,
+        "artifacts": (_safe_read_text(FAST_VALIDATION_VERSIONS_PATH) or "").strip() or None
+    }
+
+@app.route('/validate_pdfa', methods=['POST'])
+def validate_pdfa():
+    """
+    PDF/A validation using veraPDF CLI.
+
+    Accepts:
+      - multipart/form-data with field 'file'
+      - application/pdf raw body
+
+    Query:
+      - report=full (default): full veraPDF report parsed as JSON (format=json)
+      - report=summary: compliance and rule/check counts per profile only
+      - report=failed_rules: summary plus the failed rules (without individual checks)
+
+    Returns:
+      - 200 if PDF/A conform
+      - 422 if not conform
+    Results are served from the result cache when possible (header X-Cache).
+    """
+    multipart = _check_validate_pdfa_content_type()
+    report = _verapdf_report_mode()
+
+    with _request_workspace() as tmp:
+        input_path = os.path.join(tmp, 'input.pdf')
+        if multipart:
+            upload = _spool_request_files({'file': input_path}).get('file')
+        else:
+            upload = _spool_body(input_path)
+        _check_validate_pdfa_upload(upload)
+
+        return _cached_json_response('validate_pdfa', upload.sha256, _verapdf_key_parts(report),
+                                     lambda: _validate_with_verapdf(input_path, report))
+
+def _check_validate_pdfa_content_type() -> bool:
+    ctype = request.content_type or ''
+    if not (ctype.startswith('multipart/form-data') or ctype == 'application/pdf'):
+        abort(400, f"Content-Type muss application/pdf oder multipart/form-data sein (war: '{ctype}')")
+    return ctype.startswith('multipart/form-data')
+
+def _check_validate_pdfa_upload(upload: Optional[SpooledUpload]):
+    if upload is None:
+        abort(400, "Kein File-Feld 'file' gefunden")
+    if upload.size == 0:
+        abort(400, "Upload ist leer.")
+
+# report=... modes of /validate_pdfa and the extra `verapdf` arguments they run with. The compact
+# modes ask veraPDF to leave out the per-check detail (--maxfailuresdisplayed 0). The report is
+# still read with json.load, so the text of a run is held once in memory: the saving there depends
+# on veraPDF honouring the option. Check lists that are written anyway are dropped while decoding
+# (_verapdf_drop_checks), so they never become Python objects and are never cached.
+_VERAPDF_COMPACT_OPTIONS = ('--maxfailuresdisplayed', '0')
+_VERAPDF_REPORT_OPTIONS = {
+    'full': (),
+    'failed_rules': _VERAPDF_COMPACT_OPTIONS,
+    'summary': _VERAPDF_COMPACT_OPTIONS,
+}
+
+def _verapdf_drop_checks(obj: dict) -> dict:
+    """json object_hook for the compact modes: removes a rule's check list as soon as the rule is decoded."""
+    obj.pop("checks", None)
+    return obj
+
+def _verapdf_report_mode() -> str:
+    report = request.args.get('report', 'full')
+    if report not in _VERAPDF_REPORT_OPTIONS:
+        abort(400, f"Ungültiger Wert für 'report': '{report}' (erlaubt: {', '.join(_VERAPDF_REPORT_OPTIONS)})")
+    return report
+
+def _verapdf_key_parts(report: str) -> list[str]:
+    # 'full' keeps the key of the cache entries written before report modes existed
+    return [] if report == 'full' else [f"report={report}"]
+
+def _validate_with_verapdf(input_path: str, report: str = 'full') -> tuple[dict, int]:
+    """veraPDF JSON report for a spooled PDF (possibly from a coalesced multi-file run)."""
+    try:
+        result, report_json = _verapdf_coalescer.validate(input_path, _VERAPDF_REPORT_OPTIONS[report])
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        return _verapdf_run_error(e)
+    return _verapdf_validation_body(result, report_json, report)
+
+def _verapdf_run_error(e: Exception) -> tuple[dict, int]:
+    if isinstance(e, subprocess.TimeoutExpired):
+        msg = f"veraPDF Timeout: {e}"
+        app.logger.error(msg)
+        return {"ok": False, "error": "timeout", "message": msg}, 504
+    msg = "veraPDF CLI nicht gefunden. Ist 'verapdf' im Container installiert?"
+    app.logger.error(msg)
+    return {"ok": False, "error": "verapdf_not_found", "message": msg}, 500
+
+def _verapdf_validation_body(result: subprocess.CompletedProcess, report_json: Optional[dict],
+                             report_mode: str = 'full') -> tuple[dict, int]:
+    stdout = (result.stdout or "").strip()
+    stderr = (result.stderr or "").strip()
+
+    if report_json is None:
+        msg = "veraPDF Report konnte nicht als JSON geparst werden."
+        app.logger.error(f"veraPDF /validate_pdfa: {msg}")
+        return {
+            "ok": False,
+            "error": "report_parse_error",
+            "message": msg,
+            "returncode": result.returncode,
+            "stdout_tail": _tail(stdout),
+            "stderr_tail": _tail(stderr)
+        }, 500
+
+    # Determine overall validity: be defensive with schema differences
+    ok = False
+    try:
+        report = report_json.get("report", report_json)
+        jobs = report.get("jobs") or []
+        if jobs and isinstance(jobs, list):
+            vr = jobs[0].get("validationResult")
+            if isinstance(vr, dict) and "isCompliant" in vr:
+                ok = bool(vr.get("isCompliant"))
+            else:
+                # If validationResult is absent, fall back to batch summary counts
+                vs = (report.get("batchSummary") or {}).get("validationSummary") or {}
+                total = vs.get("totalJobCount")
+                compliant = vs.get("compliantPdfaCount")
+                failed = vs.get("failedJobCount")
+                parse_failed = (report.get("batchSummary") or {}).get("failedParsingJobs")
+                if total == 1:
+                    ok = (compliant == 1) and (failed in (0, None)) and (parse_failed in (0, None))
+    except Exception:
+        ok = False
+
+    if report_mode != 'full':
+        return {
+            "ok": ok,
+            "returncode": result.returncode,
+            "report_mode": report_mode,
+            "validation": _verapdf_compact_results(report_json, failed_rules=(report_mode == 'failed_rules'))
+        }, (200 if ok else 422)
+
+    return {
+        "ok": ok,
+        "returncode": result.returncode,
+        "verapdf": report_json
+    }, (200 if ok else 422)
+
+def _verapdf_compact_results(report_json: dict, failed_rules: bool) -> list[dict]:
+    """
+    One entry per validation profile of the (single) job: compliance plus rule/check counts, and
+    with failed_rules the failed rule summaries. Handles validationResult as object (older veraPDF)
+    and as list (one result per profile).
+    """
+    report = report_json.get("report", report_json)
+    jobs = report.get("jobs") or []
+    job = jobs[0] if jobs and isinstance(jobs[0], dict) else {}
+    results = job.get("validationResult")
+    if isinstance(results, dict):
+        results = [results]
+    entries = []
+    for vr in results or []:
+        if not isinstance(vr, dict):
+            continue
+        details = vr.get("details") or {}
+        entry = {
+            "profile": vr.get("profileName"),
+            "compliant": bool(vr.get("compliant", vr.get("isCompliant"))),
+            "rules": {"passed": details.get("passedRules"), "failed": details.get("failedRules")},
+            "checks": {"passed": details.get("passedChecks"), "failed": details.get("failedChecks")},
+        }
+        if failed_rules:
+            entry["failed_rules"] = [
+                {
+                    "specification": rule.get("specification"),
+                    "clause": rule.get("clause"),
+                    "test_number": rule.get("testNumber"),
+                    "description": rule.get("description"),
+                    "object": rule.get("object"),
+                    "failed_checks": rule.get("failedChecks"),
+                }
+                for rule in details.get("ruleSummaries") or []
+                if isinstance(rule, dict) and str(rule.get("status", rule.get("ruleStatus", ""))).lower() != "passed"
+            ]
+        entries.append(entry)
+    error = job.get("taskException") or job.get("processingError")
+    if error:
+        entries.append({"error": error})
+    return entries
+
+# ───── PDF-Struktur (reiner Python-Leser: Anhänge und XMP ohne Subprozess) ─────
+# Reads trailer, xref and only the objects that are needed from a memory-mapped file
+EXTRACT_XML_MAX_MB = int(os.environ.get('EXTRACT_XML_MAX_MB', '50'))
+
+# Attachment names of the e-invoice standards (ZUGFeRD 1/2, Factur-X, XRechnung), lower case
+_INVOICE_ATTACHMENT_NAMES = ('factur-x.xml', 'zugferd-invoice.xml', 'xrechnung.xml', 'zugferd_invoice.xml')
+
+_PDF_WS_RE = re.compile(rb'(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*')
+_PDF_NAME_RE = re.compile(rb'/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)')
+_PDF_NUMBER_RE = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_PDF_REF_RE = re.compile(rb'[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+_PDF_KEYWORD_RE = re.compile(rb'[a-zA-Z]+')
+_PDF_OBJ_RE = re.compile(rb'[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj\b')
+_PDF_OBJ_SCAN_RE = re.compile(rb'(?<!\d)(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj\b')
+_PDF_XREF_SUBSECTION_RE = re.compile(rb'[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)')
+_PDF_XREF_ENTRY_RE = re.compile(rb'[\x00\t\n\x0c\r ]*(\d{1,10})[\x00\t\n\x0c\r ]+(\d{1,5})[\x00\t\n\x0c\r ]+([nf])')
+_PDF_STRING_ESCAPES = {ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b', ord('f'): b'\f',
+                       ord('('): b'(', ord(')'): b')', ord('\\'): b'\\'}
+# The spec puts startxref within the last 1024 bytes. The 4 KB window also accepts up to 3 KB of junk
+# appended after %%EOF (mail gateways, padding); a file with more junk gets its xref rebuilt by scanning.
+_PDF_TAIL_WINDOW = 4096
+
+class PdfError(Exception):
+    """PDF cannot be read; error is a stable code like PreflightError.error."""
+
+    def __init__(self, error: str, message: str):
+        super().__init__(message)
+        self.error = error
+        self.message = message
+
+class PdfRef:
+    __slots__ = ('num', 'gen')
+
+    def __init__(self, num: int, gen: int):
+        self.num = num
+        self.gen = gen
+
+class PdfStream:
+    """Stream object: its dictionary and the position of the raw data in the file (read lazily)."""
+    __slots__ = ('dict', 'data', 'start', 'length')
+
+    def __init__(self, stream_dict: dict, data, start: int, length: int):
+        self.dict = stream_dict
+        self.data = data
+        self.start = start
+        self.length = length
+
+    def raw(self) -> bytes:
+        return bytes(self.data[self.start:self.start + self.length])
+
+def _pdf_skip_ws(data, pos: int) -> int:
+    return _PDF_WS_RE.match(data, pos).end()
+
+def _pdf_parse_literal_string(data, pos: int) -> tuple[bytes, int]:
+    """Literal string starting after '(' with nested parentheses and escapes."""
+    out = bytearray()
+    depth = 1
+    end = len(data)
+    while pos < end:
+        c = data[pos]
+        pos += 1
+        if c == 0x5c:  # backslash
+            if pos >= end:
+                break
+            e = data[pos]
+            pos += 1
+            if e in _PDF_STRING_ESCAPES:
+                out += _PDF_STRING_ESCAPES[e]
+            elif 0x30 <= e <= 0x37:
+                digits = bytes([e])
+                while len(digits) < 3 and pos < end and 0x30 <= data[pos] <= 0x37:
+                    digits += bytes([data[pos]])
+                    pos += 1
+                out.append(int(digits, 8) & 0xff)
+            elif e == 0x0d:
+                if pos < end and data[pos] == 0x0a:
+                    pos += 1
+            elif e != 0x0a:
+                out.append(e)
+        elif c == 0x28:
+            depth += 1
+            out.append(c)
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return bytes(out), pos
+            out.append(c)
+        else:
+            out.append(c)
+    raise PdfError('pdf_parse_error', "Unvollständiger String im PDF.")
+
+def _pdf_parse_object(data, pos: int, depth: int = 0):
+    """(value, end position) of the direct object at pos: dict (str keys), list, str (name), bytes, number, PdfRef."""
+    if depth > 64:
+        raise PdfError('pdf_parse_error', "PDF-Objekt zu tief verschachtelt.")
+    pos = _pdf_skip_ws(data, pos)
+    head = bytes(data[pos:pos + 2])
+    if head == b'<<':
+        result = {}
+        pos += 2
+        while True:
+            pos = _pdf_skip_ws(data, pos)
+            if data[pos:pos + 2] == b'>>':
+                return result, pos + 2
+            key = _PDF_NAME_RE.match(data, pos)
+            if key is None:
+                raise PdfError('pdf_parse_error', f"Ungültiges Dictionary bei Offset {pos}.")
+            value, pos = _pdf_parse_object(data, key.end(), depth + 1)
+            result[_pdf_name(key.group(1))] = value
+    if head[:1] == b'[':
+        result = []
+        pos += 1
+        while True:
+            pos = _pdf_skip_ws(data, pos)
+            if data[pos:pos + 1] == b']':
+                return result, pos + 1
+            value, pos = _pdf_parse_object(data, pos, depth + 1)
+            result.append(value)
+    if head[:1] == b'/':
+        name = _PDF_NAME_RE.match(data, pos)
+        return _pdf_name(name.group(1)), name.end()
+    if head[:1] == b'(':
+        return _pdf_parse_literal_string(data, pos + 1)
+    if head[:1] == b'<':
+        end = data.find(b'>', pos)
+        if end < 0:
+            raise PdfError('pdf_parse_error', "Unvollständiger Hex-String im PDF.")
+        digits = re.sub(rb'[^0-9a-fA-F]', b'', bytes(data[pos + 1:end]))
+        return bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode('ascii')), end + 1
+    number = _PDF_NUMBER_RE.match(data, pos)
+    if number is not None:
+        text = number.group(0)
+        if b'.' in text:
+            return float(text), number.end()
+        ref = _PDF_REF_RE.match(data, number.end())
+        if ref is not None:
+            return PdfRef(int(text), int(ref.group(1))), ref.end()
+        return int(text), number.end()
+    keyword = _PDF_KEYWORD_RE.match(data, pos)
+    if keyword is not None and keyword.group(0) in (b'true', b'false', b'null'):
+        return {b'true': True, b'false': False, b'null': None}[keyword.group(0)], keyword.end()
+    raise PdfError('pdf_parse_error', f"Unerwartetes Token bei Offset {pos}.")
+
+def _pdf_name(raw: bytes) -> str:
+    if b'#' in raw:
+        raw = re.sub(rb'#([0-9a-fA-F]{2})', lambda m: bytes([int(m.group(1), 16)]), raw)
+    return raw.decode('latin-1')
+
+def _pdf_png_unpredict(data: bytes, columns: int, colors: int, bits: int) -> bytes:
+    bpp = max(1, colors * bits // 8)
+    row_len = (columns * colors * bits + 7) // 8
+    out = bytearray()
+    prev = bytearray(row_len)
+    for i in range(0, len(data), row_len + 1):
+        kind = data[i]
+        row = bytearray(data[i + 1:i + 1 + row_len])
+        for x in range(len(row)):
+            left = row[x - bpp] if x >= bpp else 0
+            up = prev[x]
+            if kind == 1:
+                row[x] = (row[x] + left) & 0xff
+            elif kind == 2:
+                row[x] = (row[x] + up) & 0xff
+            elif kind == 3:
+                row[x] = (row[x] + ((left + up) >> 1)) & 0xff
+            elif kind == 4:
+                up_left = prev[x - bpp] if x >= bpp else 0
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                row[x] = (row[x] + (left if pa <= pb and pa <= pc else up if pb <= pc else up_left)) & 0xff
+        out += row
+        prev = row
+    return bytes(out)
+
+class PdfDocument:
+    """
+    Minimal read-only PDF parser: classic xref tables, xref streams (incl. hybrid files), object
+    streams and the Flate/ASCIIHex/ASCII85 filters. A damaged xref falls back to scanning for
+    `n g obj`. Use as context manager; objects are parsed on first access.
+    """
+
+    def __init__(self, path: str, max_stream_bytes: int = EXTRACT_XML_MAX_MB * 1024 * 1024):
+        self.max_stream_bytes = max_stream_bytes
+        self._file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise PdfError('not_a_pdf', "Datei ist leer.")
+        self._offsets: dict[int, Optional[tuple]] = {}
+        self._cache: dict[int, object] = {}
+        self._objstms: dict[int, tuple[bytes, dict[int, int]]] = {}
+        self.xref_repaired = False
+        try:
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self):
+        if self.data.find(b'%PDF-', 0, _PDF_HEADER_WINDOW) < 0:
+            raise PdfError('not_a_pdf', "Datei ist kein PDF (kein %PDF-Header).")
+        try:
+            self.trailer = self._read_xref_chain()
+        except (PdfError, IndexError, ValueError):
+            self.trailer = None
+        if not isinstance(self.trailer, dict) or 'Root' not in self.trailer:
+            self.trailer = self._rebuild_xref()
+            self.xref_repaired = True
+        if 'Encrypt' in self.trailer:
+            raise PdfError('encrypted_pdf', "PDF ist verschlüsselt.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+    # --- xref ---
+
+    def _read_xref_chain(self) -> Optional[dict]:
+        tail_start = max(0, len(self.data) - _PDF_TAIL_WINDOW)
+        startxref = self.data.rfind(b'startxref', tail_start)
+        if startxref < 0:
+            raise PdfError('pdf_parse_error', "Kein startxref gefunden.")
+        offset, _ = _pdf_parse_object(self.data, startxref + len(b'startxref'))
+        trailer = None
+        seen = set()
+        while isinstance(offset, int) and offset not in seen:
+            seen.add(offset)
+            section = self._read_xref_section(offset)
+            if trailer is None:
+                trailer = section
+            offset = section.get('Prev')
+        return trailer
+
+    def _read_xref_section(self, offset: int) -> dict:
+        """Adds the section's entries (older sections never override newer ones) and returns its trailer."""
+        pos = _pdf_skip_ws(self.data, offset)
+        if self.data[pos:pos + 4] != b'xref':
+            return self._read_xref_stream(pos)
+        pos += 4
+        entries = []
+        while True:
+            header = _PDF_XREF_SUBSECTION_RE.match(self.data, pos)
+            if header is None:
+                break
+            first, count = int(header.group(1)), int(header.group(2))
+            pos = header.end()
+            for num in range(first, first + count):
+                entry = _PDF_XREF_ENTRY_RE.match(self.data, pos)
+                if entry is None:
+                    raise PdfError('pdf_parse_error', f"Ungültige xref-Tabelle bei Offset {pos}.")
+                pos = entry.end()
+                entries.append((num, ('offset', int(entry.group(1))) if entry.group(3) == b'n' else None))
+        pos = _pdf_skip_ws(self.data, pos)
+        if self.data[pos:pos + 7] != b'trailer':
+            raise PdfError('pdf_parse_error', "Kein trailer nach der xref-Tabelle.")
+        trailer, _ = _pdf_parse_object(self.data, pos + 7)
+        if isinstance(trailer.get('XRefStm'), int):
+            # Hybrid file: objects in object streams are only listed in the xref stream
+            self._read_xref_stream(trailer['XRefStm'])
+        for num, entry in entries:
+            self._offsets.setdefault(num, entry)
+        return trailer
+
+    def _read_xref_stream(self, offset: int) -> dict:
+        stream = self._parse_indirect(offset)
+        if not isinstance(stream, PdfStream) or stream.dict.get('Type') != 'XRef':
+            raise PdfError('pdf_parse_error', f"Kein xref an Offset {offset}.")
+        widths = stream.dict.get('W') or []
+        if len(widths) != 3:
+            raise PdfError('pdf_parse_error', "xref-Stream ohne gültiges /W.")
+        data = self.decode_stream(stream)
+        index = stream.dict.get('Index') or [0, stream.dict.get('Size', 0)]
+        row_len = sum(widths)
+        pos = 0
+        for first, count in zip(index[0::2], index[1::2]):
+            for num in range(first, first + count):
+                row = data[pos:pos + row_len]
+                pos += row_len
+                if len(row) < row_len:
+                    break
+                fields, start = [], 0
+                for width in widths:
+                    fields.append(int.from_bytes(row[start:start + width], 'big'))
+                    start += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self._offsets.setdefault(num, ('offset', fields[1]))
+                elif kind == 2:
+                    self._offsets.setdefault(num, ('objstm', fields[1], fields[2]))
+                elif kind == 0:
+                    self._offsets.setdefault(num, None)
+        return stream.dict
+
+    def _rebuild_xref(self) -> dict:
+        """Damaged or missing xref: every `n g obj` in the file, the last definition wins."""
+        self._offsets.clear()
+        self._cache.clear()
+        for match in _PDF_OBJ_SCAN_RE.finditer(self.data):
+            self._offsets[int(match.group(1))] = ('offset', match.start())
+        trailer_pos = self.data.rfind(b'trailer')
+        if trailer_pos >= 0:
+            with contextlib.suppress(PdfError, IndexError):
+                trailer, _ = _pdf_parse_object(self.data, trailer_pos + 7)
+                if isinstance(trailer, dict) and 'Root' in trailer:
+                    return trailer
+        for num in list(self._offsets):
+            with contextlib.suppress(PdfError, IndexError):
+                obj = self.get(num)
+                if isinstance(obj, PdfStream) and obj.dict.get('Type') == 'XRef' and 'Root' in obj.dict:
+                    return obj.dict
+                if isinstance(obj, dict) and obj.get('Type') == 'Catalog':
+                    return {'Root': PdfRef(num, 0)}
+        raise PdfError('pdf_parse_error', "PDF-Struktur nicht lesbar (kein Trailer/Katalog gefunden).")
+
+    # --- objects ---
+
+    def _parse_indirect(self, offset: int):
+        header = _PDF_OBJ_RE.match(self.data, offset)
+        if header is None:
+            raise PdfError('pdf_parse_error', f"Kein Objekt an Offset {offset}.")
+        value, pos = _pdf_parse_object(self.data, header.end())
+        pos = _pdf_skip_ws(self.data, pos)
+        if isinstance(value, dict) and self.data[pos:pos + 6] == b'stream':
+            pos += 6
+            if self.data[pos:pos + 2] == b'\r\n':
+                pos += 2
+            elif self.data[pos:pos + 1] in (b'\n', b'\r'):
+                pos += 1
+            length = value.get('Length')
+            if isinstance(length, PdfRef):
+                length = self.resolve(length)
+            end = pos + length if isinstance(length, int) else -1
+            if end < pos or _pdf_skip_ws(self.data, end) != self.data.find(b'endstream', end, end + 64):
+                # Wrong /Length (common in generated PDFs): up to the next endstream
+                end = self.data.find(b'endstream', pos)
+                if end < 0:
+                    raise PdfError('pdf_parse_error', f"Stream ohne endstream bei Offset {pos}.")
+                while end > pos and self.data[end - 1] in b'\r\n':
+                    end -= 1
+            return PdfStream(value, self.data, pos, end - pos)
+        return value
+
+    def get(self, num: int):
+        if num in self._cache:
+            return self._cache[num]
+        entry = self._offsets.get(num)
+        if entry is None:
+            value = None
+        elif entry[0] == 'offset':
+            value = self._parse_indirect(entry[1])
+        else:
+            value = self._objstm_object(entry[1], entry[2], num)
+        self._cache[num] = value
+        return value
+
+    def _objstm_object(self, stm_num: int, index: int, num: int):
+        if stm_num not in self._objstms:
+            stream = self.get(stm_num)
+            if not isinstance(stream, PdfStream):
+                raise PdfError('pdf_parse_error', f"Objekt-Stream {stm_num} fehlt.")
+            data = self.decode_stream(stream)
+            first = stream.dict.get('First', 0)
+            numbers = re.findall(rb'\d+', data[:first])
+            offsets = {int(n): first + int(o) for n, o in zip(numbers[0::2], numbers[1::2])}
+            self._objstms[stm_num] = (data, offsets)
+        data, offsets = self._objstms[stm_num]
+        if num not in offsets:
+            raise PdfError('pdf_parse_error', f"Objekt {num} fehlt im Objekt-Stream {stm_num}.")
+        return _pdf_parse_object(data, offsets[num])[0]
+
+    def resolve(self, value, depth: int = 0):
+        while isinstance(value, PdfRef):
+            if depth > 32:
+                raise PdfError('pdf_parse_error', "Zyklische Objekt-Referenzen im PDF.")
+            value = self.get(value.num)
+            depth += 1
+        return value
+
+    def decode_stream(self, stream: PdfStream) -> bytes:
+        """Raw stream data run through its filters; aborts beyond max_stream_bytes (compression bombs)."""
+        filters = self.resolve(stream.dict.get('Filter'))
+        params = self.resolve(stream.dict.get('DecodeParms'))
+        if not isinstance(filters, list):
+            filters = [filters] if filters else []
+        if not isinstance(params, list):
+            params = [params] * len(filters)
+        data = stream.raw()
+        for name, parms in zip(filters, params):
+            parms = self.resolve(parms) or {}
+            if name in ('FlateDecode', 'Fl'):
+                inflater = zlib.decompressobj()
+                try:
+                    decoded = inflater.decompress(data, self.max_stream_bytes + 1)
+                except zlib.error as e:
+                    raise PdfError('pdf_parse_error', f"Stream nicht dekomprimierbar: {e}")
+                if len(decoded) > self.max_stream_bytes:
+                    raise PdfError('stream_too_large', f"Stream größer als {self.max_stream_bytes // (1024 * 1024)} MB.")
+                data = decoded
+                if parms.get('Predictor', 1) >= 10:
+                    data = _pdf_png_unpredict(data, parms.get('Columns', 1), parms.get('Colors', 1),
+                                              parms.get('BitsPerComponent', 8))
+                elif parms.get('Predictor', 1) != 1:
+                    raise PdfError('unsupported_filter', f"Predictor {parms.get('Predictor')} nicht unterstützt.")
+            elif name in ('ASCIIHexDecode', 'AHx'):
+                digits = re.sub(rb'[^0-9a-fA-F]', b'', data.split(b'>', 1)[0])
+                data = bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode('ascii'))
+            elif name in ('ASCII85Decode', 'A85'):
+                body = re.sub(rb'\s', b'', data)
+                body = body[2:] if body.startswith(b'<~') else body
+                data = base64.a85decode(body.split(b'~>', 1)[0])
+            else:
+                raise PdfError('unsupported_filter', f"Stream-Filter {name} nicht unterstützt.")
+        return data
+
+    # --- document structure ---
+
+    @property
+    def catalog(self) -> dict:
+        catalog = self.resolve(self.trailer.get('Root'))
+        if not isinstance(catalog, dict):
+            raise PdfError('pdf_parse_error', "PDF-Katalog fehlt.")
+        return catalog
+
+    def xmp(self) -> Optional[bytes]:
+        metadata = self.resolve(self.catalog.get('Metadata'))
+        return self.decode_stream(metadata) if isinstance(metadata, PdfStream) else None
+
+    def attachments(self) -> list[dict]:
+        """Embedded files from the EmbeddedFiles name tree and the catalog's /AF, each file once."""
+        found, seen = [], set()
+        names = self.resolve(self.catalog.get('Names'))
+        tree = self.resolve(names.get('EmbeddedFiles')) if isinstance(names, dict) else None
+        specs = [spec for _, spec in self._name_tree(tree)] if isinstance(tree, dict) else []
+        af = self.resolve(self.catalog.get('AF'))
+        specs += af if isinstance(af, list) else []
+        for spec_ref in specs:
+            spec = self.resolve(spec_ref)
+            if not isinstance(spec, dict):
+                continue
+            ef = self.resolve(spec.get('EF'))
+            stream_ref = (ef.get('UF') or ef.get('F')) if isinstance(ef, dict) else None
+            key = stream_ref.num if isinstance(stream_ref, PdfRef) else id(spec)
+            if key in seen:
+                continue
+            seen.add(key)
+            stream = self.resolve(stream_ref)
+            if not isinstance(stream, PdfStream):
+                continue
+            name = _pdf_text(self.resolve(spec.get('UF')) or self.resolve(spec.get('F')) or b'')
+            params = self.resolve(stream.dict.get('Params'))
+            found.append({
+                "name": name,
+                "relationship": self.resolve(spec.get('AFRelationship')),
+                "mime_type": self.resolve(stream.dict.get('Subtype')),
+                "size": params.get('Size') if isinstance(params, dict) else None,
+                "stream": stream,
+            })
+        return found
+
+    def _name_tree(self, node: dict, depth: int = 0):
+        if depth > 32:
+            return
+        entries = self.resolve(node.get('Names')) or []
+        for i in range(0, len(entries) - 1, 2):
+            yield self.resolve(entries[i]), entries[i + 1]
+        for kid in self.resolve(node.get('Kids')) or []:
+            kid = self.resolve(kid)
+            if isinstance(kid, dict):
+                yield from self._name_tree(kid, depth + 1)
+
+def _pdf_text(value) -> str:
+    """PDF text string (UTF-16BE with BOM, UTF-8 with BOM or PDFDocEncoding ≈ latin-1)."""
+    if isinstance(value, str):
+        return value
+    if value.startswith(b'\xfe\xff'):
+        return value[2:].decode('utf-16-be', errors='replace')
+    if value.startswith(b'\xef\xbb\xbf'):
+        return value[3:].decode('utf-8', errors='replace')
+    return value.decode('latin-1')
+
+_XMP_PDFAID_NS = 'http://www.aiim.org/pdfa/ns/id/'
+# Factur-X / ZUGFeRD 1.x / 2.x extension schemas share the local names
+_XMP_INVOICE_FIELDS = {'DocumentType': 'document_type', 'DocumentFileName': 'document_file_name',
+                       'Version': 'version', 'ConformanceLevel': 'conformance_level'}
+
+def _xmp_metadata(xmp: Optional[bytes]) -> dict:
+    """pdfaid (part/conformance) and the Factur-X/ZUGFeRD invoice schema from an XMP packet."""
+    result = {"pdfaid": None, "invoice": None}
+    if not xmp:
+        return result
+    try:
+        root = ET.fromstring(xmp)
+    except ET.ParseError:
+        return result
+    pdfaid, invoice = {}, {}
+    for elem in root.iter():
+        values = [(elem.tag, (elem.text or '').strip())] + list(elem.attrib.items())
+        for tag, value in values:
+            if not value or '}' not in tag:
+                continue
+            ns, local = tag[1:].split('}', 1)
+            if ns == _XMP_PDFAID_NS and local in ('part', 'conformance', 'amd'):
+                pdfaid.setdefault(local, value)
+            elif 'CrossIndustryDocument' in ns and local in _XMP_INVOICE_FIELDS:
+                invoice.setdefault(_XMP_INVOICE_FIELDS[local], value)
+                invoice.setdefault('namespace', ns)
+    result["pdfaid"] = pdfaid or None
+    result["invoice"] = invoice or None
+    return result
+
+# ───── Endpunkt: eingebettete Rechnung auslesen (/extract_xml, ohne JVM) ─────
+@app.route('/extract_xml', methods=['POST'])
+def extract_xml():
+    """
+    Liest die eingebettete Rechnung (factur-x.xml, zugferd-invoice.xml, xrechnung.xml, ...) direkt
+    aus dem PDF, ohne Subprozess.
+
+    Accepts:
+      - multipart/form-data with field 'file'
+      - application/pdf raw body
+
+    Returns:
+      - 200 JSON with the XML, detected profile/syntax, XMP pdfaid and Factur-X metadata, attachments
+      - 200 raw XML if Accept: application/xml
+      - 422 if the PDF cannot be read or contains no invoice XML
+    """
+    ctype = request.content_type or ''
+    if not (ctype.startswith('multipart/form-data') or ctype == 'application/pdf'):
+        abort(400, f"Content-Type muss application/pdf oder multipart/form-data sein (war: '{ctype}')")
+
+    with _request_workspace() as tmp:
+        input_path = os.path.join(tmp, 'input.pdf')
+        if ctype.startswith('multipart/form-data'):
+            upload = _spool_request_files({'file': input_path}).get('file')
+            if upload is None:
+                abort(400, "Kein File-Feld 'file' gefunden")
+        else:
+            upload = _spool_body(input_path)
+        if upload.size == 0:
+            abort(400, "Upload ist leer.")
+
+        body, status = _extract_invoice_xml(input_path)
+
+    if status == 200 and request.accept_mimetypes.best_match(['application/json', 'application/xml']) == 'application/xml':
+        resp = send_file(io.BytesIO(body.pop("xml_bytes")), mimetype='application/xml', as_attachment=True,
+                         download_name=os.path.basename(body["filename"]) or 'invoice.xml')
+        if body.get("profile"):
+            resp.headers['X-Invoice-Profile'] = body["profile"]
+        return resp
+    body.pop("xml_bytes", None)
+    return jsonify(body), status
+
+def _extract_invoice_xml(path: str) -> tuple[dict, int]:
+    """Body for /extract_xml; the raw XML is under "xml_bytes" (removed before serializing)."""
+    try:
+        with _timed('parse'), PdfDocument(path) as pdf:
+            metadata = _xmp_metadata(pdf.xmp())
+            attachments = pdf.attachments()
+            invoice = _pick_invoice_attachment(attachments)
+            xml = pdf.decode_stream(invoice["stream"]) if invoice is not None else None
+            repaired = pdf.xref_repaired
+    except PdfError as e:
+        app.logger.error(f"/extract_xml: PDF nicht lesbar ({e.error}): {e.message}")
+        return {"ok": False, "error": e.error, "message": e.message}, 422
+    except (IndexError, ValueError, TypeError, AttributeError) as e:
+        # Objects of unexpected types in a damaged PDF
+        app.logger.error(f"/extract_xml: PDF-Struktur nicht lesbar: {e!r}")
+        return {"ok": False, "error": "pdf_parse_error", "message": f"PDF-Struktur nicht lesbar: {e}"}, 422
+
+    listing = [{k: v for k, v in a.items() if k != "stream"} for a in attachments]
+    if invoice is None:
+        return {"ok": False, "error": "no_embedded_invoice",
+                "message": "PDF enthält keine eingebettete Rechnungs-XML.",
+                "attachments": listing, "xmp": metadata}, 422
+
+    try:
+        with _timed('preflight'):
+            detected = _preflight_xml(io.BytesIO(xml), header_only=True)
+        xml_error = None
+    except PreflightError as e:
+        detected, xml_error = {}, {"error": e.error, "message": e.message}
+    if xml.startswith((b'\xff\xfe', b'\xfe\xff')):
+        # Odd length or lone surrogates in a damaged attachment: replace like the UTF-8 branch
+        text = xml.decode('utf-16', errors='replace')
+    else:
+        text = xml.decode('utf-8-sig', errors='replace')
+
+    body = {
+        "ok": True,
+        "filename": invoice["name"],
+        "size": len(xml),
+        "syntax": detected.get("syntax"),
+        "guideline_id": detected.get("guideline_id"),
+        "profile": detected.get("profile"),
+        "xmp": metadata,
+        "attachments": listing,
+        "xml": text,
+        "xml_bytes": xml,
+    }
+    if xml_error:
+        body["xml_error"] = xml_error
+    if repaired:
+        body["xref_repaired"] = True
+    return body, 200
+
+def _pick_invoice_attachment(attachments: list[dict]) -> Optional[dict]:
+    """Standard invoice file name first, else the only/first XML attachment."""
+    for wanted in _INVOICE_ATTACHMENT_NAMES:
+        for attachment in attachments:
+            if attachment["name"].lower() == wanted:
+                return attachment
+    for attachment in attachments:
+        if attachment["name"].lower().endswith('.xml') or attachment["mime_type"] in ('text/xml', 'application/xml'):
+            return attachment
+    return None
+
+# ───── veraPDF Micro-Batching (ein JVM-Start für gleichzeitige Requests) ─────
+# Requests arriving within the window share one `verapdf` run (1 = every request runs alone)
+VERAPDF_BATCH_WINDOW_MS = int(os.environ.get('VERAPDF_BATCH_WINDOW_MS', '25'))
+VERAPDF_BATCH_MAX = int(os.environ.get('VERAPDF_BATCH_MAX', '8'))
+VERAPDF_BATCH_EXTRA_TIMEOUT = 60
+
+class _VeraPDFRequest:
+    def __init__(self, path: str, background: bool):
+        self.path = path
+        self.background = background
+        self.done = threading.Event()
+        self.result: Optional[tuple] = None
+        self.error: Optional[BaseException] = None
+
+class VeraPDFCoalescer:
+    """
+    Collects concurrent veraPDF validations: the first request of a window waits up to
+    window_seconds (or until max_batch requests have arrived) and then starts one `verapdf` run for
+    all files. The JSON report is split per file (jobs[] plus its own batchSummary). Only requests
+    with the same report options share a run.
+    """
+
+    def __init__(self, window_seconds: float, max_batch: int):
+        self.window_seconds = window_seconds
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._pending: dict[tuple, list[_VeraPDFRequest]] = {}
+
+    def validate(self, path: str, options: tuple = ()) -> tuple[subprocess.CompletedProcess, Optional[dict]]:
+        """
+        Returns (CompletedProcess of the veraPDF run, report for this file or None if it could not
+        be parsed/split). options are extra `verapdf` arguments (_VERAPDF_REPORT_OPTIONS).
+        Raises like _run_tool and ToolOverloaded from admission control.
+        """
+        req = _VeraPDFRequest(path, getattr(_admission_local, 'background', False))
+        started = time.perf_counter()
+        with self._cond:
+            pending = self._pending.setdefault(options, [])
+            pending.append(req)
+            leader = len(pending) == 1
+            if len(pending) >= self.max_batch:
+                self._cond.notify_all()
+            if leader:
+                deadline = time.monotonic() + self.window_seconds
+                while len(pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending.pop(options)
+        if leader:
+            _add_timing('coalesce', time.perf_counter() - started)
+            self._run_batch(batch, options)
+        else:
+            req.done.wait()
+            _add_timing('coalesce', time.perf_counter() - started)
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _run_batch(self, batch: list[_VeraPDFRequest], options: tuple):
+        try:
+            paths = [r.path for r in batch]
+            cmd = self._cmd(paths, options)
+            # A batch with background members waits for a slot instead of being shed
+            background = _background_admission() if any(r.background for r in batch) else contextlib.nullcontext()
+            with background, _admission.gate('verapdf').admit(sum(os.path.getsize(p) for p in paths)):
+                result = _run_tool('verapdf', cmd, timeout=self._timeout(paths), env=_verapdf_env(),
+                                   owned=len(batch) == 1)
+            VERAPDF_BATCH_SIZE.observe(len(paths))
+
+            reports = self._split(result, paths, compact=(options == _VERAPDF_COMPACT_OPTIONS))
+            for r in batch:
+                r.result = (result, reports.get(r.path))
+        except BaseException as e:
+            for r in batch:
+                r.error = e
+        finally:
+            for r in batch:
+                r.done.set()
+
+    @staticmethod
+    def _cmd(paths: list[str], options: tuple) -> list[str]:
+        # veraPDF JSON report to stdout
+        cmd = ["verapdf", "--format", "json", *options, *paths]
+        app.logger.info(f"veraPDF /validate_pdfa: Führe Befehl aus ({len(paths)} Datei(en)): {' '.join(cmd)}")
+        return cmd
+
+    @staticmethod
+    def _timeout(paths: list[str]) -> int:
+        return 180 + VERAPDF_BATCH_EXTRA_TIMEOUT * (len(paths) - 1)
+
+    @staticmethod
+    def _split(result: ToolResult, paths: list[str], compact: bool = False) -> dict[str, dict]:
+        """{path: report} from the run's JSON output; empty if it could not be parsed."""
+        hook = _verapdf_drop_checks if compact else None
+        with _timed('parse'):
+            report_json = _try_parse_json_file(result.stdout_path, hook)
+            if report_json is None:
+                # Some versions might write to stderr; try that as fallback
+                report_json = _try_parse_json_file(result.stderr_path, hook)
+            return _split_verapdf_report(report_json, paths) if report_json is not None else {}
+
+def _split_verapdf_report(report_json: dict, paths: list[str]) -> dict[str, dict]:
+    """
+    {path: report} with one job per file; a single-file run is returned unchanged. Jobs are matched
+    on itemDetails.name, falling back to argument order when veraPDF reports one job per file.
+    """
+    if len(paths) == 1:
+        return {paths[0]: report_json}
+    report = report_json.get("report", report_json)
+    jobs = report.get("jobs") or []
+    by_name = {(job.get("itemDetails") or {}).get("name"): job for job in jobs if isinstance(job, dict)}
+    reports = {}
+    for index, path in enumerate(paths):
+        job = by_name.get(path)
+        if job is None and len(jobs) == len(paths):
+            job = jobs[index]
+        if job is None:
+            continue
+        single = {k: v for k, v in report.items() if k not in ("jobs", "batchSummary")}
+        single["jobs"] = [job]
+        single["batchSummary"] = _verapdf_job_summary(job)
+        reports[path] = {**report_json, "report": single} if "report" in report_json else single
+    return reports
+
+def _verapdf_job_summary(job: dict) -> dict:
+    """batchSummary for a single job, computed from its own validationResult."""
+    vr = job.get("validationResult")
+    failed = not isinstance(vr, dict) or bool(job.get("taskException") or job.get("processingError"))
+    compliant = not failed and bool(vr.get("isCompliant"))
+    return {
+        "totalJobs": 1,
+        "multiJob": False,
+        "validationSummary": {
+            "totalJobCount": 1,
+            "successfulJobCount": 0 if failed else 1,
+            "failedJobCount": 1 if failed else 0,
+            "compliantPdfaCount": 1 if compliant else 0,
+            "nonCompliantPdfaCount": 0 if (failed or compliant) else 1,
+        },
+    }
+
+_verapdf_coalescer = VeraPDFCoalescer(VERAPDF_BATCH_WINDOW_MS / 1000, VERAPDF_BATCH_MAX)
+
+# ───── Pipeline: PDF + XML → PDF/A-3 → ZUGFeRD → Validierung ─────
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', '4'))
+_PIPELINE_SKIPPABLE = ('convert_pdfa3', 'validate', 'validate_pdfa')
+_PIPELINE_RESPONSES = ('json', 'multipart')
+
+# Runs the second validation of each pipeline request next to the one in the request thread
+_pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='pipeline')
+
+@app.route('/pipeline/zugferd', methods=['POST'])
+def pipeline_zugferd():
+    """
+    convert_pdfa3 → embed_xml → validate + validate_pdfa (parallel) in einem Arbeitsverzeichnis.
+
+    Erwartet multipart/form-data mit 'pdf_file' und 'xml_file' (wie /embed_xml).
+    Query-Parameter:
+      - format / version / profile wie /embed_xml
+      - skip: kommagetrennte Stufen, die ausgelassen werden (convert_pdfa3, validate, validate_pdfa)
+      - response: json (Default, Report + Download-Link /jobs/<id>/result) | multipart (Report + PDF)
+    Status 200, wenn alle ausgeführten Validierungen ok sind, sonst 422.
+    """
+    skip = {stage.strip() for stage in request.args.get('skip', '').split(',') if stage.strip()}
+    unknown = skip.difference(_PIPELINE_SKIPPABLE)
+    if unknown:
+        abort(400, f"Unbekannte Stufe(n) in skip: {', '.join(sorted(unknown))} (erlaubt: {', '.join(_PIPELINE_SKIPPABLE)})")
+    response_mode = request.args.get('response', 'json')
+    if response_mode not in _PIPELINE_RESPONSES:
+        abort(400, f"Ungültiger response '{response_mode}' (erlaubt: {', '.join(_PIPELINE_RESPONSES)})")
+    if response_mode == 'json' and _job_store is None:
+        return jsonify({"ok": False, "error": "jobs_unavailable",
+                        "message": f"Job-Speicher {JOBS_DIR} nicht verfügbar, response=multipart verwenden."}), 503
+
+    fmt, version, profile = _embed_xml_params()
+
+    with _request_workspace() as tmp:
+        source_pdf = os.path.join(tmp, 'source.pdf')
+        xml_path = os.path.join(tmp, 'invoice.xml')
+        uploads = _spool_request_files({'pdf_file': source_pdf, 'xml_file': xml_path})
+        if 'pdf_file' not in uploads or 'xml_file' not in uploads:
+            abort(400, "Fehlende Dateien: 'pdf_file' und 'xml_file' werden benötigt.")
+        if uploads['pdf_file'].size == 0:
+            abort(400, "Hochgeladene PDF-Datei ist leer.")
+        if uploads['xml_file'].size == 0:
+            abort(400, "Hochgeladene XML-Datei ist leer.")
+        profile = _preflight_embed_inputs(source_pdf, xml_path, profile)
+        download_name = _embed_xml_download_name(fmt, version, profile)
+
+        app.logger.info(f"Pipeline /pipeline/zugferd: Starte (format={fmt}, version={version}, "
+                        f"profile={profile}, skip={sorted(skip)})")
+        stages = {}
+        pdf_path = source_pdf
+        if 'convert_pdfa3' in skip:
+            stages['convert_pdfa3'] = {"skipped": True}
+        else:
+            started = time.monotonic()
+            skip_gs, check = _pdfa3_skip_check(source_pdf, CONVERT_PDFA3_MODE, uploads['pdf_file'].sha256)
+            if not skip_gs:
+                pdf_path = os.path.join(tmp, 'pdfa3.pdf')
+                _convert_pdfa3_file(source_pdf, pdf_path)
+            stages['convert_pdfa3'] = {"conversion": 'skipped' if skip_gs else 'converted', "check": check,
+                                       "elapsed_ms": int((time.monotonic() - started) * 1000)}
+
+        started = time.monotonic()
+        # Named like the download, so the Mustang report shows the file name the client gets
+        out_path = os.path.join(tmp, download_name)
+        _embed_xml_file(pdf_path, xml_path, out_path, fmt, version, profile)
+        stages['embed_xml'] = {"elapsed_ms": int((time.monotonic() - started) * 1000)}
+
+        stages.update(_pipeline_validations(out_path, skip))
+        ok = all(stage.get("ok", True) for stage in stages.values())
+        report = {
+            "ok": ok,
+            "format": fmt,
+            "version": version,
+            "profile": profile,
+            "filename": download_name,
+            "stages": stages,
+        }
+        status = 200 if ok else 422
+
+        if response_mode == 'multipart':
+            boundary = uuid.uuid4().hex
+            # The open handle keeps the PDF readable after the workspace is removed
+            pdf_file = open(out_path, 'rb')
+            return app.response_class(
+                _pipeline_multipart(report, pdf_file, download_name, boundary),
+                status=status, mimetype=f'multipart/mixed; boundary={boundary}'
+            )
+
+        job = _store_pipeline_result(out_path, download_name, report)
+        report["download_url"] = f"/jobs/{job['id']}/result"
+        report["expires"] = _iso_utc(job['expires'])
+        return jsonify(report), status
+
+def _pipeline_validations(pdf_path: str, skip: set) -> dict:
+    """Mustang and veraPDF on the final PDF, in parallel; returns the stage entries."""
+    content_sha256 = _file_sha256(pdf_path)
+    size = os.path.getsize(pdf_path)
+    checks = {
+        'validate': lambda: _cached_validation(content_sha256, [os.path.basename(pdf_path)], pdf_path, size),
+        'validate_pdfa': lambda: _cached_result(
+            'validate_pdfa', content_sha256, [], lambda: _validate_with_verapdf(pdf_path)),
+    }
+    pending = [name for name in checks if name not in skip]
+    futures = {name: _pipeline_executor.submit(checks[name]) for name in pending[1:]}
+    try:
+        results = {name: checks[name]() for name in pending[:1]}
+    finally:
+        # The caller removes the workspace afterwards: no submitted check may still be reading pdf_path
+        for future in futures.values():
+            future.cancel()
+        wait(futures.values())
+    results.update({name: future.result() for name, future in futures.items()})
+
+    stages = {}
+    for name in checks:
+        if name not in results:
+            stages[name] = {"skipped": True}
+            continue
+        status, payload, cache_state = results[name]
+        stages[name] = {"ok": status == 200, "http_status": status, "cache": cache_state,
+                        "result": json.loads(payload)}
+    return stages
+
+def _pipeline_multipart(report: dict, pdf_file, download_name: str, boundary: str):
+    """multipart/mixed body: JSON report, then the PDF streamed from the open file."""
+    try:
+        yield (f"--{boundary}\r\nContent-Type: application/json\r\n\r\n").encode('ascii')
+        yield json.dumps(report, ensure_ascii=False).encode('utf-8') + b"\r\n"
+        yield (f"--{boundary}\r\nContent-Type: application/pdf\r\n"
+               f"Content-Disposition: attachment; filename=\"{download_name}\"\r\n\r\n").encode('utf-8')
+        for chunk in iter(lambda: pdf_file.read(_SPOOL_CHUNK), b''):
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode('ascii')
+    finally:
+        pdf_file.close()
+
+def _store_pipeline_result(pdf_path: str, download_name: str, report: dict) -> dict:
+    """Keeps the PDF as a finished job, downloadable via /jobs/<id>/result until JOBS_RESULT_TTL."""
+    job_id = uuid.uuid4().hex
+    job_dir = _job_store.job_dir(job_id)
+    os.makedirs(job_dir)
+    try:
+        result_path = os.path.join(job_dir, 'output.pdf')
+        shutil.copyfile(pdf_path, result_path)
+        params = {key: report[key] for key in ('format', 'version', 'profile')}
+        _job_store.create(job_id, 'pipeline_zugferd', params, None)
+        now = time.time()
+        _job_store.update(job_id, state='done', started=now, finished=now, expires=now + JOBS_RESULT_TTL,
+                          http_status=200, result_path=result_path, result_name=download_name)
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    return _job_store.get(job_id)
+
+# ───── Batch-Validierung (NDJSON-Stream) ─────
+VALIDATE_BATCH_WORKERS = int(os.environ.get('VALIDATE_BATCH_WORKERS', '4'))
+VALIDATE_BATCH_MAX_DOCUMENT_MB = int(os.environ.get('VALIDATE_BATCH_MAX_DOCUMENT_MB', '100'))
+_BATCH_MODES = {
+    'validate': ('validate',),
+    'validate_pdfa': ('validate_pdfa',),
+    'both': ('validate', 'validate_pdfa'),
+}
+
+# Shared by all batch requests, so concurrent batches don't multiply the tool processes
+_batch_executor = ThreadPoolExecutor(max_workers=VALIDATE_BATCH_WORKERS, thread_name_prefix='batch')
+
+@app.route('/validate_batch', methods=['POST'])
+def validate_batch():
+    """
+    Validiert viele Dokumente in einem Request.
+
+    Erwartet:
+      - multipart/form-data mit beliebig vielen Feldern 'file', ODER
+      - application/zip (Rohdaten im Body)
+
+    Query-Parameter 'mode': validate (Mustang, Default) | validate_pdfa (veraPDF, nur PDFs) | both
+
+    Liefert application/x-ndjson: eine Zeile pro Dokument, sobald es fertig ist,
+    und abschließend eine Zeile {"summary": {...}}.
+    """
+    mode = request.args.get('mode', 'validate')
+    if mode not in _BATCH_MODES:
+        abort(400, f"Ungültiger mode '{mode}' (erlaubt: {', '.join(_BATCH_MODES)})")
+
+    ctype = request.content_type or ''
+    is_zip = ctype in ('application/zip', 'application/x-zip-compressed')
+    # Extracted ZIP size is unknown up front → disk
+    workspace = _workspaces.allocate(None if is_zip else request.content_length)
+    batch_dir = workspace.path
+    try:
+        if ctype.startswith('multipart/form-data'):
+            documents = _spool_batch_files(batch_dir)
+            # Reads the body up to the end of the first file part; the rest is read while results stream
+            first = next(documents, None)
+            if first is None:
+                abort(400, "Kein File-Feld 'file' gefunden")
+            documents = itertools.chain([first], documents)
+        elif is_zip:
+            zip_path = os.path.join(batch_dir, 'batch.zip')
+            _spool_body(zip_path)
+            if not zipfile.is_zipfile(zip_path):
+                abort(400, "Body ist kein gültiges ZIP-Archiv.")
+            documents = _zip_documents(zip_path, batch_dir)
+        else:
+            abort(400, f"Content-Type muss multipart/form-data oder application/zip sein (war: '{ctype}')")
+    except BaseException:
+        workspace.release()
+        raise
+
+    app.logger.info(f"Batch /validate_batch: Starte (mode={mode})")
+    resp = app.response_class(
+        stream_with_context(_stream_batch_results(documents, _BATCH_MODES[mode], workspace)),
+        mimetype='application/x-ndjson'
+    )
+    # Also when the client disconnects before the stream started
+    resp.call_on_close(workspace.release)
+    return resp
+
+def _batch_document_name(name: Optional[str], index: int) -> str:
+    """Last path component of a part or ZIP entry name; '.', '..' and empty names become document-<index>."""
+    name = (name or '').replace('\\', '/').rsplit('/', 1)[-1]
+    if name in ('', '.', '..') or '\0' in name:
+        return f"document-{index}"
+    return name
+
+def _spool_batch_files(batch_dir: str):
+    """
+    Yields (name, upload) for each 'file' part as soon as it is on disk (<batch_dir>/<index>/<name>),
+    reading the body only as far as needed. Runs in the batch producer thread, outside the request
+    context, so the stream and boundary are taken from the request up front.
+    """
+    stream = request.stream
+    boundary = request.mimetype_params.get('boundary')
+
+    def target(field, filename, index):
+        if field != 'file':
+            return None
+        doc_dir = os.path.join(batch_dir, str(index))
+        os.mkdir(doc_dir)
+        return os.path.join(doc_dir, _batch_document_name(filename, index))
+
+    spooler = _MultipartSpooler(boundary, target)
+    emitted = 0
+    try:
+        while True:
+            chunk = stream.read(_SPOOL_CHUNK)
+            done = spooler.feed(chunk) or not chunk
+            while emitted < len(spooler.uploads) and spooler.uploads[emitted].closed:
+                upload = spooler.uploads[emitted]
+                emitted += 1
+                yield os.path.basename(upload.path), upload
+            if done:
+                break
+    finally:
+        spooler.close()
+
+def _zip_documents(zip_path: str, batch_dir: str):
+    """Yields (name, upload) for each file in the ZIP, extracting one entry at a time (upload None if too large)."""
+    with zipfile.ZipFile(zip_path) as zf:
+        index = 0
+        for info in zf.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+            name = _batch_document_name(info.filename, index)
+            doc_dir = os.path.join(batch_dir, str(index))
+            os.mkdir(doc_dir)
+            index += 1
+            if info.file_size > VALIDATE_BATCH_MAX_DOCUMENT_MB * 1024 * 1024:
+                yield name, None
+                continue
+            upload = SpooledUpload(os.path.join(doc_dir, name), filename=name)
+            try:
+                with zf.open(info) as src:
+                    upload.copy_from(src)
+            finally:
+                upload.close()
+            yield name, upload
+
+def _validate_batch_document(index: int, name: str, upload: Optional[SpooledUpload], checks: tuple[str, ...]) -> dict:
+    started = time.monotonic()
+    line = {"index": index, "name": name}
+    if upload is None:
+        line.update(outcome="error", error="too_large",
+                    message=f"Dokument größer als {VALIDATE_BATCH_MAX_DOCUMENT_MB} MB")
+        return line
+    if upload.size == 0:
+        line.update(outcome="error", error="empty", message="Dokument ist leer.")
+        return line
+
+    filename = _with_document_extension(name, upload.head)
+    path = os.path.join(os.path.dirname(upload.path), filename)
+    os.rename(upload.path, path)
+    statuses = []
+    for check in checks:
+        if check == 'validate':
+            status, payload, cache_state = _cached_validation(upload.sha256, [filename], path, upload.size)
+        elif filename.endswith('.pdf'):
+            status, payload, cache_state = _cached_result(
+                'validate_pdfa', upload.sha256, [], lambda: _validate_with_verapdf(path))
+        else:
+            line[check] = {"skipped": True, "reason": "not_a_pdf"}
+            continue
+        statuses.append(status)
+        line[check] = {"http_status": status, "cache": cache_state, "result": json.loads(payload)}
+
+    if any(st not in _CACHEABLE_STATUS for st in statuses):
+        line["outcome"] = "error"
+    elif any(st == 422 for st in statuses):
+        line["outcome"] = "invalid"
+    else:
+        line["outcome"] = "ok"
+    line["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+    return line
+
+def _stream_batch_results(documents, checks: tuple[str, ...], workspace: Workspace):
+    """
+    Feeds documents to the batch executor (at most 2x workers in flight, so neither memory nor
+    the result backlog grows with the batch size) and yields NDJSON lines in completion order.
+    """
+    started = time.monotonic()
+    results: "queue.Queue[Optional[dict]]" = queue.Queue()
+    slots = threading.Semaphore(VALIDATE_BATCH_WORKERS * 2)
+    cancelled = threading.Event()
+    submitted = [0]
+
+    def work(index, name, upload):
+        try:
+            with _background_admission():
+                line = _validate_batch_document(index, name, upload, checks)
+        except Exception as e:
+            app.logger.exception(f"Batch /validate_batch: Fehler bei {name}")
+            line = {"index": index, "name": name, "outcome": "error", "error": "internal", "message": str(e)}
+        finally:
+            if upload is not None:
+                shutil.rmtree(os.path.dirname(upload.path), ignore_errors=True)
+        results.put(line)
+
+    def produce():
+        try:
+            for index, (name, upload) in enumerate(documents):
+                while not slots.acquire(timeout=1):
+                    if cancelled.is_set():
+                        return
+                if cancelled.is_set():
+                    return
+                submitted[0] += 1
+                _batch_executor.submit(work, index, name, upload)
+        except Exception as e:
+            app.logger.exception("Batch /validate_batch: Lesen der Dokumente fehlgeschlagen")
+            results.put({"outcome": "error", "error": "batch_read_error", "message": str(e)})
+        finally:
+            results.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    counts = {"total": 0, "ok": 0, "invalid": 0, "error": 0}
+    try:
+        producer_done = False
+        received = 0
+        while not producer_done or received < submitted[0]:
+            line = results.get()
+            if line is None:
+                producer_done = True
+                continue
+            if "index" in line:
+                received += 1
+                slots.release()
+                counts["total"] += 1
+            counts[line["outcome"]] += 1
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        counts["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+        app.logger.info(f"Batch /validate_batch: Fertig {counts}")
+        yield json.dumps({"summary": counts}) + "\n"
+    finally:
+        cancelled.set()
+        workspace.release()
+
+# ───── Asynchrone Jobs (/jobs/<operation>) ─────
+# Job table (SQLite) + per-job directories; survives restarts when JOBS_DIR is on the /work volume
+JOBS_DIR = os.environ.get('JOBS_DIR', '/work/jobs')
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', '2'))
+JOBS_RESULT_TTL = int(os.environ.get('JOBS_RESULT_TTL', '86400'))
+JOBS_CALLBACK_TIMEOUT = float(os.environ.get('JOBS_CALLBACK_TIMEOUT', '10'))
+JOBS_CALLBACK_RETRIES = int(os.environ.get('JOBS_CALLBACK_RETRIES', '3'))
+# Hosts that may receive job callbacks (comma-separated, exact host names); empty disables callbacks
+JOBS_CALLBACK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.environ.get('JOBS_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip())
+_JOB_OPERATIONS = ('convert_pdfa3', 'embed_xml', 'validate', 'validate_pdfa')
+_JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+_JOB_SWEEP_INTERVAL = 60
+
+class JobStore:
+    """SQLite-backed job table. Inputs and file results live in <base_dir>/<job id>/."""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            operation TEXT NOT NULL,
+            state TEXT NOT NULL,
+            params TEXT NOT NULL,
+            callback_url TEXT,
+            callback_state TEXT,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            expires REAL,
+            http_status INTEGER,
+            result_json BLOB,
+            result_path TEXT,
+            result_name TEXT,
+            error TEXT
+        )
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self.db_path = os.path.join(base_dir, 'jobs.sqlite3')
+        with self._db() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(self._SCHEMA)
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)')
+
+    @contextlib.contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.base_dir, job_id)
+
+    def create(self, job_id: str, operation: str, params: dict, callback_url: Optional[str]):
+        with self._db() as db:
+            db.execute(
+                'INSERT INTO jobs (id, operation, state, params, callback_url, created) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, operation, 'queued', json.dumps(params), callback_url, time.time())
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._db() as db:
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['expires'] is not None and job['expires'] < time.time():
+            return None
+        return job
+
+    def update(self, job_id: str, **fields):
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._db() as db:
+            db.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def requeue_interrupted(self) -> list[str]:
+        """Jobs that were queued or running when the service stopped are run again."""
+        with self._db() as db:
+            db.execute("UPDATE jobs SET state = 'queued', started = NULL WHERE state = 'running'")
+            rows = db.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY created").fetchall()
+        return [row['id'] for row in rows]
+
+    def delete_expired(self) -> int:
+        with self._db() as db:
+            rows = db.execute('SELECT id FROM jobs WHERE expires IS NOT NULL AND expires < ?',
+                              (time.time(),)).fetchall()
+            ids = [row['id'] for row in rows]
+            db.executemany('DELETE FROM jobs WHERE id = ?', [(i,) for i in ids])
+        for job_id in ids:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return len(ids)
+
+try:
+    _job_store: Optional[JobStore] = JobStore(JOBS_DIR)
+except (OSError, sqlite3.Error) as e:
+    app.logger.warning(f"Job-API deaktiviert, {JOBS_DIR} nicht nutzbar: {e}")
+    _job_store = None
+
+_job_executor = ThreadPoolExecutor(max_workers=JOBS_WORKERS, thread_name_prefix='job')
+
+def _iso_utc(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+def _job_public(job: dict) -> dict:
+    public = {
+        "id": job['id'],
+        "operation": job['operation'],
+        "state": job['state'],
+        "created": _iso_utc(job['created']),
+        "started": _iso_utc(job['started']),
+        "finished": _iso_utc(job['finished']),
+        "expires": _iso_utc(job['expires']),
+        "http_status": job['http_status'],
+        "error": job['error'],
+        "status_url": f"/jobs/{job['id']}",
+        "result_url": f"/jobs/{job['id']}/result" if job['state'] in ('done', 'failed') else None,
+    }
+    if job['callback_url']:
+        public["callback"] = {"url": job['callback_url'], "state": job['callback_state']}
+    return public
+
+def _save_job_inputs(operation: str, input_dir: str) -> dict:
+    """Spools the request inputs to input_dir and returns the job params; aborts with 400 like the sync endpoints."""
+    ctype = request.content_type or ''
+    params: dict = {}
+
+    if operation == 'embed_xml':
+        fmt, version, profile = _embed_xml_params()
+        pdf_path = os.path.join(input_dir, 'source.pdf')
+        xml_path = os.path.join(input_dir, 'invoice.xml')
+        uploads = _spool_request_files({'pdf_file': pdf_path, 'xml_file': xml_path})
+        if 'pdf_file' not in uploads or 'xml_file' not in uploads:
+            abort(400, "Fehlende Dateien: 'pdf_file' und 'xml_file' werden benötigt.")
+        if uploads['pdf_file'].size == 0:
+            abort(400, "Hochgeladene PDF-Datei ist leer.")
+        if uploads['xml_file'].size == 0:
+            abort(400, "Hochgeladene XML-Datei ist leer.")
+        params.update(format=fmt, version=version, profile=_preflight_embed_inputs(pdf_path, xml_path, profile))
+        return params
+
+    if operation == 'validate_pdfa':
+        params.update(report=_verapdf_report_mode())
+    elif operation == 'convert_pdfa3':
+        params.update(mode=_convert_pdfa3_mode())
+
+    raw_types = ('application/pdf', 'application/xml', 'text/xml') if operation == 'validate' else ('application/pdf',)
+    filename = 'invoice'
+    upload_path = os.path.join(input_dir, 'upload')
+    if ctype.startswith('multipart/form-data'):
+        upload = _spool_request_files({'file': upload_path}).get('file')
+        if upload is None:
+            abort(400, "Kein File-Feld 'file' gefunden")
+        filename = os.path.basename(upload.filename or '') or filename
+    elif ctype in raw_types:
+        filename += '.pdf' if ctype == 'application/pdf' else '.xml'
+        upload = _spool_body(upload_path)
+    else:
+        abort(400, f"Content-Type muss multipart/form-data oder {' / '.join(raw_types)} sein (war: '{ctype}')")
+
+    if upload.size == 0:
+        abort(400, "Upload ist leer.")
+    if operation == 'validate':
+        filename = _with_document_extension(filename, upload.head)
+    else:
+        filename = 'input.pdf'
+    os.rename(upload_path, os.path.join(input_dir, filename))
+    params.update(filename=filename, sha256=upload.sha256, size=upload.size)
+    return params
+
+@app.route('/jobs/<operation>', methods=['POST'])
+def create_job(operation):
+    """
+    Startet convert_pdfa3, embed_xml, validate oder validate_pdfa asynchron.
+    Eingaben wie beim jeweiligen synchronen Endpunkt; optional ?callback_url=... (POST bei Abschluss).
+    Antwort 202 mit Job-ID; Status über GET /jobs/<id>, Ergebnis über GET /jobs/<id>/result.
+    """
+    if operation not in _JOB_OPERATIONS:
+        abort(404, f"Unbekannte Operation '{operation}' (erlaubt: {', '.join(_JOB_OPERATIONS)})")
+    if _job_store is None:
+        return jsonify({"ok": False, "error": "jobs_unavailable", "message": f"Job-Speicher {JOBS_DIR} nicht verfügbar."}), 503
+
+    callback_url = request.args.get('callback_url') or None
+    if callback_url:
+        _check_callback_url(callback_url)
+
+    job_id = uuid.uuid4().hex
+    job_dir = _job_store.job_dir(job_id)
+    os.makedirs(os.path.join(job_dir, 'in'))
+    try:
+        params = _save_job_inputs(operation, os.path.join(job_dir, 'in'))
+        _job_store.create(job_id, operation, params, callback_url)
+    except BaseException:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    _job_executor.submit(_run_job, job_id)
+    app.logger.info(f"Job {job_id}: {operation} eingereiht")
+    resp = jsonify({"ok": True, "job": _job_public(_job_store.get(job_id))})
+    resp.status_code = 202
+    resp.headers['Location'] = f"/jobs/{job_id}"
+    return resp
+
+def _get_job_or_404(job_id: str) -> dict:
+    job = _job_store.get(job_id) if (_job_store is not None and _JOB_ID_RE.fullmatch(job_id)) else None
+    if job is None:
+        abort(404, "Job nicht gefunden oder abgelaufen.")
+    return job
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    return jsonify({"ok": True, "job": _job_public(_get_job_or_404(job_id))}), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = _get_job_or_404(job_id)
+    if job['state'] in ('queued', 'running'):
+        return jsonify({"ok": False, "error": "job_not_finished", "job": _job_public(job)}), 409
+    if job['state'] == 'failed':
+        return jsonify({"ok": False, "error": "job_failed", "message": job['error']}), job['http_status'] or 500
+    if job['result_path']:
+        return send_file(job['result_path'], mimetype='application/pdf', as_attachment=True,
+                         download_name=job['result_name'])
+    return app.response_class(job['result_json'], status=job['http_status'], mimetype='application/json')
+
+def _run_job(job_id: str):
+    job = _job_store.get(job_id)
+    if job is None or job['state'] != 'queued':
+        return
+    _job_store.update(job_id, state='running', started=time.time())
+    operation = job['operation']
+    params = json.loads(job['params'])
+    job_dir = _job_store.job_dir(job_id)
+    app.logger.info(f"Job {job_id}: {operation} gestartet")
+
+    try:
+        with _background_admission():
+            result = _execute_job(operation, params, job_dir)
+    except HTTPException as e:
+        result = dict(state='failed', http_status=e.code, error=e.description)
+    except Exception as e:
+        app.logger.exception(f"Job {job_id}: unerwarteter Fehler")
+        result = dict(state='failed', http_status=500, error=str(e))
+
+    finished = time.time()
+    _job_store.update(job_id, finished=finished, expires=finished + JOBS_RESULT_TTL, **result)
+    shutil.rmtree(os.path.join(job_dir, 'in'), ignore_errors=True)
+    app.logger.info(f"Job {job_id}: {operation} beendet ({result['state']}, HTTP {result['http_status']})")
+
+    if job['callback_url']:
+        _notify_job_callback(job_id)
+
+def _execute_job(operation: str, params: dict, job_dir: str) -> dict:
+    """Runs one job operation; returns the job columns to store (aborts like the sync endpoints)."""
+    input_dir = os.path.join(job_dir, 'in')
+    if operation in ('validate', 'validate_pdfa'):
+        input_path = os.path.join(input_dir, params['filename'])
+        if operation == 'validate':
+            status, payload, _ = _cached_validation(
+                params['sha256'], [params['filename']], input_path, params['size'])
+        else:
+            report = params.get('report', 'full')
+            status, payload, _ = _cached_result(
+                'validate_pdfa', params['sha256'], _verapdf_key_parts(report),
+                lambda: _validate_with_verapdf(input_path, report))
+        return dict(state='done', http_status=status, result_json=payload)
+    elif operation == 'convert_pdfa3':
+        inp = os.path.join(input_dir, params['filename'])
+        out = os.path.join(job_dir, 'output.pdf')
+        # Jobs queued before the fast path existed always converted
+        skip, _ = _pdfa3_skip_check(inp, params.get('mode', 'force'), params['sha256'])
+        if skip:
+            os.replace(inp, out)
+        else:
+            _convert_pdfa3_file(inp, out)
+        return dict(state='done', http_status=200, result_path=out, result_name='output_pdfa3.pdf')
+    else:
+        out = os.path.join(job_dir, 'output.pdf')
+        _embed_xml_file(os.path.join(input_dir, 'source.pdf'), os.path.join(input_dir, 'invoice.xml'), out,
+                        params['format'], params['version'], params['profile'])
+        return dict(state='done', http_status=200, result_path=out,
+                    result_name=_embed_xml_download_name(params['format'], params['version'], params['profile']))
+
+def _callback_host_allowed(callback_url: str) -> bool:
+    parts = urllib.parse.urlsplit(callback_url)
+    return parts.scheme in ('http', 'https') and (parts.hostname or '') in JOBS_CALLBACK_ALLOWED_HOSTS
+
+def _check_callback_url(callback_url: str):
+    """400 unless callback_url is http(s) on a host from JOBS_CALLBACK_ALLOWED_HOSTS (no SSRF into the network)."""
+    if urllib.parse.urlsplit(callback_url).scheme not in ('http', 'https'):
+        abort(400, "callback_url muss eine http(s)-URL sein.")
+    if not JOBS_CALLBACK_ALLOWED_HOSTS:
+        abort(400, "Callbacks sind deaktiviert (JOBS_CALLBACK_ALLOWED_HOSTS ist leer).")
+    if not _callback_host_allowed(callback_url):
+        abort(400, "Host der callback_url ist nicht in JOBS_CALLBACK_ALLOWED_HOSTS freigegeben.")
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """A redirect would lead the callback past the host allow-list; 3xx counts as a failed attempt."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+def _notify_job_callback(job_id: str):
+    job = _job_store.get(job_id)
+    if job is None:
+        return
+    if not _callback_host_allowed(job['callback_url']):
+        # Stored before the allow-list changed (jobs survive restarts)
+        app.logger.warning(f"Job {job_id}: Callback-Host nicht (mehr) freigegeben, kein Callback")
+        _job_store.update(job_id, callback_state='failed')
+        return
+    body = json.dumps({"ok": job['state'] == 'done', "job": _job_public(job)}).encode('utf-8')
+    req = urllib.request.Request(job['callback_url'], data=body, method='POST',
+                                 headers={'Content-Type': 'application/json', 'X-Job-Id': job_id})
+    for attempt in range(JOBS_CALLBACK_RETRIES):
+        try:
+            with _callback_opener.open(req, timeout=JOBS_CALLBACK_TIMEOUT) as resp:
+                resp.read(1024)
+            _job_store.update(job_id, callback_state='delivered')
+            return
+        except Exception as e:
+            app.logger.warning(f"Job {job_id}: Callback an {job['callback_url']} fehlgeschlagen "
+                               f"(Versuch {attempt + 1}/{JOBS_CALLBACK_RETRIES}): {e}")
+            if attempt < JOBS_CALLBACK_RETRIES - 1:
+                time.sleep(2 ** attempt)
+    _job_store.update(job_id, callback_state='failed')
+
+def _job_sweeper():
+    while True:
+        try:
+            removed = _job_store.delete_expired()
+            if removed:
+                app.logger.info(f"Jobs: {removed} abgelaufene Jobs entfernt")
+        except Exception as e:
+            app.logger.warning(f"Jobs: Aufräumen fehlgeschlagen: {e}")
+        time.sleep(_JOB_SWEEP_INTERVAL)
+
+if _job_store is not None:
+    for _pending_id in _job_store.requeue_interrupted():
+        _job_executor.submit(_run_job, _pending_id)
+    threading.Thread(target=_job_sweeper, daemon=True, name='job-sweeper').start()
+
+# ───── Hot-Folder (Massenverarbeitung über Verzeichnisse auf /work) ─────
+# <HOTFOLDER_DIR>/<operation>/inbox → outbox (Ergebnis + JSON-Report), Eingaben danach nach processed/ bzw. failed/
+HOTFOLDER_ENABLED = os.environ.get('HOTFOLDER_ENABLED', '0') == '1'
+HOTFOLDER_DIR = os.environ.get('HOTFOLDER_DIR', '/work/hotfolder')
+HOTFOLDER_OPERATIONS = tuple(op.strip() for op in os.environ.get(
+    'HOTFOLDER_OPERATIONS', 'validate,convert_pdfa3,embed_xml').split(',') if op.strip())
+HOTFOLDER_POLL_SECONDS = float(os.environ.get('HOTFOLDER_POLL_SECONDS', '2'))
+# Files younger than this are still being copied into the inbox and are left alone
+HOTFOLDER_SETTLE_SECONDS = float(os.environ.get('HOTFOLDER_SETTLE_SECONDS', '5'))
+HOTFOLDER_EMBED_FORMAT = os.environ.get('HOTFOLDER_EMBED_FORMAT', 'zf')
+HOTFOLDER_EMBED_VERSION = os.environ.get('HOTFOLDER_EMBED_VERSION', '2')
+# Empty = profile detected from the XML like /embed_xml without ?profile=
+HOTFOLDER_EMBED_PROFILE = os.environ.get('HOTFOLDER_EMBED_PROFILE', '')
+# Parallel files per tool; on top of that the tools' admission gates apply (waiting, never shedding)
+HOTFOLDER_CONCURRENCY = {
+    'mustang': int(os.environ.get('HOTFOLDER_MUSTANG_CONCURRENCY', '2')),
+    'gs': int(os.environ.get('HOTFOLDER_GS_CONCURRENCY', '2')),
+}
+_HOTFOLDER_TOOLS = {'validate': 'mustang', 'convert_pdfa3': 'gs', 'embed_xml': 'mustang'}
+# Submitted but unfinished files per tool; the rest stays in the inbox until the next scan
+_HOTFOLDER_BACKLOG_PER_WORKER = 4
+
+class HotFolderJournal:
+    """
+    SQLite journal of processed inbox entries. An entry counts as done for the same input
+    fingerprint (size + mtime), so a restart resumes without processing finished files again.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS hotfolder (
+            operation TEXT NOT NULL,
+            name TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            state TEXT NOT NULL,
+            started REAL,
+            finished REAL,
+            http_status INTEGER,
+            outputs TEXT,
+            error TEXT,
+            PRIMARY KEY (operation, name)
+        )
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._db() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(self._SCHEMA)
+
+    @contextlib.contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def is_done(self, operation: str, name: str, fingerprint: str) -> bool:
+        with self._db() as db:
+            row = db.execute('SELECT fingerprint, state FROM hotfolder WHERE operation = ? AND name = ?',
+                             (operation, name)).fetchone()
+        return row is not None and row['state'] == 'done' and row['fingerprint'] == fingerprint
+
+    def start(self, operation: str, name: str, fingerprint: str):
+        with self._db() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO hotfolder (operation, name, fingerprint, state, started) VALUES (?, ?, ?, ?, ?)',
+                (operation, name, fingerprint, 'running', time.time())
+            )
+
+    def finish(self, operation: str, name: str, state: str, http_status: int, outputs: list[str],
+               error: Optional[str]):
+        with self._db() as db:
+            db.execute(
+                'UPDATE hotfolder SET state = ?, finished = ?, http_status = ?, outputs = ?, error = ?'
+                ' WHERE operation = ? AND name = ?',
+                (state, time.time(), http_status, json.dumps(outputs), error, operation, name)
+            )
+
+    def counts(self) -> dict[str, dict[str, int]]:
+        with self._db() as db:
+            rows = db.execute('SELECT operation, state, COUNT(*) AS n FROM hotfolder GROUP BY operation, state').fetchall()
+        counts: dict[str, dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row['operation'], {})[row['state']] = row['n']
+        return counts
+
+class _HotFolderEntry:
+    """One unit of work: a file (validate, convert_pdfa3) or a PDF+XML pair with the same basename (embed_xml)."""
+
+    def __init__(self, operation: str, name: str, paths: list[str]):
+        self.operation = operation
+        self.name = name
+        self.paths = paths
+        stats = [os.stat(p) for p in paths]
+        self.fingerprint = ','.join(f"{st.st_size}:{st.st_mtime_ns}" for st in stats)
+        self.newest_mtime = max(st.st_mtime for st in stats)
+
+class HotFolder:
+    """
+    Polls the inboxes, runs each settled entry on the executor of its tool (bounded per tool) and
+    writes results to the outbox via temp file + rename: first the output PDF, then the JSON report,
+    so a report in the outbox always means the entry is complete.
+    """
+
+    def __init__(self, base_dir: str, operations: tuple[str, ...]):
+        unknown = [op for op in operations if op not in _HOTFOLDER_TOOLS]
+        if unknown:
+            raise ValueError(f"Unbekannte Hot-Folder-Operation(en): {', '.join(unknown)}")
+        self.base_dir = base_dir
+        self.operations = operations
+        for op in operations:
+            for sub in ('inbox', 'outbox', 'processed', 'failed', '.tmp'):
+                os.makedirs(os.path.join(base_dir, op, sub), exist_ok=True)
+        self.journal = HotFolderJournal(os.path.join(base_dir, 'journal.sqlite3'))
+        self._executors = {
+            tool: ThreadPoolExecutor(max_workers=max(1, n), thread_name_prefix=f'hotfolder-{tool}')
+            for tool, n in HOTFOLDER_CONCURRENCY.items()
+        }
+        self._lock = threading.Lock()
+        self._inflight: dict[str, set] = {tool: set() for tool in HOTFOLDER_CONCURRENCY}
+        self._wake = threading.Event()
+
+    def _dir(self, operation: str, sub: str) -> str:
+        return os.path.join(self.base_dir, operation, sub)
+
+    def start(self):
+        threading.Thread(target=self._scan_loop, daemon=True, name='hotfolder-scan').start()
+        app.logger.info(f"Hot-Folder: überwache {self.base_dir} ({', '.join(self.operations)})")
+
+    def _scan_loop(self):
+        while True:
+            try:
+                self.scan()
+            except Exception as e:
+                app.logger.warning(f"Hot-Folder: Scan fehlgeschlagen: {e}")
+            self._wake.wait(HOTFOLDER_POLL_SECONDS)
+            self._wake.clear()
+
+    def scan(self):
+        """Submits settled inbox entries until each tool's backlog is full."""
+        now = time.time()
+        for op in self.operations:
+            tool = _HOTFOLDER_TOOLS[op]
+            for entry in self._entries(op):
+                key = (op, entry.name)
+                with self._lock:
+                    if key in self._inflight[tool]:
+                        continue
+                    if len(self._inflight[tool]) >= HOTFOLDER_CONCURRENCY[tool] * _HOTFOLDER_BACKLOG_PER_WORKER:
+                        break
+                if now - entry.newest_mtime < HOTFOLDER_SETTLE_SECONDS:
+                    continue
+                if self.journal.is_done(op, entry.name, entry.fingerprint):
+                    # Finished before a restart, only the move out of the inbox was missing
+                    self._move_inputs(entry, 'processed')
+                    continue
+                with self._lock:
+                    self._inflight[tool].add(key)
+                self._executors[tool].submit(self._run, entry, tool)
+
+    def _entries(self, operation: str):
+        inbox = self._dir(operation, 'inbox')
+        files = sorted(e.name for e in os.scandir(inbox) if e.is_file() and not e.name.startswith('.'))
+        if operation != 'embed_xml':
+            for name in files:
+                with contextlib.suppress(FileNotFoundError):
+                    yield _HotFolderEntry(operation, name, [os.path.join(inbox, name)])
+            return
+        # PDF+XML pairs by basename; a half of a pair waits for the other one
+        by_stem: dict[str, dict[str, str]] = {}
+        for name in files:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in ('.pdf', '.xml'):
+                by_stem.setdefault(stem, {})[ext.lower()] = name
+        for stem, pair in by_stem.items():
+            if '.pdf' in pair and '.xml' in pair:
+                with contextlib.suppress(FileNotFoundError):
+                    yield _HotFolderEntry(operation, stem, [os.path.join(inbox, pair['.pdf']),
+                                                            os.path.join(inbox, pair['.xml'])])
+
+    def _run(self, entry: _HotFolderEntry, tool: str):
+        started = time.monotonic()
+        self.journal.start(entry.operation, entry.name, entry.fingerprint)
+        tmp_dir = os.path.join(self._dir(entry.operation, '.tmp'), uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        outputs: list[str] = []
+        try:
+            try:
+                with _background_admission():
+                    status, result, output = self._execute(entry, tmp_dir)
+                error = None
+            except HTTPException as e:
+                status, result, output, error = e.code, None, None, e.description
+            except Exception as e:
+                app.logger.exception(f"Hot-Folder: unerwarteter Fehler bei {entry.operation}/{entry.name}")
+                status, result, output, error = 500, None, None, str(e)
+
+            ok = status == 200
+            if output is not None:
+                outputs.append(self._publish(entry.operation, output, entry.name if entry.operation == 'embed_xml'
+                                             else os.path.splitext(entry.name)[0], '.pdf'))
+            report = {
+                "ok": ok,
+                "operation": entry.operation,
+                "inputs": [os.path.basename(p) for p in entry.paths],
+                "http_status": status,
+                "output": outputs[0] if outputs else None,
+                "finished": _iso_utc(time.time()),
+                "elapsed_ms": int((time.monotonic() - started) * 1000),
+            }
+            if result is not None:
+                report["result"] = result
+            if error:
+                report["error"] = error
+            report_path = os.path.join(tmp_dir, 'report.json')
+            with open(report_path, 'wb') as f:
+                f.write(app.json.dumps(report).encode('utf-8'))
+            outputs.append(self._publish(entry.operation, report_path, entry.name, '.json'))
+
+            # validate: a 422 is a finished validation (invalid invoice), timeouts and tool errors are not
+            state = 'done' if (ok or (entry.operation == 'validate' and status in _CACHEABLE_STATUS)) else 'failed'
+            self.journal.finish(entry.operation, entry.name, state, status, outputs, error)
+            self._move_inputs(entry, 'processed' if state == 'done' else 'failed')
+            app.logger.info(f"Hot-Folder: {entry.operation}/{entry.name} {state} (HTTP {status})")
+        except Exception as e:
+            # Entry stays 'running' in the journal and in the inbox; the next scan retries it
+            app.logger.exception(f"Hot-Folder: Ergebnis für {entry.operation}/{entry.name} nicht geschrieben: {e}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            with self._lock:
+                self._inflight[tool].discard((entry.operation, entry.name))
+            self._wake.set()
+
+    def _execute(self, entry: _HotFolderEntry, tmp_dir: str) -> tuple[int, Optional[dict], Optional[str]]:
+        """Returns (status, validation JSON or None, output file or None); aborts like the sync endpoints."""
+        if entry.operation == 'validate':
+            path = entry.paths[0]
+            if os.path.splitext(path)[1].lower() not in ('.pdf', '.xml'):
+                abort(400, "Nur .pdf- und .xml-Dateien können validiert werden.")
+            status, payload, _ = _cached_validation(
+                _file_sha256(path), [os.path.basename(path)], path, os.path.getsize(path))
+            return status, json.loads(payload), None
+        out = os.path.join(tmp_dir, 'output.pdf')
+        if entry.operation == 'convert_pdfa3':
+            skip, check = _pdfa3_skip_check(entry.paths[0], CONVERT_PDFA3_MODE)
+            if skip:
+                shutil.copyfile(entry.paths[0], out)
+            else:
+                _convert_pdfa3_file(entry.paths[0], out)
+            return 200, {"conversion": 'skipped' if skip else 'converted', "check": check}, out
+        else:
+            pdf_path, xml_path = entry.paths
+            profile = HOTFOLDER_EMBED_PROFILE or None
+            if profile:
+                profile = PROFILE_MAPPING.get(profile, profile)
+            profile = _preflight_embed_inputs(pdf_path, xml_path, profile)
+            _embed_xml_file(pdf_path, xml_path, out, HOTFOLDER_EMBED_FORMAT, HOTFOLDER_EMBED_VERSION, profile)
+        return 200, None, out
+
+    def _publish(self, operation: str, path: str, stem: str, ext: str) -> str:
+        """Moves a finished file into the outbox in one rename (same volume); returns its name there."""
+        name = stem + ext
+        os.replace(path, os.path.join(self._dir(operation, 'outbox'), name))
+        return name
+
+    def _move_inputs(self, entry: _HotFolderEntry, target: str):
+        for path in entry.paths:
+            with contextlib.suppress(FileNotFoundError):
+                os.replace(path, os.path.join(self._dir(entry.operation, target), os.path.basename(path)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = {tool: len(keys) for tool, keys in self._inflight.items()}
+        return {
+            "dir": self.base_dir,
+            "operations": list(self.operations),
+            "inflight": inflight,
+            "concurrency": dict(HOTFOLDER_CONCURRENCY),
+            "journal": self.journal.counts(),
+        }
+
+_hotfolder: Optional[HotFolder] = None
+if HOTFOLDER_ENABLED:
+    try:
+        _hotfolder = HotFolder(HOTFOLDER_DIR, HOTFOLDER_OPERATIONS)
+        _hotfolder.start()
+    except (OSError, sqlite3.Error, ValueError) as e:
+        app.logger.warning(f"Hot-Folder deaktiviert, {HOTFOLDER_DIR} nicht nutzbar: {e}")
+        _hotfolder = None
+
+@app.route('/hotfolder', methods=['GET'])
+def hotfolder_status():
+    """Hot-folder state: files in progress per tool and journal counts per operation and state."""
+    if _hotfolder is None:
+        return jsonify({"ok": True, "enabled": False}), 200
+    return jsonify({"ok": True, "enabled": True, **_hotfolder.stats()}), 200
+
+# ───── ASGI-Serving (uvicorn + a2wsgi: dieselben Flask-Views, Request-Body gestreamt) ─────
+# asgi = uvicorn mit asgi_app (Default), dev = Flask-Entwicklungsserver mit Debugger wie bisher
+SERVER_MODE = os.environ.get('SERVER_MODE', 'asgi')
+# Flask views run in this pool; a request holds its thread while its tool runs, admission control bounds the tools
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '64'))
+# Body bytes handed to the view's thread per hop (uvicorn delivers uploads in small messages)
+_ASGI_RECEIVE_BYTES = 4 * _SPOOL_CHUNK
+
+def _asgi_file_wrapper(file, buffer_size: int = 8192):
+    # send_file() reads in 8 KB blocks; larger blocks mean fewer thread hops per download
+    return FileWrapper(file, max(buffer_size, _SPOOL_CHUNK))
+
+def _asgi_wsgi_app(environ, start_response):
+    """
+    app.wsgi_app behind the adapter. The body is read from the ASGI receive channel only when a view
+    reads request.stream, so require_bearer_token and the 413 check answer before any upload byte.
+    """
+    if 'CONTENT_LENGTH' not in environ:
+        # Chunked upload: the adapter ends the stream, Werkzeug enforces MAX_CONTENT_LENGTH while reading
+        environ['wsgi.input_terminated'] = True
+    environ['wsgi.file_wrapper'] = _asgi_file_wrapper
+    return app.wsgi_app(environ, start_response)
+
+_asgi_wsgi = WSGIMiddleware(_asgi_wsgi_app, workers=ASGI_WSGI_THREADS)
+
+class _AsgiRequest:
+    """
+    Event loop of a request served via ASGI and the tool runs it owns. Once the body has been read,
+    a watcher waits for the client's disconnect and cancels those runs (_arun_process kills the group).
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.disconnected = False
+        self._runs: set[asyncio.Task] = set()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def run(self, coro, cancel_on_disconnect: bool = True):
+        """Called from the view's thread: runs coro on the loop and returns its result; ClientDisconnected if cancelled."""
+        if cancel_on_disconnect and self.disconnected:
+            coro.close()
+            raise ClientDisconnected()
+        # The task sees the view's Flask context, so _timed() still fills Server-Timing
+        context = contextvars.copy_context()
+
+        async def start():
+            task = context.run(self.loop.create_task, coro)
+            if cancel_on_disconnect:
+                self._runs.add(task)
+                task.add_done_callback(self._runs.discard)
+                if self.disconnected:
+                    task.cancel()
+            return await task
+        try:
+            return asyncio.run_coroutine_threadsafe(start(), self.loop).result()
+        except CancelledError:
+            raise ClientDisconnected()
+
+    def disconnect(self):
+        self.disconnected = True
+        for task in list(self._runs):
+            task.cancel()
+
+    def watch(self, receive):
+        """Starts waiting for http.disconnect (only after the last body message; the adapter never reads again)."""
+        async def watcher():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            self.disconnect()
+        self._watcher = self.loop.create_task(watcher())
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+# Set by asgi_app; a2wsgi copies the context into the view's thread, where _run_tool picks it up
+_asgi_request: "contextvars.ContextVar[Optional[_AsgiRequest]]" = contextvars.ContextVar('asgi_request', default=None)
+
+def _asgi_receive(receive, served: _AsgiRequest):
+    """
+    receive() for the adapter: gathers body messages up to _ASGI_RECEIVE_BYTES, since every message
+    costs the view's thread a hop to the event loop, and turns a disconnect into ClientDisconnected.
+    After the last body message the request starts watching for a disconnect.
+    """
+    async def next_message():
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            served.disconnect()
+            # Raised in the view's thread while it reads the body, so a cut-off upload is never processed
+            raise ClientDisconnected()
+        return message
+
+    async def receive_body():
+        message = await next_message()
+        parts, size = [message.get('body', b'')], len(message.get('body', b''))
+        while message.get('more_body', False) and size < _ASGI_RECEIVE_BYTES:
+            message = await next_message()
+            parts.append(message.get('body', b''))
+            size += len(parts[-1])
+        more_body = message.get('more_body', False)
+        if not more_body:
+            served.watch(receive)
+        return {'type': 'http.request', 'body': b''.join(parts), 'more_body': more_body}
+    return receive_body
+
+async def _asgi_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            app.logger.info(f"ASGI: bereit ({ASGI_WSGI_THREADS} WSGI-Threads)")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _asgi_wsgi.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def asgi_app(scope, receive, send):
+    """
+    ASGI entry point (uvicorn api_service:asgi_app); every route is the Flask view via a2wsgi, the
+    one-shot tool processes of a request are awaited on the event loop (_AsgiRequest).
+    """
+    if scope['type'] == 'lifespan':
+        await _asgi_lifespan(receive, send)
+    elif scope['type'] == 'http':
+        served = _AsgiRequest(asyncio.get_running_loop())
+        token = _asgi_request.set(served)
+        try:
+            await _asgi_wsgi(scope, _asgi_receive(receive, served), send)
+        finally:
+            _asgi_request.reset(token)
+            served.close()
+
+if __name__ == '__main__':
+    if SERVER_MODE == 'dev':
+        app.run(host='0.0.0.0', port=8080, debug=True)
+    else:
+        import uvicorn
+        # One process: worker pools, admission control and result cache live in this interpreter
+        uvicorn.run(asgi_app, host='0.0.0.0', port=8080, lifespan='on', log_level='info')
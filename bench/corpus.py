@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Generated benchmark corpus for bench/load.py: small and large invoices, byte-identical on every run.
+
+  small.xml / large.xml                  CII (EN16931), large = many line items
+  small.pdf / large.pdf                  plain PDFs (input for /convert_pdfa3 and /embed_xml)
+  small-zugferd.pdf / large-zugferd.pdf  the same with the XML embedded (EmbeddedFiles + AF + XMP),
+                                         input for /validate and /validate_pdfa
+
+The large PDFs carry uncompressed full-page images, like scanned invoices. The PDFs are
+structurally valid but not PDF/A compliant; veraPDF and Mustang report findings, which is
+fine for latency measurements.
+
+    python3 bench/corpus.py /tmp/corpus [--large-items 4000] [--large-pages 100]
+"""
+import argparse
+import os
+import re
+import sys
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cds', 'sample-invoice.xml')
+
+_LINE_ITEM = re.compile(r'(\s*<ram:IncludedSupplyChainTradeLineItem>.*?</ram:IncludedSupplyChainTradeLineItem>)', re.S)
+
+
+def invoice_xml(items: int) -> bytes:
+    """cds/sample-invoice.xml with its line item repeated `items` times (LineID 1..items)."""
+    with open(SAMPLE_XML, encoding='utf-8') as f:
+        xml = f.read()
+    item = _LINE_ITEM.search(xml).group(1)
+    lines = ''.join(item.replace('<ram:LineID>1</ram:LineID>', f'<ram:LineID>{i}</ram:LineID>')
+                    for i in range(1, items + 1))
+    return xml.replace(item, lines, 1).encode('utf-8')
+
+
+def _stream(entries: str, data: bytes) -> bytes:
+    return f'<< {entries} /Length {len(data)} >>\nstream\n'.encode('ascii') + data + b'\nendstream'
+
+
+def _page_content(page: int, image: bool) -> bytes:
+    ops = []
+    if image:
+        ops.append('q 595 0 0 842 0 0 cm /Im1 Do Q')
+    ops.append('BT /F1 10 Tf 50 800 Td 12 TL')
+    ops.append(f'(Rechnung BENCH-0001 - Seite {page}) Tj')
+    for line in range(1, 61):
+        ops.append(f"(Position {page}.{line}  Beratung  1 HUR  100.00 EUR  19% USt  Zwischensumme {page * line}.00) '")
+    ops.append('ET')
+    return '\n'.join(ops).encode('ascii')
+
+
+def _image(width: int = 800, height: int = 1100) -> bytes:
+    """Uncompressed RGB image with a deterministic gradient."""
+    rows = bytearray()
+    base = bytes(range(256)) * (width * 3 // 256 + 1)
+    for y in range(height):
+        offset = y % 256
+        rows += base[offset:offset + width * 3]
+    return bytes(rows)
+
+
+def invoice_pdf(pages: int, images: int = 0, xml: bytes = b'') -> bytes:
+    """Minimal PDF 1.7 with `pages` text pages; the first `images` pages get a full-page image."""
+    # 1 catalog, 2 pages, 3 font, 4 image, 5 metadata, 6 filespec, 7 embedded file, then page/content pairs
+    page_ids = [8 + 2 * i for i in range(pages)]
+    catalog = '/Type /Catalog /Pages 2 0 R /Metadata 5 0 R'
+    if xml:
+        catalog += ' /Names << /EmbeddedFiles << /Names [(factur-x.xml) 6 0 R] >> >> /AF [6 0 R]'
+    conformance = ('<pdfaid:part>3</pdfaid:part><pdfaid:conformance>B</pdfaid:conformance>'
+                   '<fx:DocumentType>INVOICE</fx:DocumentType><fx:DocumentFileName>factur-x.xml</fx:DocumentFileName>'
+                   '<fx:Version>1.0</fx:Version><fx:ConformanceLevel>EN 16931</fx:ConformanceLevel>') if xml else ''
+    xmp = ('<?xpacket begin="﻿" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+           '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+           '<rdf:Description rdf:about="" xmlns:pdfaid="http://www.aiim.org/pdfa/ns/id/"'
+           ' xmlns:fx="urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#"'
+           ' xmlns:dc="http://purl.org/dc/elements/1.1/">'
+           f'<dc:title><rdf:Alt><rdf:li xml:lang="x-default">BENCH-0001</rdf:li></rdf:Alt></dc:title>{conformance}'
+           '</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>').encode('utf-8')
+
+    objects = [
+        f'<< {catalog} >>'.encode('ascii'),
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode('ascii'),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        _stream('/Type /XObject /Subtype /Image /Width 800 /Height 1100 /ColorSpace /DeviceRGB /BitsPerComponent 8',
+                _image() if images else b''),
+        _stream('/Type /Metadata /Subtype /XML', xmp),
+        b'<< /Type /Filespec /F (factur-x.xml) /UF (factur-x.xml) /AFRelationship /Alternative'
+        b' /EF << /F 7 0 R /UF 7 0 R >> >>',
+        _stream(f'/Type /EmbeddedFile /Subtype /text#2Fxml /Params << /Size {len(xml)} >>', xml),
+    ]
+    for i in range(pages):
+        resources = '/Font << /F1 3 0 R >>' + (' /XObject << /Im1 4 0 R >>' if i < images else '')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << {resources} >>'
+                       f' /Contents {page_ids[i] + 1} 0 R >>'.encode('ascii'))
+        objects.append(_stream('', _page_content(i + 1, i < images)))
+
+    out = bytearray(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode('ascii') + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('ascii')
+    for offset in offsets:
+        out += f'{offset:010d} 00000 n \n'.encode('ascii')
+    file_id = '0123456789abcdef0123456789abcdef'
+    out += (f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /ID [<{file_id}> <{file_id}>] >>\n'
+            f'startxref\n{xref}\n%%EOF\n').encode('ascii')
+    return bytes(out)
+
+
+def generate(target_dir: str, large_items: int = 4000, large_pages: int = 100) -> dict[str, str]:
+    """Writes the corpus to target_dir. Returns {name: path}."""
+    os.makedirs(target_dir, exist_ok=True)
+    small_xml = invoice_xml(3)
+    large_xml = invoice_xml(large_items)
+    documents = {
+        'small.xml': lambda: small_xml,
+        'large.xml': lambda: large_xml,
+        'small.pdf': lambda: invoice_pdf(1),
+        'large.pdf': lambda: invoice_pdf(large_pages, images=4),
+        'small-zugferd.pdf': lambda: invoice_pdf(1, xml=small_xml),
+        'large-zugferd.pdf': lambda: invoice_pdf(large_pages, images=4, xml=large_xml),
+    }
+    paths = {}
+    for name, build in documents.items():
+        path = os.path.join(target_dir, name)
+        with open(path, 'wb') as f:
+            f.write(build())
+        paths[name] = path
+    return paths
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('target_dir')
+    parser.add_argument('--large-items', type=int, default=4000, help='line items in large.xml')
+    parser.add_argument('--large-pages', type=int, default=100, help='pages in large*.pdf')
+    args = parser.parse_args()
+    for name, path in generate(args.target_dir, args.large_items, args.large_pages).items():
+        print(f"{name:<20} {os.path.getsize(path) / 1024:>10.1f} KB  {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
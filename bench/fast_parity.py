@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Parity check of /validate?engine=fast against Mustang (engine=mustang) on a fixed corpus.
+
+The corpus is generated, byte-identical on every run: cds/sample-invoice.xml (CII, EN16931) and a
+UBL invoice, each valid and with deterministic rule violations (missing invoice number, wrong
+totals, unknown currency, wrong VAT category, schema error, XRechnung guideline). Every document
+goes to a running service twice; the script compares the summary status and the rules behind the
+error and warning findings (rule ID such as BR-CO-15 from the message text, "schema" for XSD
+findings). Message texts and XPath locations are not compared, they differ between the engines.
+
+    docker compose exec pdfa python3 /opt/mustang/bench/fast_parity.py
+    python3 bench/fast_parity.py --url http://localhost:8080 --token "$API_BEARER_TOKEN" --write-corpus /tmp/parity
+
+Exits 1 if a document differs or engine=fast fell back to Mustang.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import corpus  # noqa: E402
+
+XRECHNUNG_GUIDELINE = 'urn:cen.eu:en16931:2017#compliant#urn:xeinkauf.de:kosit:xrechnung_3.0'
+
+UBL_INVOICE = '''<?xml version="1.0" encoding="UTF-8"?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+         xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+         xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:CustomizationID>urn:cen.eu:en16931:2017</cbc:CustomizationID>
+  <cbc:ID>UBL-0001</cbc:ID>
+  <cbc:IssueDate>2025-01-01</cbc:IssueDate>
+  <cbc:DueDate>2025-01-31</cbc:DueDate>
+  <cbc:InvoiceTypeCode>380</cbc:InvoiceTypeCode>
+  <cbc:DocumentCurrencyCode>EUR</cbc:DocumentCurrencyCode>
+  <cac:AccountingSupplierParty>
+    <cac:Party>
+      <cac:PostalAddress>
+        <cbc:StreetName>Musterstraße 1</cbc:StreetName>
+        <cbc:CityName>Berlin</cbc:CityName>
+        <cbc:PostalZone>10115</cbc:PostalZone>
+        <cac:Country><cbc:IdentificationCode>DE</cbc:IdentificationCode></cac:Country>
+      </cac:PostalAddress>
+      <cac:PartyTaxScheme>
+        <cbc:CompanyID>DE123456789</cbc:CompanyID>
+        <cac:TaxScheme><cbc:ID>VAT</cbc:ID></cac:TaxScheme>
+      </cac:PartyTaxScheme>
+      <cac:PartyLegalEntity><cbc:RegistrationName>Beispiel Verkäufer GmbH</cbc:RegistrationName></cac:PartyLegalEntity>
+    </cac:Party>
+  </cac:AccountingSupplierParty>
+  <cac:AccountingCustomerParty>
+    <cac:Party>
+      <cac:PostalAddress>
+        <cbc:StreetName>Kaufweg 2</cbc:StreetName>
+        <cbc:CityName>München</cbc:CityName>
+        <cbc:PostalZone>80331</cbc:PostalZone>
+        <cac:Country><cbc:IdentificationCode>DE</cbc:IdentificationCode></cac:Country>
+      </cac:PostalAddress>
+      <cac:PartyLegalEntity><cbc:RegistrationName>Beispiel Käufer AG</cbc:RegistrationName></cac:PartyLegalEntity>
+    </cac:Party>
+  </cac:AccountingCustomerParty>
+  <cac:TaxTotal>
+    <cbc:TaxAmount currencyID="EUR">19.00</cbc:TaxAmount>
+    <cac:TaxSubtotal>
+      <cbc:TaxableAmount currencyID="EUR">100.00</cbc:TaxableAmount>
+      <cbc:TaxAmount currencyID="EUR">19.00</cbc:TaxAmount>
+      <cac:TaxCategory>
+        <cbc:ID>S</cbc:ID>
+        <cbc:Percent>19</cbc:Percent>
+        <cac:TaxScheme><cbc:ID>VAT</cbc:ID></cac:TaxScheme>
+      </cac:TaxCategory>
+    </cac:TaxSubtotal>
+  </cac:TaxTotal>
+  <cac:LegalMonetaryTotal>
+    <cbc:LineExtensionAmount currencyID="EUR">100.00</cbc:LineExtensionAmount>
+    <cbc:TaxExclusiveAmount currencyID="EUR">100.00</cbc:TaxExclusiveAmount>
+    <cbc:TaxInclusiveAmount currencyID="EUR">119.00</cbc:TaxInclusiveAmount>
+    <cbc:PayableAmount currencyID="EUR">119.00</cbc:PayableAmount>
+  </cac:LegalMonetaryTotal>
+  <cac:InvoiceLine>
+    <cbc:ID>1</cbc:ID>
+    <cbc:InvoicedQuantity unitCode="HUR">1</cbc:InvoicedQuantity>
+    <cbc:LineExtensionAmount currencyID="EUR">100.00</cbc:LineExtensionAmount>
+    <cac:Item>
+      <cbc:Name>Beratung</cbc:Name>
+      <cac:ClassifiedTaxCategory>
+        <cbc:ID>S</cbc:ID>
+        <cbc:Percent>19</cbc:Percent>
+        <cac:TaxScheme><cbc:ID>VAT</cbc:ID></cac:TaxScheme>
+      </cac:ClassifiedTaxCategory>
+    </cac:Item>
+    <cac:Price><cbc:PriceAmount currencyID="EUR">100.00</cbc:PriceAmount></cac:Price>
+  </cac:InvoiceLine>
+</Invoice>
+'''
+
+# variant name → [(old, new), ...] applied to the template; every replacement must apply
+CII_VARIANTS = {
+    'valid': [],
+    'missing-invoice-number': [('<ram:ID>CDS-0001</ram:ID>', '')],
+    'wrong-grand-total': [('<ram:GrandTotalAmount>119.00', '<ram:GrandTotalAmount>129.00')],
+    'unknown-currency': [('>EUR<', '>XXY<'), ('currencyID="EUR"', 'currencyID="XXY"')],
+    'wrong-vat-category': [('<ram:CategoryCode>S</ram:CategoryCode>', '<ram:CategoryCode>Q</ram:CategoryCode>')],
+    'schema-error': [('<ram:TypeCode>380</ram:TypeCode>', '<ram:TypeCode>380</ram:TypeCode><ram:Unknown>1</ram:Unknown>')],
+    'xrechnung': [('<ram:ID>urn:cen.eu:en16931:2017</ram:ID>', f'<ram:ID>{XRECHNUNG_GUIDELINE}</ram:ID>')],
+}
+UBL_VARIANTS = {
+    'valid': [],
+    'missing-invoice-number': [('<cbc:ID>UBL-0001</cbc:ID>', '')],
+    'wrong-payable-amount': [('<cbc:PayableAmount currencyID="EUR">119.00', '<cbc:PayableAmount currencyID="EUR">129.00')],
+    'unknown-currency': [('>EUR<', '>XXY<'), ('currencyID="EUR"', 'currencyID="XXY"')],
+    'schema-error': [('<cbc:InvoiceTypeCode>380</cbc:InvoiceTypeCode>',
+                      '<cbc:InvoiceTypeCode>380</cbc:InvoiceTypeCode><cbc:Unknown>1</cbc:Unknown>')],
+    'xrechnung': [('<cbc:CustomizationID>urn:cen.eu:en16931:2017</cbc:CustomizationID>',
+                   f'<cbc:CustomizationID>{XRECHNUNG_GUIDELINE}</cbc:CustomizationID>')],
+}
+
+_RULE_ID = re.compile(r'\[([A-Z][A-Z0-9]*(?:-[A-Z0-9]+)+)\]')
+
+
+def _apply(base: str, replacements: list[tuple[str, str]]) -> bytes:
+    for old, new in replacements:
+        if old not in base:
+            raise ValueError(f"Corpus template changed, replacement not found: {old!r}")
+        base = base.replace(old, new)
+    return base.encode('utf-8')
+
+
+def documents() -> dict[str, bytes]:
+    """The parity corpus: {file name: XML}."""
+    cii = corpus.invoice_xml(1).decode('utf-8')
+    docs = {f'cii-{name}.xml': _apply(cii, repl) for name, repl in CII_VARIANTS.items()}
+    docs['cii-many-lines.xml'] = corpus.invoice_xml(200)
+    docs.update({f'ubl-{name}.xml': _apply(UBL_INVOICE, repl) for name, repl in UBL_VARIANTS.items()})
+    return docs
+
+
+def _validate(url: str, token: str, engine: str, name: str, xml: bytes, timeout: float) -> tuple[int, dict, float]:
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+            f'Content-Type: application/xml\r\n\r\n').encode('ascii') + xml + f'\r\n--{boundary}--\r\n'.encode('ascii')
+    req = urllib.request.Request(f'{url}/validate?engine={engine}', data=body, method='POST', headers={
+        'Authorization': f'Bearer {token}', 'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            status, payload = resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    try:
+        return status, json.loads(payload), elapsed_ms
+    except ValueError:
+        return status, {"error": "no_json", "message": payload[:200].decode('utf-8', 'replace')}, elapsed_ms
+
+
+def rules(body: dict) -> set[tuple[str, str]]:
+    """{(error|warning, rule)} of a /validate response."""
+    found = set()
+    for finding in body.get("findings") or []:
+        match = _RULE_ID.search(finding.get("text") or '')
+        if match:
+            rule = match.group(1)
+        elif finding.get("attributes", {}).get("type") == '18':
+            rule = 'schema'
+        else:
+            rule = finding.get("attributes", {}).get("criterion") or 'other'
+        found.add((finding["tag"], rule))
+    return found
+
+
+def compare(mustang: dict, fast: dict) -> list[str]:
+    """Differences between both responses, empty if they agree."""
+    problems = []
+    if fast.get("engine") != 'fast':
+        problems.append(f"engine=fast lief über {fast.get('engine')} ({fast.get('engine_fallback') or fast.get('error')})")
+        return problems
+    if mustang.get("error"):
+        problems.append(f"Mustang-Fehler: {mustang.get('error')}: {mustang.get('message')}")
+        return problems
+    if mustang.get("status") != fast.get("status"):
+        problems.append(f"status mustang={mustang.get('status')} fast={fast.get('status')}")
+    expected, actual = rules(mustang), rules(fast)
+    for tag, rule in sorted(expected - actual):
+        problems.append(f"nur Mustang: {tag} {rule}")
+    for tag, rule in sorted(actual - expected):
+        problems.append(f"nur fast: {tag} {rule}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--token', default=os.environ.get('API_BEARER_TOKEN'))
+    parser.add_argument('--timeout', type=float, default=180)
+    parser.add_argument('--write-corpus', metavar='DIR', help='also write the corpus documents to DIR')
+    parser.add_argument('--json', action='store_true', help='print the comparison as JSON')
+    args = parser.parse_args()
+    if not args.token:
+        parser.error('--token or API_BEARER_TOKEN is required')
+
+    docs = documents()
+    if args.write_corpus:
+        os.makedirs(args.write_corpus, exist_ok=True)
+        for name, xml in docs.items():
+            with open(os.path.join(args.write_corpus, name), 'wb') as f:
+                f.write(xml)
+
+    results, failed = {}, 0
+    for name, xml in docs.items():
+        _, mustang, mustang_ms = _validate(args.url, args.token, 'mustang', name, xml, args.timeout)
+        _, fast, fast_ms = _validate(args.url, args.token, 'fast', name, xml, args.timeout)
+        problems = compare(mustang, fast)
+        failed += bool(problems)
+        results[name] = {
+            "status": {"mustang": mustang.get("status"), "fast": fast.get("status")},
+            "rules": len(rules(mustang)),
+            "latency_ms": {"mustang": round(mustang_ms, 1), "fast": round(fast_ms, 1)},
+            "problems": problems,
+        }
+        if not args.json:
+            verdict = 'OK  ' if not problems else 'DIFF'
+            print(f"{verdict} {name:<32} {str(mustang.get('status')):<8} {len(rules(mustang)):>3} rules  "
+                  f"mustang {mustang_ms:>8.1f} ms  fast {fast_ms:>8.1f} ms")
+            for problem in problems:
+                print(f"       {problem}")
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print(f"\n{len(docs) - failed}/{len(docs)} Dokumente ohne Abweichung")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the JVM launcher layer (CDS archives + short-lived JVM flags).
+
+Runs every action N times as a fresh process, once as a plain `java -jar` / `verapdf`
+(baseline) and once with the command line api_service.py uses, and prints the median/min
+wall time per action. Intended to run inside the image, after cds/train.sh:
+
+    docker compose exec pdfa python3 /opt/mustang/bench/jvm_startup.py --runs 5
+
+The Mustang archive is trained on validate and combine, so both should show a speedup;
+--min-speedup 1.2 exits with 1 if any action stays below that factor.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SAMPLES = '/opt/mustang/cds/samples'
+
+# api_service.py refuses to start without a token and starts the job store on import
+os.environ.setdefault('API_BEARER_TOKEN', 'bench')
+os.environ.setdefault('JOBS_DIR', tempfile.mkdtemp(prefix='bench-jobs-'))
+os.environ['MUSTANG_WORKER_POOL_SIZE'] = '0'
+os.environ['FAST_VALIDATION_POOL_SIZE'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, '/opt/mustang')
+
+import api_service  # noqa: E402
+
+
+def _actions(work_dir: str) -> dict:
+    xml = os.path.join(SAMPLES, 'invoice.xml')
+    pdfa = os.path.join(SAMPLES, 'pdfa3.pdf')
+    zugferd = os.path.join(SAMPLES, 'zugferd.pdf')
+    return {
+        'mustang validate (xml)': ['--action', 'validate', '--source', xml, '--no-notices'],
+        'mustang validate (pdf)': ['--action', 'validate', '--source', zugferd, '--no-notices'],
+        'mustang combine': [
+            '--action', 'combine', '--source', pdfa, '--source-xml', xml,
+            '--out', os.path.join(work_dir, 'out.pdf'), '--format', 'zf', '--version', '2',
+            '--profile', 'EN16931', '--attachments', '', '--no-additional-attachments'
+        ],
+        'verapdf validate': ['--format', 'json', pdfa],
+    }
+
+
+def _measure(cmd: list[str], env: dict, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, timeout=300)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per action and variant')
+    parser.add_argument('--min-speedup', type=float, default=0,
+                        help='exit 1 if an action is sped up by less than this factor (median; 0 = no check)')
+    args = parser.parse_args()
+
+    for archive in (api_service.MUSTANG_CDS_ARCHIVE, api_service.VERAPDF_CDS_ARCHIVE):
+        state = 'vorhanden' if os.path.isfile(archive) else 'FEHLT (Launcher läuft ohne Archiv)'
+        print(f"CDS-Archiv {archive}: {state}")
+    print()
+    print(f"{'Aktion':<26} {'Baseline median':>16} {'Launcher median':>16} {'Baseline min':>13} {'Launcher min':>13} {'Speedup':>8}")
+
+    base_env = dict(os.environ)
+    base_env.pop('JAVA_OPTS', None)
+    slow = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, action_args in _actions(work_dir).items():
+            if name.startswith('verapdf'):
+                baseline = (['verapdf', *action_args], base_env)
+                tuned = (['verapdf', *action_args], api_service._verapdf_env())
+            else:
+                baseline = (['java', '-jar', api_service.MUSTANG_CLI_JAR, *action_args], base_env)
+                tuned = (api_service._mustang_cli_cmd(action_args), base_env)
+            b = _measure(*baseline, args.runs)
+            t = _measure(*tuned, args.runs)
+            b_med, t_med = statistics.median(b), statistics.median(t)
+            print(f"{name:<26} {b_med:>15.2f}s {t_med:>15.2f}s {min(b):>12.2f}s {min(t):>12.2f}s {b_med / t_med:>7.2f}x")
+            if b_med / t_med < args.min_speedup:
+                slow.append(name)
+    if slow:
+        print(f"\nUnter {args.min_speedup:.2f}x: {', '.join(slow)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
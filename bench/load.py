@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for api_service.py.
+
+Drives /validate, /validate_pdfa, /convert_pdfa3 and /embed_xml with the generated corpus
+(bench/corpus.py) at one or more concurrency levels and reports p50/p95/p99 latency,
+throughput, errors, peak RSS and process counts of the service (process tree incl. workers
+and tool processes, sampled from /proc).
+
+Modes:
+  stub  starts the service with the fake `java`/`gs`/`verapdf` from bench/stubs in PATH
+        (offline, measures the service's own overhead)
+  real  starts the service with the real toolchain (inside the image):
+            docker compose exec pdfa python3 /opt/mustang/bench/load.py --mode real
+
+Both start api_service.py themselves on a free port with the result cache disabled, so repeated
+uploads are not served from the cache; --server picks uvicorn with asgi_app (default, as in the
+image) or the threaded Flask server. --url targets a running service instead (no RSS/process
+numbers; cache hits possible).
+
+Baseline: --save-baseline FILE stores the run, --baseline FILE compares against it and exits 1 on
+a regression (p95 latency or peak RSS above, throughput below the baseline by more than
+--tolerance, or a higher error rate):
+
+    python3 bench/load.py --mode stub --baseline bench/baseline-stub.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import corpus  # noqa: E402
+
+# name → (endpoint, {form field: corpus file})
+SCENARIOS = {
+    'validate.xml-small': ('/validate', {'file': 'small.xml'}),
+    'validate.xml-large': ('/validate', {'file': 'large.xml'}),
+    'validate.pdf-small': ('/validate', {'file': 'small-zugferd.pdf'}),
+    'validate.pdf-large': ('/validate', {'file': 'large-zugferd.pdf'}),
+    'validate_pdfa.small': ('/validate_pdfa', {'file': 'small-zugferd.pdf'}),
+    'validate_pdfa.large': ('/validate_pdfa', {'file': 'large-zugferd.pdf'}),
+    'convert_pdfa3.small': ('/convert_pdfa3', {'file': 'small.pdf'}),
+    'convert_pdfa3.large': ('/convert_pdfa3', {'file': 'large.pdf'}),
+    'embed_xml.small': ('/embed_xml', {'pdf_file': 'small.pdf', 'xml_file': 'small.xml'}),
+    'embed_xml.large': ('/embed_xml', {'pdf_file': 'large.pdf', 'xml_file': 'large.xml'}),
+}
+
+# Absolute slack on top of the relative tolerance, so sub-millisecond jitter is no regression
+_LATENCY_FLOOR_MS = 5.0
+_RSS_FLOOR_MB = 16.0
+
+
+def _multipart(files: dict[str, str], corpus_paths: dict[str, str]) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for field, name in files.items():
+        ctype = 'application/pdf' if name.endswith('.pdf') else 'application/xml'
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+                 f'Content-Type: {ctype}\r\n\r\n').encode('ascii')
+        with open(corpus_paths[name], 'rb') as f:
+            body += f.read()
+        body += b'\r\n'
+    body += f'--{boundary}--\r\n'.encode('ascii')
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+
+def _request(url: str, token: str, body: bytes, ctype: str, timeout: float) -> tuple[float, int]:
+    req = urllib.request.Request(url, data=body, method='POST', headers={
+        'Authorization': f'Bearer {token}', 'Content-Type': ctype})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0
+    return (time.perf_counter() - started) * 1000, status
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class ProcessSampler:
+    """Samples RSS and process count of a process tree from /proc while a scenario runs."""
+
+    def __init__(self, root_pid: int, interval: float = 0.05):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_procs = 0
+        self.seen: set[int] = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _tree(self) -> list[int]:
+        children: dict[int, list[int]] = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        tree, todo = [], [self.root_pid]
+        while todo:
+            pid = todo.pop()
+            tree.append(pid)
+            todo.extend(children.get(pid, ()))
+        return tree
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            tree = self._tree()
+            self.seen.update(tree[1:])
+            self.peak_procs = max(self.peak_procs, len(tree) - 1)
+            self.peak_rss = max(self.peak_rss, sum(self._rss(pid) for pid in tree))
+            self._stop.wait(self.interval)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _start_service(mode: str, server: str, token: str, work_dir: str,
+                   stub_delay_ms: float) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(API_BEARER_TOKEN=token, JOBS_DIR=os.path.join(work_dir, 'jobs'), RESULT_CACHE_ENABLED='0',
+               WORKSPACE_DISK_DIR=os.path.join(work_dir, 'workspaces'))
+    env.pop('RESULT_CACHE_DIR', None)
+    if mode == 'stub':
+        env['PATH'] = os.path.join(BENCH_DIR, 'stubs') + os.pathsep + env.get('PATH', '')
+        env['BENCH_STUB_DELAY_MS'] = str(stub_delay_ms)
+    service_dir = os.path.dirname(BENCH_DIR)
+    if server == 'asgi':
+        serve = f"import uvicorn; uvicorn.run(api_service.asgi_app, host='127.0.0.1', port={port}, log_level='warning')"
+    else:
+        serve = f"api_service.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    code = f"import sys; sys.path.insert(0, {service_dir!r}); import api_service; {serve}"
+    with open(os.path.join(work_dir, 'service.log'), 'wb') as log:
+        proc = subprocess.Popen([sys.executable, '-c', code], env=env, cwd=work_dir,
+                                stdout=subprocess.DEVNULL, stderr=log)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Service beendet (Code {proc.returncode}), siehe {work_dir}/service.log")
+        try:
+            req = urllib.request.Request(url + '/health', headers={'Authorization': f'Bearer {token}'})
+            with urllib.request.urlopen(req, timeout=5):
+                return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("Service nicht innerhalb von 120s bereit")
+
+
+def run_scenario(url: str, token: str, name: str, concurrency: int, requests: int, warmup: int,
+                 corpus_paths: dict[str, str], service_pid: Optional[int], timeout: float) -> dict:
+    endpoint, files = SCENARIOS[name]
+    body, ctype = _multipart(files, corpus_paths)
+    target = url + endpoint
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: _request(target, token, body, ctype, timeout), range(warmup)))
+        sampler = ProcessSampler(service_pid) if service_pid else None
+        with sampler or _NullContext():
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: _request(target, token, body, ctype, timeout), range(requests)))
+            wall = time.perf_counter() - started
+
+    latencies = [ms for ms, _ in results]
+    statuses: dict[str, int] = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    # 422 is a valid outcome (the corpus is not fully compliant); transport errors, 5xx and 503 are not
+    errors = sum(count for status, count in statuses.items() if status == '0' or int(status) >= 500)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "upload_bytes": len(body),
+        "statuses": statuses,
+        "error_rate": round(errors / requests, 4),
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "throughput_rps": round(requests / wall, 2),
+        "peak_rss_mb": round(sampler.peak_rss / 1024 / 1024, 1) if sampler else None,
+        "peak_processes": sampler.peak_procs if sampler else None,
+        "processes_seen": len(sampler.seen) if sampler else None,
+    }
+
+
+class _NullContext:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of results against baseline, one message per metric."""
+    regressions = []
+    for key, base in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(key)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) + _LATENCY_FLOOR_MS:
+            regressions.append(f"{key}: p95 {current['p95_ms']:.1f} ms > Baseline {base['p95_ms']:.1f} ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{key}: Durchsatz {current['throughput_rps']:.1f}/s < Baseline {base['throughput_rps']:.1f}/s")
+        if current["error_rate"] > base["error_rate"]:
+            regressions.append(f"{key}: Fehlerquote {current['error_rate']:.2%} > Baseline {base['error_rate']:.2%}")
+        if current.get("peak_rss_mb") and base.get("peak_rss_mb") and \
+                current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance) + _RSS_FLOOR_MB:
+            regressions.append(f"{key}: Peak-RSS {current['peak_rss_mb']:.0f} MB > Baseline {base['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def _print_table(results: dict):
+    print(f"{'Szenario':<30} {'n':>4} {'Fehler':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>8} {'RSS MB':>8} {'Proz.':>6} {'gestartet':>9}")
+    for key, r in results["scenarios"].items():
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else '-'
+        procs = r['peak_processes'] if r['peak_processes'] is not None else '-'
+        seen = r['processes_seen'] if r['processes_seen'] is not None else '-'
+        print(f"{key:<30} {r['requests']:>4} {r['error_rate']:>7.1%} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['throughput_rps']:>8.1f} {rss:>8} {procs:>6} {seen:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('stub', 'real'), default='stub')
+    parser.add_argument('--server', choices=('asgi', 'wsgi'), default='asgi',
+                        help='uvicorn + asgi_app or the threaded Flask server')
+    parser.add_argument('--url', help='running service instead of starting one (no RSS/process numbers)')
+    parser.add_argument('--token', default=os.environ.get('API_BEARER_TOKEN', 'bench'))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated, see SCENARIOS')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated levels, e.g. 1,8,32')
+    parser.add_argument('--requests', type=int, default=40, help='measured requests per scenario and level')
+    parser.add_argument('--warmup', type=int, default=4, help='unmeasured requests before each measurement')
+    parser.add_argument('--timeout', type=float, default=300, help='per-request timeout in seconds')
+    parser.add_argument('--stub-delay-ms', type=float, default=0, help='simulated tool time of the stubs')
+    parser.add_argument('--large-items', type=int, default=4000, help='line items in large.xml')
+    parser.add_argument('--large-pages', type=int, default=100, help='pages in large*.pdf')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare against a stored run, exit 1 on regression')
+    parser.add_argument('--save-baseline', help='store this run as baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slack for --baseline')
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unbekannte Szenarien: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    with tempfile.TemporaryDirectory(prefix='mustang-bench-') as work_dir:
+        corpus_paths = corpus.generate(os.path.join(work_dir, 'corpus'), args.large_items, args.large_pages)
+        proc = None
+        url = args.url
+        if not url:
+            proc, url = _start_service(args.mode, args.server, args.token, work_dir, args.stub_delay_ms)
+        results = {
+            "mode": args.mode,
+            "settings": {"server": args.server, "requests": args.requests, "warmup": args.warmup,
+                         "stub_delay_ms": args.stub_delay_ms,
+                         "large_items": args.large_items, "large_pages": args.large_pages},
+            "scenarios": {},
+        }
+        try:
+            for name in names:
+                for level in levels:
+                    key = f"{name}@c{level}"
+                    print(f"… {key}", file=sys.stderr)
+                    results["scenarios"][key] = run_scenario(
+                        url, args.token, name, level, args.requests, args.warmup, corpus_paths,
+                        proc.pid if proc else None, args.timeout)
+        finally:
+            if proc:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    _print_table(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("mode") != args.mode:
+            print(f"\nWARNUNG: Baseline wurde im Modus '{baseline.get('mode')}' erstellt, dieser Lauf: '{args.mode}'")
+        if baseline.get("settings") != results["settings"]:
+            print(f"\nWARNUNG: Einstellungen weichen von der Baseline ab: {baseline.get('settings')} vs. {results['settings']}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION gegenüber {args.baseline} (Toleranz {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"\nKeine Regression gegenüber {args.baseline} (Toleranz {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/bin/sh
+# Erzeugt beim Docker-Build die CDS-Archive (AppCDS) für Mustang-CLI und veraPDF.
+#
+# Mustang: validate (XML und ZUGFeRD-PDF; PDFBox + XML-Schema + Schematron/XSLT) und combine
+# (PDF/A-3 + XML → ZUGFeRD; XMP/Embedding) laden verschiedene Klassen. Alle drei Läufe schreiben
+# ihre geladenen Klassen mit -XX:DumpLoadedClassList; die zusammengeführte Liste wird mit
+# -Xshare:dump zu einem statischen Archiv, das beide Aktionen abdeckt. Schlägt das fehl, bleibt
+# als Fallback das dynamische Archiv eines validate-Laufs (-XX:ArchiveClassesAtExit).
+# veraPDF: dynamisches Archiv einer PDF/A-Validierung.
+#
+# api_service.py nutzt die Archive über -XX:SharedArchiveFile. Schlägt das Training fehl, fehlt
+# das Archiv und api_service.py startet die JVMs ohne (kein Build-Abbruch).
+#
+# Aufruf: train.sh <cds-dir>   (Default: /opt/mustang/cds)
+set -u
+
+CDS_DIR="${1:-/opt/mustang/cds}"
+MUSTANG_JAR="${MUSTANG_CLI_JAR:-/opt/mustang/Mustang-CLI.jar}"
+SAMPLES="${CDS_DIR}/samples"
+mkdir -p "${SAMPLES}"
+
+cp "${CDS_DIR}/sample-invoice.xml" "${SAMPLES}/invoice.xml"
+
+# Sample PDFs: blank page -> PDF/A-3 (same gs flags as /convert_pdfa3) -> ZUGFeRD via Mustang
+gs -q -dNOPAUSE -dBATCH -sDEVICE=pdfwrite -o "${SAMPLES}/blank.pdf" -c showpage
+gs -q -dPDFA=3 -dPDFACompatibilityPolicy=1 -dBATCH -dNOPAUSE -sDEVICE=pdfwrite \
+   -dEmbedAllFonts=true -dSubsetFonts=true -sProcessColorModel=DeviceRGB \
+   -sOutputFile="${SAMPLES}/pdfa3.pdf" "${SAMPLES}/blank.pdf"
+CLASSLISTS="${SAMPLES}/classlists"
+mkdir -p "${CLASSLISTS}"
+
+java -XX:DumpLoadedClassList="${CLASSLISTS}/combine.classlist" -jar "${MUSTANG_JAR}" --action combine \
+   --source "${SAMPLES}/pdfa3.pdf" --source-xml "${SAMPLES}/invoice.xml" \
+   --out "${SAMPLES}/zugferd.pdf" --format zf --version 2 --profile EN16931 \
+   --attachments '' --no-additional-attachments > /dev/null 2>&1 \
+   || echo "WARN: Mustang combine für Trainingsbeleg fehlgeschlagen"
+
+TRAIN_PDF="${SAMPLES}/zugferd.pdf"
+[ -s "${TRAIN_PDF}" ] || TRAIN_PDF="${SAMPLES}/pdfa3.pdf"
+
+java -XX:DumpLoadedClassList="${CLASSLISTS}/validate-pdf.classlist" \
+   -jar "${MUSTANG_JAR}" --action validate --source "${TRAIN_PDF}" --no-notices > /dev/null 2>&1 || true
+java -XX:DumpLoadedClassList="${CLASSLISTS}/validate-xml.classlist" \
+   -jar "${MUSTANG_JAR}" --action validate --source "${SAMPLES}/invoice.xml" --no-notices > /dev/null 2>&1 || true
+
+# Union of the lists, first occurrence wins (the order is kept, duplicates would be dumped twice)
+cat "${CLASSLISTS}"/*.classlist 2>/dev/null | awk '!seen[$0]++' > "${CDS_DIR}/mustang.classlist"
+
+# Mustang-CLI (dumped with classpath = Mustang-CLI.jar; `-jar` uses the same classpath and the worker
+# pool appends its driver dir, which CDS allows)
+rm -f "${CDS_DIR}/mustang.jsa"
+if [ -s "${CDS_DIR}/mustang.classlist" ]; then
+   java -Xshare:dump -XX:SharedClassListFile="${CDS_DIR}/mustang.classlist" \
+      -XX:SharedArchiveFile="${CDS_DIR}/mustang.jsa" -Xlog:all=warning:stderr \
+      -cp "${MUSTANG_JAR}" > /dev/null \
+      || { echo "WARN: statisches Mustang CDS-Archiv fehlgeschlagen"; rm -f "${CDS_DIR}/mustang.jsa"; }
+fi
+if [ ! -s "${CDS_DIR}/mustang.jsa" ]; then
+   java -XX:ArchiveClassesAtExit="${CDS_DIR}/mustang.jsa" -Xlog:all=warning:stderr \
+      -jar "${MUSTANG_JAR}" --action validate --source "${TRAIN_PDF}" --no-notices > /dev/null \
+      || true
+fi
+[ -s "${CDS_DIR}/mustang.jsa" ] && echo "CDS: ${CDS_DIR}/mustang.jsa erzeugt" \
+   || echo "WARN: Mustang CDS-Archiv nicht erzeugt"
+
+# veraPDF (the launcher script passes JAVA_OPTS to its JVM)
+JAVA_OPTS="-XX:ArchiveClassesAtExit=${CDS_DIR}/verapdf.jsa -Xlog:all=warning:stderr" \
+   verapdf --format json "${SAMPLES}/pdfa3.pdf" > /dev/null \
+   || true
+[ -s "${CDS_DIR}/verapdf.jsa" ] && echo "CDS: ${CDS_DIR}/verapdf.jsa erzeugt" \
+   || echo "WARN: veraPDF CDS-Archiv nicht erzeugt"
+
+exit 0
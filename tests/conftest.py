@@ -0,0 +1,26 @@
+"""
+Test setup for api_service.py: the module configures itself from the environment at import, so
+every directory and pool setting is pointed at a temporary location before it is imported.
+Tool binaries are the stubs from bench/stubs.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TMP = tempfile.mkdtemp(prefix='mustang-api-tests-')
+
+os.environ.update({
+    'API_BEARER_TOKEN': 'test-token',
+    'WORKSPACE_RAM_DIR': os.path.join(_TMP, 'ram'),
+    'WORKSPACE_DISK_DIR': os.path.join(_TMP, 'disk'),
+    'JOBS_DIR': os.path.join(_TMP, 'jobs'),
+    'RESULT_CACHE_DIR': '',
+    'MUSTANG_WORKER_POOL_SIZE': '0',
+    'FAST_VALIDATION_POOL_SIZE': '0',
+    'HOTFOLDER_ENABLED': '0',
+})
+os.environ['PATH'] = os.path.join(ROOT, 'bench', 'stubs') + os.pathsep + os.environ.get('PATH', '')
+sys.path.insert(0, ROOT)
+
+TOKEN = os.environ['API_BEARER_TOKEN']
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+import api_service
+from conftest import TOKEN
+
+PDF = b'%PDF-1.7\n1 0 obj\n<< /Type /Catalog >>\nendobj\n%%EOF\n'
+
+
+@pytest.fixture
+def gs_gate(monkeypatch):
+    """A fresh controller whose Ghostscript gate runs one job and queues at most one."""
+    controller = api_service.AdmissionController(api_service.ADMISSION_MEMORY_BUDGET_MB)
+    monkeypatch.setattr(api_service, '_admission', controller)
+    gate = controller.gate('gs')
+    gate.max_concurrent, gate.max_queue = 1, 1
+    return gate
+
+
+def _convert():
+    return api_service.app.test_client().post('/convert_pdfa3', data=PDF, headers={
+        'Authorization': f'Bearer {TOKEN}', 'Content-Type': 'application/pdf'})
+
+
+def _hold(gate, entered: threading.Event, release: threading.Event):
+    with gate.admit():
+        entered.set()
+        release.wait(5)
+
+
+def _run_once(gate):
+    with gate.admit():
+        pass
+
+
+def _queue_one(gate):
+    """Starts a request thread that waits in the queue; returns the thread."""
+    waiter = threading.Thread(target=_run_once, args=(gate,))
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while gate.queued == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return waiter
+
+
+def test_full_queue_is_shed_with_503_and_retry_after(gs_gate):
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(gs_gate, entered, release))
+    holder.start()
+    entered.wait(5)
+    waiter = _queue_one(gs_gate)
+    try:
+        resp = _convert()
+    finally:
+        release.set()
+        holder.join(5)
+        waiter.join(5)
+    assert resp.status_code == 503
+    assert int(resp.headers['Retry-After']) >= 1
+    assert resp.get_json()["error"] == 'overloaded'
+    assert (resp.get_json()["tool"], resp.get_json()["reason"]) == ('gs', 'queue_full')
+    assert gs_gate.rejected_total == 1
+
+
+def test_queue_wait_times_out_with_503(gs_gate, monkeypatch):
+    monkeypatch.setattr(api_service, 'ADMISSION_QUEUE_TIMEOUT', 0.1)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(gs_gate, entered, release))
+    holder.start()
+    entered.wait(5)
+    try:
+        resp = _convert()
+    finally:
+        release.set()
+        holder.join(5)
+    assert resp.status_code == 503
+    assert resp.get_json()["reason"] == 'queue_timeout'
+    assert resp.headers['Retry-After']
+
+
+def test_background_work_waits_instead_of_being_shed(gs_gate, monkeypatch):
+    monkeypatch.setattr(api_service, 'ADMISSION_QUEUE_TIMEOUT', 0.1)
+    gs_gate.max_queue = 0
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(gs_gate, entered, release))
+    holder.start()
+    entered.wait(5)
+    admitted = threading.Event()
+
+    def background():
+        with api_service._background_admission(), gs_gate.admit():
+            admitted.set()
+
+    worker = threading.Thread(target=background)
+    worker.start()
+    time.sleep(0.3)
+    assert not admitted.is_set() and gs_gate.queued == 1
+    release.set()
+    holder.join(5)
+    worker.join(5)
+    assert admitted.is_set()
+    assert (gs_gate.running, gs_gate.rejected_total) == (0, 0)
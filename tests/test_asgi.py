@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import api_service
+from conftest import TOKEN
+from test_pdf import _classic_pdf
+from test_process import TREE, _gone
+
+BODY_CHUNK = b'x' * 65536
+DECLARED = 20 * 1024 * 1024
+
+def _scope(path: str, headers: list[tuple[bytes, bytes]], length: int) -> dict:
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'test'), (b'content-length', str(length).encode()), *headers],
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 8080),
+    }
+
+def _call(path: str, headers: list[tuple[bytes, bytes]]):
+    """POSTs to asgi_app with an endless body; returns (status, number of receive() calls)."""
+    calls = 0
+    messages = []
+
+    async def receive():
+        nonlocal calls
+        calls += 1
+        return {'type': 'http.request', 'body': BODY_CHUNK, 'more_body': True}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(api_service.asgi_app(_scope(path, headers, DECLARED), receive, send))
+    start = next(m for m in messages if m['type'] == 'http.response.start')
+    return start['status'], calls
+
+@pytest.mark.parametrize('path', ['/validate', '/validate_batch', '/jobs/validate', '/pipeline/zugferd', '/unknown'])
+def test_unauthenticated_post_is_rejected_before_the_body_is_read(path):
+    status, calls = _call(path, [(b'content-type', b'application/pdf')])
+    assert status == 401
+    assert calls == 0
+
+def test_wrong_token_is_rejected_before_the_body_is_read():
+    status, calls = _call('/validate_batch', [(b'authorization', b'Bearer wrong')])
+    assert (status, calls) == (401, 0)
+
+def test_declared_oversize_body_is_rejected_before_it_is_read(monkeypatch):
+    monkeypatch.setitem(api_service.app.config, 'MAX_CONTENT_LENGTH', 1024 * 1024)
+    status, calls = _call('/validate', [(b'authorization', f'Bearer {TOKEN}'.encode()),
+                                        (b'content-type', b'application/pdf')])
+    assert (status, calls) == (413, 0)
+
+async def _convert(body: bytes, disconnect: asyncio.Event):
+    """POSTs body to /convert_pdfa3; receive() answers http.disconnect once `disconnect` is set."""
+    messages = []
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    headers = [(b'authorization', f'Bearer {TOKEN}'.encode()), (b'content-type', b'application/pdf')]
+    await api_service.asgi_app(_scope('/convert_pdfa3', headers, len(body)), receive, send)
+    start = next(m for m in messages if m['type'] == 'http.response.start')
+    return start['status'], dict(start['headers'])
+
+def test_tool_runs_on_the_event_loop(monkeypatch):
+    loops = []
+    arun_process = api_service._arun_process
+
+    async def recording_arun_process(cmd, *args):
+        loops.append(asyncio.get_running_loop())
+        return await arun_process(cmd, *args)
+
+    monkeypatch.setattr(api_service, '_arun_process', recording_arun_process)
+    status, headers = asyncio.run(_convert(_classic_pdf({1: b'<< /Type /Catalog >>'}), asyncio.Event()))
+    assert status == 200 and headers[b'x-pdfa-conversion'] == b'converted'
+    assert len(loops) == 1
+    assert b'tool;dur=' in headers[b'server-timing']
+
+def test_client_disconnect_kills_the_running_tool(monkeypatch, tmp_path):
+    pidfile = tmp_path / 'pid'
+    monkeypatch.setattr(api_service, '_pdfa3_gs_cmd', lambda inp, out: ['sh', '-c', TREE.format(pidfile=pidfile)])
+
+    async def disconnect_while_converting():
+        disconnect = asyncio.Event()
+        request = asyncio.ensure_future(_convert(_classic_pdf({1: b'<< /Type /Catalog >>'}), disconnect))
+        while not pidfile.exists() or not pidfile.read_text():
+            await asyncio.sleep(0.01)
+        disconnect.set()
+        return await asyncio.wait_for(request, 5)
+
+    status, _ = asyncio.run(disconnect_while_converting())
+    assert status == 400
+    assert _gone(int(pidfile.read_text()))
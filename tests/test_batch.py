@@ -0,0 +1,78 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+import api_service
+from conftest import TOKEN
+from test_upload import BOUNDARY, _multipart, _part
+
+PDF = b'%PDF-1.7\n' + b'x' * 200 * 1024
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('in.pdf', 'in.pdf'),
+    ('dir/in.pdf', 'in.pdf'),
+    ('dir\\in.pdf', 'in.pdf'),
+    ('.', 'document-3'),
+    ('..', 'document-3'),
+    ('a/..', 'document-3'),
+    ('../', 'document-3'),
+    (None, 'document-3'),
+])
+def test_batch_document_name(name, expected):
+    assert api_service._batch_document_name(name, 3) == expected
+
+
+def test_parts_are_yielded_before_the_rest_of_the_body_is_read(tmp_path):
+    body = _multipart(*(_part('file', PDF, f'{i}.pdf') for i in range(3)))
+    stream = io.BytesIO(body)
+    with api_service.app.test_request_context(
+            '/validate_batch', method='POST', input_stream=stream, content_length=len(body),
+            content_type=f'multipart/form-data; boundary={BOUNDARY}'):
+        documents = api_service._spool_batch_files(str(tmp_path))
+        name, upload = next(documents)
+        assert (name, upload.size) == ('0.pdf', len(PDF))
+        assert stream.tell() < 2 * len(PDF)
+        assert [name for name, _ in documents] == ['1.pdf', '2.pdf']
+
+
+def _lines(resp) -> list[dict]:
+    return [json.loads(line) for line in resp.data.decode().splitlines()]
+
+
+@pytest.fixture
+def validated(monkeypatch):
+    names = []
+
+    def validate(sha256, filenames, path, size):
+        names.append(filenames[0])
+        return 200, b'{}', 'MISS'
+
+    monkeypatch.setattr(api_service, '_cached_validation', validate)
+    return names
+
+
+def test_multipart_part_names_cannot_leave_the_document_directory(validated):
+    body = _multipart(_part('file', PDF, '..'), _part('file', PDF, 'a/..'), _part('file', PDF, '.'))
+    resp = api_service.app.test_client().post('/validate_batch', data=body, headers={
+        'Authorization': f'Bearer {TOKEN}', 'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'})
+    assert resp.status_code == 200
+    lines = _lines(resp)
+    assert lines[-1]["summary"]["ok"] == 3
+    assert sorted(line["name"] for line in lines[:-1]) == ['document-0', 'document-1', 'document-2']
+
+
+def test_zip_entry_names_cannot_leave_the_document_directory(validated):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('a/..', PDF)
+        zf.writestr('invoices/b.pdf', PDF)
+    resp = api_service.app.test_client().post('/validate_batch', data=archive.getvalue(), headers={
+        'Authorization': f'Bearer {TOKEN}', 'Content-Type': 'application/zip'})
+    assert resp.status_code == 200
+    lines = _lines(resp)
+    assert lines[-1]["summary"]["ok"] == 2
+    assert sorted(line["name"] for line in lines[:-1]) == ['b.pdf', 'document-0']
+    assert sorted(validated) == ['b.pdf', 'document-0.pdf']
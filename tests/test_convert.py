@@ -0,0 +1,86 @@
+import pytest
+
+import api_service
+from conftest import TOKEN
+from test_pdf import _classic_pdf, _stream
+
+XMP = (b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+       b'<rdf:Description xmlns:pdfaid="http://www.aiim.org/pdfa/ns/id/">'
+       b'<pdfaid:part>%s</pdfaid:part><pdfaid:conformance>B</pdfaid:conformance>'
+       b'</rdf:Description></rdf:RDF></x:xmpmeta>')
+DOCUMENT_ID = b'/ID [<0123456789abcdef> <0123456789abcdef>] '
+
+
+def _pdfa(part: bytes = b'3', trailer: bytes = DOCUMENT_ID, intent: bytes = b'/DestOutputProfile 4 0 R') -> bytes:
+    return _classic_pdf({
+        1: b'<< /Type /Catalog /Metadata 2 0 R /OutputIntents [3 0 R] >>',
+        2: _stream(b'/Type /Metadata /Subtype /XML', XMP % part),
+        3: b'<< /Type /OutputIntent /S /GTS_PDFA1 ' + intent + b' >>',
+        4: _stream(b'/N 3', b'icc'),
+    }, trailer=trailer)
+
+
+@pytest.fixture
+def gs_runs(monkeypatch):
+    runs = []
+    run_gs = api_service._run_gs
+
+    def recording_run_gs(gs_cmd, *args, **kwargs):
+        runs.append(gs_cmd)
+        return run_gs(gs_cmd, *args, **kwargs)
+
+    monkeypatch.setattr(api_service, '_run_gs', recording_run_gs)
+    return runs
+
+
+def _convert(data: bytes, mode=None):
+    return api_service.app.test_client().post(
+        '/convert_pdfa3', query_string={'mode': mode} if mode else {}, data=data,
+        headers={'Authorization': f'Bearer {TOKEN}', 'Content-Type': 'application/pdf'})
+
+
+def test_pdfa3_input_is_returned_without_ghostscript(gs_runs):
+    data = _pdfa()
+    resp = _convert(data)
+    assert resp.status_code == 200
+    assert (resp.headers['X-PDFA-Conversion'], resp.headers['X-PDFA-Check']) == ('skipped', 'pdfa-3b')
+    assert resp.data == data
+    assert gs_runs == []
+
+
+def test_force_converts_anyway(gs_runs):
+    resp = _convert(_pdfa(), mode='force')
+    assert (resp.headers['X-PDFA-Conversion'], resp.headers['X-PDFA-Check']) == ('converted', 'forced')
+    assert len(gs_runs) == 1
+
+
+@pytest.mark.parametrize('data, reason', [
+    (_pdfa(part=b'2'), 'pdfa-2b'),
+    (_pdfa(trailer=b''), 'no_document_id'),
+    (_pdfa(intent=b''), 'no_output_intent'),
+    (_classic_pdf({1: b'<< /Type /Catalog >>'}), 'no_pdfaid'),
+])
+def test_inputs_that_are_not_pdfa3_are_converted(gs_runs, data, reason):
+    resp = _convert(data)
+    assert resp.status_code == 200
+    assert (resp.headers['X-PDFA-Conversion'], resp.headers['X-PDFA-Check']) == ('converted', reason)
+    assert len(gs_runs) == 1
+
+
+@pytest.mark.parametrize('verapdf_status, conversion, check', [
+    (200, 'skipped', 'pdfa-3b'),
+    (422, 'converted', 'verapdf_not_compliant'),
+    (504, 'converted', 'verapdf_error'),
+])
+def test_strict_asks_verapdf(gs_runs, monkeypatch, verapdf_status, conversion, check):
+    asked = []
+
+    def cached_result(endpoint, sha256, key_parts, compute):
+        asked.append((endpoint, key_parts))
+        return verapdf_status, b'{}', 'MISS'
+
+    monkeypatch.setattr(api_service, '_cached_result', cached_result)
+    resp = _convert(_pdfa(), mode='strict')
+    assert (resp.headers['X-PDFA-Conversion'], resp.headers['X-PDFA-Check']) == (conversion, check)
+    assert asked == [('validate_pdfa', ['report=summary'])]
+    assert len(gs_runs) == (conversion == 'converted')
@@ -0,0 +1,74 @@
+import pytest
+
+import api_service
+from conftest import TOKEN
+from test_preflight import CII
+from test_report import REPORT, FakeResult
+
+BASIC = CII.replace(b'urn:cen.eu:en16931:2017', b'urn:factur-x.eu:1p0:basic')
+
+
+@pytest.fixture
+def fast_worker(monkeypatch):
+    """A fast pool whose worker answers with the FakeResult in the returned list (None = busy)."""
+    answer, runs = [None], []
+    run_on_pool = api_service._run_on_pool
+
+    def fake_run_on_pool(tool, pool, args, cmd, timeout):
+        if tool != 'fast':
+            return run_on_pool(tool, pool, args, cmd, timeout)
+        runs.append(args)
+        return answer[0]
+
+    monkeypatch.setattr(api_service, '_fast_pool', object())
+    monkeypatch.setattr(api_service, '_run_on_pool', fake_run_on_pool)
+    monkeypatch.setattr(api_service, '_result_cache', None)
+    return answer, runs
+
+
+def _validate(data: bytes, content_type='application/xml'):
+    resp = api_service.app.test_client().post('/validate', query_string={'engine': 'fast'}, data=data, headers={
+        'Authorization': f'Bearer {TOKEN}', 'Content-Type': content_type})
+    return resp.status_code, resp.get_json()
+
+
+def test_fast_report_is_used(fast_worker):
+    answer, runs = fast_worker
+    answer[0] = FakeResult(REPORT)
+    status, body = _validate(CII)
+    assert (status, body["engine"], body["finding_counts"]["error"]) == (422, 'fast', 3)
+    assert runs[0][2:] == ['--syntax', 'CII', '--rules', 'en16931']
+
+
+@pytest.mark.parametrize('answer, reason', [
+    (FakeResult('', stderr='unsupported: document cannot be checked', returncode=2), 'engine_error'),
+    (None, 'worker_unavailable'),
+])
+def test_worker_failure_falls_back_to_mustang(fast_worker, answer, reason):
+    fast_worker[0][0] = answer
+    status, body = _validate(CII)
+    assert (status, body["ok"]) == (200, True)
+    assert (body["engine"], body["engine_fallback"]) == ('mustang', reason)
+    assert len(fast_worker[1]) == 1
+
+
+def test_profile_without_fast_rules_goes_to_mustang_without_asking_the_worker(fast_worker):
+    status, body = _validate(BASIC)
+    assert (body["engine"], body["engine_fallback"]) == ('mustang', 'unsupported_profile')
+    assert fast_worker[1] == []
+
+
+def test_unavailable_engine_falls_back(monkeypatch):
+    monkeypatch.setattr(api_service, '_fast_pool', None)
+    with api_service.app.app_context():
+        result, error, info = api_service._run_validate_engine('/nonexistent/in.xml', 0, None, 'fast')
+    assert info == {"engine": "mustang", "engine_fallback": 'unavailable'}
+
+
+def test_timeout_falls_back(fast_worker, monkeypatch):
+    def timeout(tool, pool, args, cmd, t):
+        raise api_service.subprocess.TimeoutExpired(cmd, t)
+
+    monkeypatch.setattr(api_service, '_run_on_pool', timeout)
+    preflight = {"syntax": 'CII', "profile": 'COMFORT', "guideline_id": 'urn:cen.eu:en16931:2017'}
+    assert api_service._run_fast_validate('/tmp/in.xml', preflight) == (None, 'timeout')
@@ -0,0 +1,56 @@
+import urllib.error
+
+import pytest
+
+import api_service
+from conftest import TOKEN
+
+AUTH = {'Authorization': f'Bearer {TOKEN}', 'Content-Type': 'application/pdf'}
+
+
+@pytest.fixture
+def client():
+    return api_service.app.test_client()
+
+
+@pytest.mark.parametrize('allowed, url', [
+    (frozenset(), 'https://hooks.example/done'),
+    (frozenset({'hooks.example'}), 'http://169.254.169.254/latest/meta-data'),
+    (frozenset({'hooks.example'}), 'https://hooks.example.evil.test/done'),
+    (frozenset({'hooks.example'}), 'file:///etc/passwd'),
+])
+def test_callback_url_outside_the_allow_list_is_rejected_at_submit(client, monkeypatch, allowed, url):
+    monkeypatch.setattr(api_service, 'JOBS_CALLBACK_ALLOWED_HOSTS', allowed)
+    resp = client.post('/jobs/validate_pdfa', query_string={'callback_url': url}, data=b'%PDF-1.7\n', headers=AUTH)
+    assert resp.status_code == 400
+
+
+def test_callback_host_on_the_allow_list_is_accepted(monkeypatch):
+    monkeypatch.setattr(api_service, 'JOBS_CALLBACK_ALLOWED_HOSTS', frozenset({'hooks.example'}))
+    assert api_service._callback_host_allowed('https://HOOKS.example:8443/done')
+
+
+def test_failed_callback_does_not_sleep_after_the_last_attempt(monkeypatch):
+    job = {'callback_url': 'https://hooks.example/done', 'state': 'done'}
+    updates, sleeps = [], []
+
+    class Store:
+        def get(self, job_id):
+            return job
+
+        def update(self, job_id, **columns):
+            updates.append(columns)
+
+    def refuse(req, timeout):
+        raise urllib.error.URLError('connection refused')
+
+    monkeypatch.setattr(api_service, 'JOBS_CALLBACK_ALLOWED_HOSTS', frozenset({'hooks.example'}))
+    monkeypatch.setattr(api_service, 'JOBS_CALLBACK_RETRIES', 3)
+    monkeypatch.setattr(api_service, '_job_store', Store())
+    monkeypatch.setattr(api_service, '_job_public', lambda job: {})
+    monkeypatch.setattr(api_service._callback_opener, 'open', refuse)
+    monkeypatch.setattr(api_service.time, 'sleep', sleeps.append)
+
+    api_service._notify_job_callback('job')
+    assert sleeps == [1, 2]
+    assert updates == [{'callback_state': 'failed'}]
@@ -0,0 +1,164 @@
+import zlib
+
+import pytest
+
+import api_service
+from api_service import PdfDocument, PdfError, PdfRef
+
+INVOICE = b'<?xml version="1.0"?><rsm:CrossIndustryInvoice xmlns:rsm="urn:x"/>'
+
+CATALOG = b'<< /Type /Catalog /Names 2 0 R /AF [3 0 R] >>'
+NAMES = b'<< /EmbeddedFiles << /Names [(factur-x.xml) 3 0 R] >> >>'
+FILESPEC = b'<< /Type /Filespec /F (factur-x.xml) /UF (factur-x.xml) /AFRelationship /Data /EF << /F 4 0 R >> >>'
+
+
+def _stream(extra: bytes, data: bytes) -> bytes:
+    return b'<< ' + extra + b' /Length %d >>\nstream\n' % len(data) + data + b'\nendstream'
+
+
+def _embedded_file(data: bytes = INVOICE) -> bytes:
+    return _stream(b'/Type /EmbeddedFile /Subtype /text#2Fxml /Filter /FlateDecode', zlib.compress(data))
+
+
+def _classic_pdf(objects: dict, startxref_offset=None, trailer: bytes = b'') -> bytes:
+    """Classic xref table; startxref_offset overrides the real offset (damaged file)."""
+    out = bytearray(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b'%d 0 obj\n' % num + objects[num] + b'\nendobj\n'
+    size = max(objects) + 1
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % size
+    for num in range(1, size):
+        out += b'%010d 00000 n \n' % offsets[num] if num in offsets else b'0000000000 65535 f \n'
+    out += b'trailer\n<< /Size %d /Root 1 0 R %s>>\n' % (size, trailer)
+    out += b'startxref\n%d\n%%%%EOF\n' % (xref if startxref_offset is None else startxref_offset)
+    return bytes(out)
+
+
+def _xref_stream_pdf() -> bytes:
+    """Catalog, names and file spec in an object stream (10), indexed by an xref stream (11)."""
+    packed = [(1, CATALOG), (2, NAMES), (3, FILESPEC)]
+    header, body = b'', b''
+    for num, obj in packed:
+        header += b'%d %d ' % (num, len(body))
+        body += obj + b'\n'
+    objstm = zlib.compress(header + body)
+
+    out = bytearray(b'%PDF-1.7\n')
+    offsets = {4: len(out)}
+    out += b'4 0 obj\n' + _embedded_file() + b'\nendobj\n'
+    offsets[10] = len(out)
+    out += b'10 0 obj\n' + _stream(b'/Type /ObjStm /N 3 /First %d /Filter /FlateDecode' % len(header), objstm)
+    out += b'\nendobj\n'
+    offsets[11] = len(out)
+
+    rows = b''
+    for num in range(12):
+        if num in offsets:
+            rows += bytes([1]) + offsets[num].to_bytes(4, 'big') + b'\0\0'
+        elif num in (1, 2, 3):
+            rows += bytes([2]) + (10).to_bytes(4, 'big') + (num - 1).to_bytes(2, 'big')
+        else:
+            rows += bytes([0]) + bytes(6)
+    out += b'11 0 obj\n' + _stream(b'/Type /XRef /Size 12 /W [1 4 2] /Root 1 0 R /Filter /FlateDecode',
+                                   zlib.compress(rows))
+    out += b'\nendobj\nstartxref\n%d\n%%%%EOF\n' % offsets[11]
+    return bytes(out)
+
+
+def _write(tmp_path, data: bytes) -> str:
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(data)
+    return str(path)
+
+
+def _invoice_attachment(pdf: PdfDocument):
+    [attachment] = pdf.attachments()
+    assert (attachment["name"], attachment["relationship"], attachment["mime_type"]) == \
+        ('factur-x.xml', 'Data', 'text/xml')
+    return pdf.decode_stream(attachment["stream"])
+
+
+def test_classic_xref(tmp_path):
+    path = _write(tmp_path, _classic_pdf({1: CATALOG, 2: NAMES, 3: FILESPEC, 4: _embedded_file()}))
+    with PdfDocument(path) as pdf:
+        assert not pdf.xref_repaired
+        assert _invoice_attachment(pdf) == INVOICE
+
+
+def test_xref_stream_with_object_stream(tmp_path):
+    with PdfDocument(_write(tmp_path, _xref_stream_pdf())) as pdf:
+        assert not pdf.xref_repaired
+        assert pdf._offsets[1] == ('objstm', 10, 0)
+        assert _invoice_attachment(pdf) == INVOICE
+
+
+@pytest.mark.parametrize('startxref_offset', [3, 10 ** 9])
+def test_broken_xref_is_rebuilt(tmp_path, startxref_offset):
+    data = _classic_pdf({1: CATALOG, 2: NAMES, 3: FILESPEC, 4: _embedded_file()}, startxref_offset)
+    with PdfDocument(_write(tmp_path, data)) as pdf:
+        assert pdf.xref_repaired
+        assert _invoice_attachment(pdf) == INVOICE
+
+
+@pytest.mark.parametrize('junk, repaired', [(0, False), (3000, False), (5000, True)])
+def test_junk_after_eof(tmp_path, junk, repaired):
+    data = _classic_pdf({1: CATALOG, 2: NAMES, 3: FILESPEC, 4: _embedded_file()}) + b'\0' * junk
+    with PdfDocument(_write(tmp_path, data)) as pdf:
+        assert pdf.xref_repaired is repaired
+        assert _invoice_attachment(pdf) == INVOICE
+
+
+def test_missing_xref_and_trailer_finds_the_catalog(tmp_path):
+    data = _classic_pdf({1: CATALOG, 2: NAMES, 3: FILESPEC, 4: _embedded_file()})
+    data = data[:data.rindex(b'xref')]
+    with PdfDocument(_write(tmp_path, data)) as pdf:
+        assert pdf.xref_repaired
+        assert _invoice_attachment(pdf) == INVOICE
+
+
+def test_missing_embedded_files(tmp_path):
+    path = _write(tmp_path, _classic_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>', 2: b'<< /Type /Pages /Kids [] /Count 0 >>'}))
+    with PdfDocument(path) as pdf:
+        assert pdf.attachments() == []
+    with api_service.app.test_request_context():
+        body, status = api_service._extract_invoice_xml(path)
+    assert (status, body["error"], body["attachments"]) == (422, 'no_embedded_invoice', [])
+
+
+def test_dangling_reference_resolves_to_none(tmp_path):
+    path = _write(tmp_path, _classic_pdf({1: b'<< /Type /Catalog /Names 9 0 R /AF 8 0 R >>'}))
+    with PdfDocument(path) as pdf:
+        assert pdf.resolve(PdfRef(9, 0)) is None
+        assert pdf.attachments() == []
+
+
+def test_looping_reference_is_an_error(tmp_path):
+    path = _write(tmp_path, _classic_pdf({1: b'<< /Type /Catalog /AF 2 0 R >>', 2: b'3 0 R', 3: b'2 0 R'}))
+    with PdfDocument(path) as pdf:
+        with pytest.raises(PdfError) as e:
+            pdf.attachments()
+    assert e.value.error == 'pdf_parse_error'
+
+
+def test_truncated_file_is_a_parse_error(tmp_path):
+    data = _classic_pdf({1: CATALOG, 2: NAMES, 3: FILESPEC, 4: _embedded_file()})
+    path = _write(tmp_path, data[:data.index(b'3 0 obj') + 40])
+    with api_service.app.test_request_context():
+        body, status = api_service._extract_invoice_xml(path)
+    assert (status, body["error"]) == (422, 'pdf_parse_error')
+
+
+@pytest.mark.parametrize('xml', [
+    b'\xff\xfe' + '<Invoice/>'.encode('utf-16-le') + b'<',       # odd length
+    b'\xff\xfe' + '<a>'.encode('utf-16-le') + b'\x00\xd8' + '</a>'.encode('utf-16-le'),  # lone surrogate
+])
+def test_damaged_utf16_attachment_is_decoded_with_replacement(tmp_path, xml):
+    path = _write(tmp_path, _classic_pdf({1: CATALOG, 2: NAMES, 3: FILESPEC, 4: _embedded_file(xml)}))
+    with api_service.app.test_request_context():
+        body, status = api_service._extract_invoice_xml(path)
+    assert status == 200
+    assert '\ufffd' in body["xml"]
+    assert body["xml_bytes"] == xml
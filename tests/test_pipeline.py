@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+import api_service
+
+
+def test_failing_inline_check_waits_for_the_submitted_one(tmp_path, monkeypatch):
+    pdf = tmp_path / 'out.pdf'
+    pdf.write_bytes(b'%PDF-1.7\n')
+    started = threading.Event()
+    finished = threading.Event()
+
+    def validate(*args):
+        started.wait(5)
+        raise RuntimeError('mustang failed')
+
+    def validate_pdfa(*args):
+        started.set()
+        time.sleep(0.2)
+        finished.set()
+        return 200, b'{}', 'MISS'
+
+    monkeypatch.setattr(api_service, '_cached_validation', validate)
+    monkeypatch.setattr(api_service, '_cached_result', validate_pdfa)
+    with pytest.raises(RuntimeError):
+        api_service._pipeline_validations(str(pdf), set())
+    # The workspace is removed right after the exception: the veraPDF check must be done by then
+    assert finished.is_set()
+
+
+def test_both_checks_report_their_results(tmp_path, monkeypatch):
+    pdf = tmp_path / 'out.pdf'
+    pdf.write_bytes(b'%PDF-1.7\n')
+    monkeypatch.setattr(api_service, '_cached_validation', lambda *args: (200, b'{"tool": 1}', 'MISS'))
+    stages = api_service._pipeline_validations(str(pdf), {'validate_pdfa'})
+    assert stages['validate'] == {"ok": True, "http_status": 200, "cache": 'MISS', "result": {"tool": 1}}
+    assert stages['validate_pdfa'] == {"skipped": True}
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+import api_service
+from api_service import PreflightError
+
+CII = (b'<rsm:CrossIndustryInvoice xmlns:rsm="urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100"'
+       b' xmlns:ram="urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100">'
+       b'<rsm:ExchangedDocumentContext><ram:GuidelineSpecifiedDocumentContextParameter>'
+       b'<ram:ID>urn:cen.eu:en16931:2017</ram:ID>'
+       b'</ram:GuidelineSpecifiedDocumentContextParameter></rsm:ExchangedDocumentContext>'
+       b'</rsm:CrossIndustryInvoice>')
+ORDER_X = (b'<rsm:SCRDMCCBDACIOMessageStructure xmlns:rsm="urn:un:unece:uncefact:data:SCRDMCCBDACIOMessageStructure:100">'
+           b'<rsm:ExchangedDocumentContext/></rsm:SCRDMCCBDACIOMessageStructure>')
+
+
+def test_cii_syntax_and_profile():
+    info = api_service._preflight_xml(io.BytesIO(CII))
+    assert (info["syntax"], info["guideline_id"], info["profile"]) == ('CII', 'urn:cen.eu:en16931:2017', 'COMFORT')
+
+
+@pytest.mark.parametrize('header_only', [False, True])
+def test_unknown_root_is_passed_on_without_profile(header_only):
+    info = api_service._preflight_xml(io.BytesIO(ORDER_X), header_only=header_only)
+    assert info["syntax"] is None and info["profile"] is None
+    assert info["root"].endswith('}SCRDMCCBDACIOMessageStructure')
+
+
+def test_unknown_root_must_still_be_well_formed():
+    with pytest.raises(PreflightError) as e:
+        api_service._preflight_xml(io.BytesIO(ORDER_X[:-10]))
+    assert e.value.error == 'xml_not_well_formed'
+
+
+def _pdf(tmp_path, body: bytes) -> str:
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(b'%PDF-1.7\n1 0 obj\n' + body + b'\nendobj\n%%EOF\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('body', [b'<< /AF [5 0 R] >>', b'<< /AF[5 0 R] >>', b'<< /AF 7 0 R >>',
+                                  b'<< /Type /EmbeddedFile >>', b'<< /Subtype /text#2Fxml >>'])
+def test_embedded_invoice_markers(tmp_path, body):
+    assert api_service._preflight_pdf(_pdf(tmp_path, body)) == {"type": "pdf", "embedded_files": True}
+
+
+@pytest.mark.parametrize('body', [b'<< /AFRelationship /Data >>', b'<< /AFX 1 >>', b'<< /Type /Catalog >>'])
+def test_no_embedded_invoice(tmp_path, body):
+    with pytest.raises(PreflightError) as e:
+        api_service._preflight_pdf(_pdf(tmp_path, body))
+    assert e.value.error == 'no_embedded_invoice'
+
+
+def test_marker_split_across_chunks(tmp_path, monkeypatch):
+    path = _pdf(tmp_path, b'<< /AF 1234567 0 R >>')
+    monkeypatch.setattr(api_service, '_PREFLIGHT_CHUNK', 27)
+    assert api_service._preflight_pdf(path)["embedded_files"] is True
@@ -0,0 +1,92 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+import api_service
+
+# The shell starts a grandchild in the same process group and waits for it
+TREE = 'echo started; echo warming up >&2; sleep 30 & echo $! > {pidfile}; wait'
+
+
+def _run_sync(cmd, timeout):
+    return api_service._run_process(cmd, timeout)
+
+
+def _run_async(cmd, timeout):
+    return asyncio.run(api_service._arun_process(cmd, timeout))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def _gone(pid: int) -> bool:
+    deadline = time.monotonic() + 2
+    while _alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not _alive(pid)
+
+
+def _active_spools() -> int:
+    return api_service._workspaces.stats()["active"]["disk"]
+
+
+@pytest.mark.parametrize('run', [_run_sync, _run_async])
+def test_output_is_spooled_with_usage(run):
+    before = _active_spools()
+    result = run(['sh', '-c', 'echo out; echo err >&2; exit 3'], 10)
+    assert (result.returncode, result.stdout, result.stderr) == (3, 'out\n', 'err\n')
+    assert result.cpu_seconds is not None and result.max_rss_bytes > 0
+    with result.open_stdout() as f:
+        assert f.read() == 'out\n'
+    result.release()
+    assert _active_spools() == before
+
+
+@pytest.mark.parametrize('pidfd', [True, False])
+@pytest.mark.parametrize('run', [_run_sync, _run_async])
+def test_timeout_kills_the_whole_process_group(run, pidfd, tmp_path, monkeypatch):
+    if not pidfd:
+        monkeypatch.delattr(api_service.os, 'pidfd_open', raising=False)
+    pidfile = tmp_path / 'pid'
+    before = _active_spools()
+    with pytest.raises(subprocess.TimeoutExpired) as exc:
+        run(['sh', '-c', TREE.format(pidfile=pidfile)], 0.5)
+    assert (exc.value.output, exc.value.stderr) == ('started\n', 'warming up\n')
+    assert _gone(int(pidfile.read_text()))
+    assert _active_spools() == before
+
+
+def test_cancelled_run_kills_the_whole_process_group(tmp_path):
+    pidfile = tmp_path / 'pid'
+    before = _active_spools()
+
+    async def cancel_while_running():
+        task = asyncio.ensure_future(api_service._arun_process(['sh', '-c', TREE.format(pidfile=pidfile)], 30))
+        while not pidfile.exists() or not pidfile.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel_while_running())
+    assert _gone(int(pidfile.read_text()))
+    assert _active_spools() == before
+
+
+@pytest.mark.parametrize('run_tool', [
+    api_service._run_tool,
+    lambda *args: asyncio.run(api_service._arun_tool(*args)),
+])
+def test_tool_timeouts_are_counted(run_tool):
+    counter = api_service.TOOL_EXIT_CODES.labels('gs', 'timeout')
+    before = counter._value.get()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_tool('gs', ['sleep', '5'], 0.2)
+    assert counter._value.get() == before + 1
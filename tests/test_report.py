@@ -0,0 +1,103 @@
+import io
+import json
+
+import pytest
+
+import api_service
+from api_service import MustangReportParser
+
+REPORT = ('12:00:01 INFO  org.mustangproject - starting validation\n'
+          '<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<validation filename="invoice.xml" datetime="2026-10-17 12:00:02">'
+          '<xml><info>CII</info><messages>'
+          '<error type="18" location="/rsm:CrossIndustryInvoice">XSD: a</error>'
+          '<warning type="4">W: b</warning>'
+          '<error type="4" criterion="x">[BR-CO-10] c</error>'
+          '<notice type="5">N: d</notice>'
+          '</messages><summary status="invalid"/></xml>'
+          '<messages><error type="26">e</error></messages>'
+          '<summary status="invalid"/></validation>\n'
+          '12:00:03 INFO  org.mustangproject - done\n')
+
+
+class FakeResult:
+    """The parts of ToolResult the report parser reads: spooled stdout/stderr as text files."""
+
+    def __init__(self, stdout: str, stderr: str = '', returncode: int = 0):
+        self.stdout, self.stderr, self.returncode = stdout, stderr, returncode
+
+    def open_stdout(self):
+        return io.StringIO(self.stdout)
+
+    def open_stderr(self):
+        return io.StringIO(self.stderr)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 64, len(REPORT)])
+def test_findings_are_handed_out_before_the_report_ends(chunk_size):
+    parser = MustangReportParser()
+    fed, first_seen_at = 0, None
+    findings = []
+    for i in range(0, len(REPORT), chunk_size):
+        fed += len(REPORT[i:i + chunk_size])
+        for finding in parser.feed(REPORT[i:i + chunk_size]):
+            findings.append(finding)
+            if first_seen_at is None:
+                first_seen_at = fed
+    assert [f["text"] for f in findings] == ['XSD: a', 'W: b', '[BR-CO-10] c', 'N: d', 'e']
+    if chunk_size < len(REPORT):
+        assert first_seen_at < REPORT.index('</validation>')
+    assert parser.done and parser.status == 'invalid'
+    assert (parser.filename, parser.counts) == ('invoice.xml', {'error': 3, 'warning': 1, 'notice': 1})
+    assert parser._path == []
+
+
+@pytest.mark.parametrize('findings, max_findings, expected, truncated', [
+    ('all', None, ['XSD: a', 'W: b', '[BR-CO-10] c', 'N: d', 'e'], None),
+    ('all', 2, ['XSD: a', 'W: b'], True),
+    ('errors', None, ['XSD: a', '[BR-CO-10] c', 'e'], False),
+    ('errors', 1, ['XSD: a'], True),
+    ('summary', None, [], False),
+    ('summary', 0, [], False),
+])
+def test_json_body_in_every_findings_mode(findings, max_findings, expected, truncated):
+    with api_service.app.app_context():
+        body, status = api_service._mustang_validation_body(FakeResult(REPORT), None, findings, max_findings)
+    assert status == 422 and body["ok"] is False and body["status"] == 'invalid'
+    assert body["finding_counts"] == {'error': 3, 'warning': 1, 'notice': 1}
+    assert [f["text"] for f in body["findings"]] == expected
+    assert body.get("findings_truncated") == truncated
+    assert body.get("findings_mode") == (None if truncated is None else findings)
+
+
+@pytest.mark.parametrize('findings, max_findings, expected, truncated', [
+    ('all', None, 5, False),
+    ('errors', 2, 2, True),
+    ('summary', None, 0, False),
+])
+def test_ndjson_stream_in_every_findings_mode(findings, max_findings, expected, truncated):
+    with api_service.app.app_context():
+        lines = [json.loads(line) for line in
+                 api_service._stream_mustang_validation(FakeResult(REPORT), findings, max_findings)]
+    *finding_lines, summary = lines
+    assert len(finding_lines) == expected and all("finding" in line for line in finding_lines)
+    assert summary["summary"]["http_status"] == 422
+    assert (summary["summary"]["findings_emitted"], summary["summary"]["findings_truncated"]) == (expected, truncated)
+
+
+def test_report_on_stderr_is_used_when_stdout_has_none():
+    with api_service.app.app_context():
+        body, status = api_service._mustang_validation_body(
+            FakeResult('no report here\n', stderr=REPORT.replace('invalid', 'valid')), None, 'summary', None)
+    assert (status, body["ok"]) == (200, True)
+
+
+@pytest.mark.parametrize('stdout, error', [
+    ('Exception in thread "main"\n', 'no_xml_report'),
+    (REPORT[:REPORT.index('<summary')], 'no_xml_report'),
+    (REPORT.replace('</warning>', '</wrong>'), 'xml_parse_error'),
+])
+def test_missing_or_broken_report_is_an_error(stdout, error):
+    with api_service.app.app_context():
+        body, status = api_service._mustang_validation_body(FakeResult(stdout, returncode=1), None, 'all', None)
+    assert (status, body["error"]) == (500, error)
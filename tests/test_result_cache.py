@@ -0,0 +1,181 @@
+import threading
+import time
+
+import pytest
+
+import api_service
+from conftest import TOKEN
+
+
+def _join_probes():
+    for thread in threading.enumerate():
+        if thread.name == 'toolchain-probe':
+            thread.join(5)
+
+
+@pytest.fixture
+def unknown_verapdf(monkeypatch):
+    _join_probes()
+    monkeypatch.setattr(api_service, '_toolchain_ids', {})
+    monkeypatch.setattr(api_service, '_toolchain_probe_next', 0.0)
+    yield
+    _join_probes()
+
+
+def test_unknown_verapdf_version_bypasses_the_cache_and_is_not_remembered(unknown_verapdf, monkeypatch):
+    monkeypatch.setattr(api_service, '_run_version_cmd', lambda cmd, timeout=3: None)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"ok": True}, 200
+
+    with api_service.app.app_context():
+        for _ in range(2):
+            status, _, cache_state = api_service._cached_result('validate_pdfa', 'a' * 64, [], compute)
+            assert (status, cache_state) == (200, 'BYPASS')
+    assert len(calls) == 2
+    _join_probes()
+    assert 'verapdf' not in api_service._toolchain_ids
+
+
+def test_verapdf_probe_runs_off_the_request_path_and_is_retried(unknown_verapdf, monkeypatch):
+    versions = iter([None, 'veraPDF 1.26'])
+
+    def slow_version_cmd(cmd, timeout=3):
+        time.sleep(0.2)
+        return next(versions)
+
+    monkeypatch.setattr(api_service, '_run_version_cmd', slow_version_cmd)
+    started = time.monotonic()
+    assert api_service._toolchain_identity('validate_pdfa') is None
+    assert time.monotonic() - started < 0.1
+    _join_probes()
+    assert api_service._toolchain_identity('validate_pdfa') is None
+
+    monkeypatch.setattr(api_service, '_toolchain_probe_next', 0.0)
+    api_service._toolchain_identity('validate_pdfa')
+    _join_probes()
+    assert api_service._toolchain_identity('validate_pdfa') == 'verapdf:veraPDF 1.26'
+
+
+def test_preflight_rejects_are_answered_before_the_cache(tmp_path, monkeypatch):
+    pdf = tmp_path / 'plain.pdf'
+    pdf.write_bytes(b'%PDF-1.7\n1 0 obj\n<< /Type /Catalog >>\nendobj\n%%EOF\n')
+    computed = []
+    monkeypatch.setattr(api_service, '_cached_result', lambda *args: computed.append(args))
+
+    with api_service.app.app_context():
+        status, payload, cache_state = api_service._cached_validation('b' * 64, ['plain.pdf'], str(pdf), 60)
+    assert (status, cache_state) == (422, 'BYPASS')
+    assert b'no_embedded_invoice' in payload
+    assert computed == []
+
+
+def _cache(tmp_path=None, max_entries=100, max_bytes=1024 * 1024, disk_max_bytes=0):
+    return api_service.ResultCache(max_entries, max_bytes, 3600, str(tmp_path or ''), disk_max_bytes)
+
+
+def _concurrently(n, target):
+    """Runs target(i) in n threads that start together; returns results or exceptions by index."""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_identical_keys_compute_once():
+    cache = _cache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 200, b'{"ok": true}'
+
+    results = _concurrently(8, lambda i: cache.get_or_compute('k', compute))
+    assert len(calls) == 1
+    assert sorted(state for _, _, state in results) == ['COALESCED'] * 7 + ['MISS']
+    assert {(status, payload) for status, payload, _ in results} == {(200, b'{"ok": true}')}
+    assert cache.get_or_compute('k', compute)[2] == 'HIT'
+
+
+def test_leader_exception_reaches_every_waiter_and_is_not_cached():
+    cache = _cache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError('tool crashed')
+
+    results = _concurrently(5, lambda i: cache.get_or_compute('k', compute))
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.get_or_compute('k', lambda: (200, b'{}')) == (200, b'{}', 'MISS')
+
+
+def test_error_status_is_not_cached():
+    cache = _cache()
+    assert cache.get_or_compute('k', lambda: (504, b'{"error": "timeout"}'))[2] == 'MISS'
+    assert cache.get_or_compute('k', lambda: (200, b'{}')) == (200, b'{}', 'MISS')
+
+
+def test_memory_eviction_stays_within_max_bytes():
+    cache = _cache(max_bytes=1000)
+    for i in range(50):
+        cache.get_or_compute(f'k{i}', lambda: (200, b'x' * 90))
+        assert cache._mem_bytes <= 1000
+    assert cache._mem_bytes == sum(len(payload) for _, _, payload in cache._mem.values())
+    assert 'k49' in cache._mem and 'k0' not in cache._mem
+    # Larger than the whole tier: served, never stored
+    cache.get_or_compute('big', lambda: (200, b'x' * 1001))
+    assert 'big' not in cache._mem
+
+
+def test_disk_eviction_stays_within_max_bytes(tmp_path):
+    cache = _cache(tmp_path, disk_max_bytes=2000)
+    for i in range(40):
+        cache.get_or_compute(f'{i:064x}', lambda: (422, b'y' * 100))
+        assert cache._disk_bytes <= 2000
+    on_disk = sum(size for _, size, _ in cache._disk_files())
+    assert on_disk <= 2000
+
+
+def test_disk_bytes_match_the_files_after_overwrites(tmp_path):
+    cache = _cache(tmp_path, disk_max_bytes=1024 * 1024)
+    key = 'c' * 64
+    for size in (100, 300, 50):
+        cache._put_disk(key, 422, b'z' * size)
+    assert cache._disk_bytes == sum(size for _, size, _ in cache._disk_files()) == len(b'422\n') + 50
+
+
+def test_in_flight_temp_files_are_not_counted(tmp_path):
+    cache = _cache(tmp_path, disk_max_bytes=1024 * 1024)
+    cache._put_disk('d' * 64, 422, b'z' * 10)
+    (tmp_path / 'dd' / 'writer.tmp').write_bytes(b'x' * 500)
+    assert [path for path, _, _ in cache._disk_files()] == [str(tmp_path / 'dd' / f"{'d' * 64}.json")]
+
+
+def test_stats_snapshot():
+    cache = _cache()
+    cache.get_or_compute('k', lambda: (200, b'12345'))
+    assert cache.stats() == {"entries": 1, "memory_bytes": 5, "disk_bytes": 0, "inflight": 0}
+
+
+def test_metrics_export_the_cache_stats():
+    resp = api_service.app.test_client().get('/metrics', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert resp.status_code == 200
+    assert b'mustang_api_result_cache_memory_bytes' in resp.data
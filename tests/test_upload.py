@@ -0,0 +1,92 @@
+import hashlib
+import io
+
+import pytest
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+import api_service
+from conftest import TOKEN
+
+BOUNDARY = 'x-boundary-42'
+PDF = b'%PDF-1.7\n' + bytes(range(256)) * 300 + b'\r\n--x-boundary-4 not the boundary\r\n'
+XML = b'<?xml version="1.0"?><Invoice/>'
+
+
+def _part(name: str, body: bytes, filename=None) -> bytes:
+    disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+    return (f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + body + b'\r\n'
+
+
+def _multipart(*parts: bytes) -> bytes:
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def _feed(body: bytes, chunk_size: int, target):
+    spooler = api_service._MultipartSpooler(BOUNDARY, target)
+    try:
+        for i in range(0, len(body), chunk_size):
+            if spooler.feed(body[i:i + chunk_size]):
+                break
+        else:
+            spooler.feed(b'')
+    finally:
+        spooler.close()
+    return spooler.uploads
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, len(BOUNDARY) + 3, 4096])
+def test_boundary_split_across_chunks(tmp_path, chunk_size):
+    body = _multipart(_part('note', b'ignored'), _part('file', PDF, 'in.pdf'))
+    [upload] = _feed(body, chunk_size, lambda field, filename, index: str(tmp_path / 'in.pdf'))
+    assert (upload.field, upload.filename, upload.size) == ('file', 'in.pdf', len(PDF))
+    assert upload.sha256 == hashlib.sha256(PDF).hexdigest()
+    assert upload.head == PDF[:api_service._SNIFF_BYTES]
+    assert (tmp_path / 'in.pdf').read_bytes() == PDF
+
+
+def test_multiple_files_first_part_per_field(tmp_path):
+    paths = {'pdf': str(tmp_path / 'in.pdf'), 'xml': str(tmp_path / 'in.xml')}
+    body = _multipart(_part('pdf', PDF, 'a.pdf'), _part('xml', XML, 'a.xml'), _part('pdf', b'second', 'b.pdf'),
+                      _part('other', b'skipped', 'c.bin'))
+    uploads = _feed(body, 1000, api_service._request_files_target(paths))
+    assert [(u.field, u.filename) for u in uploads] == [('pdf', 'a.pdf'), ('xml', 'a.xml')]
+    assert (tmp_path / 'in.pdf').read_bytes() == PDF
+    assert (tmp_path / 'in.xml').read_bytes() == XML
+
+
+def _request(body: bytes, **kwargs):
+    return api_service.app.test_request_context(
+        '/upload', method='POST', input_stream=io.BytesIO(body),
+        content_type=f'multipart/form-data; boundary={BOUNDARY}', **kwargs)
+
+
+def test_missing_field_is_absent(tmp_path):
+    body = _multipart(_part('pdf', PDF, 'a.pdf'))
+    with _request(body, content_length=len(body)):
+        uploads = api_service._spool_request_files({'pdf': str(tmp_path / 'in.pdf'), 'xml': str(tmp_path / 'in.xml')})
+    assert list(uploads) == ['pdf']
+    assert not (tmp_path / 'in.xml').exists()
+
+
+def test_missing_field_on_an_endpoint_is_a_400():
+    body = _multipart(_part('document', XML, 'a.xml'))
+    resp = api_service.app.test_client().post('/validate', data=body, headers={
+        'Authorization': f'Bearer {TOKEN}', 'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'})
+    assert resp.status_code == 400
+
+
+def test_truncated_body_is_a_400(tmp_path):
+    body = _multipart(_part('file', PDF, 'in.pdf'))[:-200]
+    with _request(body, content_length=len(body)), pytest.raises(BadRequest):
+        api_service._spool_request_files({'file': str(tmp_path / 'in.pdf')})
+
+
+@pytest.mark.parametrize('declared', [True, False])
+def test_oversize_body_is_a_413(tmp_path, monkeypatch, declared):
+    monkeypatch.setitem(api_service.app.config, 'MAX_CONTENT_LENGTH', 64 * 1024)
+    body = _multipart(_part('file', PDF * 4, 'in.pdf'))
+    # Without Content-Length the body ends where the input is terminated (chunked upload)
+    kwargs = {'content_length': len(body)} if declared else {'environ_overrides': {'wsgi.input_terminated': True}}
+    with _request(body, **kwargs), pytest.raises(RequestEntityTooLarge):
+        api_service._spool_request_files({'file': str(tmp_path / 'in.pdf')})
@@ -0,0 +1,134 @@
+import json
+import os
+import sys
+
+import pytest
+
+import api_service
+from test_result_cache import _concurrently
+
+RULE = {"specification": "ISO 19005-3:2012", "clause": "6.2.11.4.1", "testNumber": 1, "status": "failed",
+        "description": "font not embedded", "object": "PDFont", "failedChecks": 2,
+        "checks": [{"status": "failed", "context": "root/document[0]/pages[0]", "errorMessage": "x"}] * 2}
+PASSED_RULE = {**RULE, "clause": "6.1.2", "status": "passed", "failedChecks": 0, "checks": []}
+REPORT = {"report": {"jobs": [{"itemDetails": {"name": "in.pdf"}, "validationResult": [{
+    "profileName": "PDF/A-3B", "compliant": False,
+    "details": {"passedRules": 1, "failedRules": 1, "passedChecks": 10, "failedChecks": 2,
+                "ruleSummaries": [RULE, PASSED_RULE]}}]}],
+    "batchSummary": {"totalJobs": 1}}}
+
+
+@pytest.fixture
+def verapdf(tmp_path, monkeypatch):
+    """A `verapdf` on PATH that prints REPORT (with check lists, whatever the options) and logs its arguments."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    calls = tmp_path / 'calls'
+    script = bin_dir / 'verapdf'
+    script.write_text(f'#!{sys.executable}\n'
+                      f'import json, sys\n'
+                      f'open({str(calls)!r}, "a").write(json.dumps(sys.argv[1:]) + "\\n")\n'
+                      f'print({json.dumps(REPORT)!r})\n')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+    pdf = tmp_path / 'in.pdf'
+    pdf.write_bytes(b'%PDF-1.7\n')
+    return str(pdf), lambda: [json.loads(line) for line in calls.read_text().splitlines()]
+
+
+def _validate(path, report):
+    with api_service.app.app_context():
+        return api_service._validate_with_verapdf(path, report)
+
+
+def test_full_report_is_passed_through(verapdf):
+    path, calls = verapdf
+    body, status = _validate(path, 'full')
+    assert status == 422
+    assert body == {"ok": False, "returncode": 0, "verapdf": REPORT}
+    assert '--maxfailuresdisplayed' not in calls()[0]
+
+
+def test_summary_has_counts_only(verapdf):
+    path, calls = verapdf
+    body, status = _validate(path, 'summary')
+    assert status == 422
+    assert body == {"ok": False, "returncode": 0, "report_mode": 'summary', "validation": [{
+        "profile": 'PDF/A-3B', "compliant": False,
+        "rules": {"passed": 1, "failed": 1}, "checks": {"passed": 10, "failed": 2}}]}
+    assert calls()[0][:4] == ['--format', 'json', '--maxfailuresdisplayed', '0']
+
+
+def test_failed_rules_lists_the_failed_rules_without_checks(verapdf):
+    path, _ = verapdf
+    body, status = _validate(path, 'failed_rules')
+    assert status == 422
+    [entry] = body["validation"]
+    assert entry["failed_rules"] == [{
+        "specification": 'ISO 19005-3:2012', "clause": '6.2.11.4.1', "test_number": 1,
+        "description": 'font not embedded', "object": 'PDFont', "failed_checks": 2}]
+
+
+def test_compact_modes_drop_check_lists_while_decoding(tmp_path):
+    report = tmp_path / 'report.json'
+    report.write_text(json.dumps(REPORT))
+    compact = api_service._try_parse_json_file(str(report), api_service._verapdf_drop_checks)
+    rules = compact["report"]["jobs"][0]["validationResult"][0]["details"]["ruleSummaries"]
+    assert all("checks" not in rule for rule in rules)
+    assert [rule["failedChecks"] for rule in rules] == [2, 0]
+
+
+@pytest.fixture
+def coalescer(monkeypatch):
+    """A coalescer with a long window; records the file lists of the veraPDF runs (bench stub)."""
+    runs = []
+    run_tool = api_service._run_tool
+
+    def recording_run_tool(tool, cmd, *args, **kwargs):
+        runs.append([a for a in cmd if a.endswith('.pdf')])
+        return run_tool(tool, cmd, *args, **kwargs)
+
+    monkeypatch.setattr(api_service, '_run_tool', recording_run_tool)
+    monkeypatch.setattr(api_service, '_verapdf_coalescer', api_service.VeraPDFCoalescer(0.5, 4))
+    return runs
+
+
+def _pdfs(tmp_path, n):
+    paths = []
+    for i in range(n):
+        path = tmp_path / f'{i}.pdf'
+        path.write_bytes(b'%PDF-1.7\n' + b'%d' % i)
+        paths.append(str(path))
+    return paths
+
+
+def test_concurrent_requests_share_one_run(tmp_path, coalescer):
+    paths = _pdfs(tmp_path, 4)
+    results = _concurrently(4, lambda i: _validate(paths[i], 'full'))
+    assert len(coalescer) == 1 and sorted(coalescer[0]) == sorted(paths)
+    for path, (body, status) in zip(paths, results):
+        assert status == 200
+        [job] = body["verapdf"]["report"]["jobs"]
+        assert job["itemDetails"]["name"] == path
+        assert body["verapdf"]["report"]["batchSummary"]["totalJobs"] == 1
+
+
+def test_report_modes_do_not_share_a_run(tmp_path, coalescer, monkeypatch):
+    monkeypatch.setattr(api_service, '_verapdf_coalescer', api_service.VeraPDFCoalescer(0.3, 2))
+    paths = _pdfs(tmp_path, 2)
+    results = _concurrently(2, lambda i: _validate(paths[i], ('full', 'summary')[i]))
+    assert sorted(len(run) for run in coalescer) == [1, 1]
+    assert [status for _, status in results] == [200, 200]
+    assert "verapdf" in results[0][0] and results[1][0]["report_mode"] == 'summary'
+
+
+def test_a_failed_run_reaches_every_request(tmp_path, coalescer, monkeypatch):
+    def timeout(tool, cmd, *args, **kwargs):
+        coalescer.append(cmd)
+        raise api_service.subprocess.TimeoutExpired(cmd, 1)
+
+    monkeypatch.setattr(api_service, '_run_tool', timeout)
+    paths = _pdfs(tmp_path, 3)
+    results = _concurrently(3, lambda i: _validate(paths[i], 'full'))
+    assert len(coalescer) == 1
+    assert [(body["error"], status) for body, status in results] == [('timeout', 504)] * 3
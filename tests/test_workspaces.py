@@ -0,0 +1,58 @@
+import os
+
+import api_service
+
+MB = 1024 * 1024
+
+
+def _manager(tmp_path, ram_quota=4 * MB, spill=1 * MB):
+    return api_service.WorkspaceManager(str(tmp_path / 'ram'), str(tmp_path / 'disk'), ram_quota, spill)
+
+
+def test_small_upload_goes_to_ram_and_returns_its_reservation(tmp_path):
+    manager = _manager(tmp_path)
+    ws = manager.allocate(100 * 1024)
+    assert ws.tier == 'ram' and ws.path.startswith(manager.ram_dir)
+    assert manager.ram_reserved_bytes == ws.reserved > 0
+    ws.release()
+    assert manager.ram_reserved_bytes == 0 and not os.path.exists(ws.path)
+
+
+def test_large_or_unknown_size_spills_to_disk(tmp_path):
+    manager = _manager(tmp_path)
+    for expected in (2 * MB, None):
+        ws = manager.allocate(expected)
+        assert ws.tier == 'disk' and ws.path.startswith(manager.disk_dir)
+        assert ws.reserved == 0
+        ws.release()
+    assert manager.allocated_total == {'ram': 0, 'disk': 2}
+
+
+def test_exhausted_ram_quota_spills_to_disk(tmp_path):
+    manager = _manager(tmp_path, ram_quota=1 * MB)
+    held = [manager.allocate(100 * 1024) for _ in range(3)]
+    assert [ws.tier for ws in held] == ['ram', 'ram', 'ram']
+    # 3 x 300 KB reserved: the next 300 KB no longer fit into 1 MB
+    spilled = manager.allocate(100 * 1024)
+    assert spilled.tier == 'disk'
+    held[0].release()
+    assert manager.allocate(100 * 1024).tier == 'ram'
+    assert manager.stats()["active"] == {'ram': 3, 'disk': 1}
+
+
+def test_unusable_ram_dir_puts_everything_on_disk(tmp_path):
+    blocker = tmp_path / 'ram'
+    blocker.write_bytes(b'')
+    manager = _manager(tmp_path)
+    assert manager.ram_dir is None
+    assert manager.allocate(1024).tier == 'disk'
+
+
+def test_orphans_of_dead_processes_are_swept(tmp_path):
+    manager = _manager(tmp_path)
+    dead = tmp_path / 'disk' / 'ws-999999999-x'
+    dead.mkdir()
+    alive = tmp_path / 'disk' / f'ws-{os.getppid()}-y'
+    alive.mkdir()
+    assert manager.sweep_orphans() == 1
+    assert not dead.exists() and alive.exists()
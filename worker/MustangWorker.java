@@ -0,0 +1,193 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.management.ManagementFactory;
+import java.lang.management.MemoryPoolMXBean;
+import java.lang.management.MemoryType;
+import java.lang.management.MemoryUsage;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URLDecoder;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+
+/**
+ * Langlebiger Treiber für Mustang-CLI (wird von api_service.py als Worker-Pool gestartet).
+ *
+ * Statt pro Request "java -jar Mustang-CLI.jar ..." zu starten, lädt dieser Prozess die
+ * CLI-Klassen einmal und ruft org.mustangproject.commandline.Main.main() für jeden Job auf.
+ * System.exit() der CLI wird abgefangen und als Exit-Code zurückgemeldet.
+ *
+ * Protokoll (zeilenbasiert, UTF-8, stdin/stdout):
+ *
+ *   Request:   JOB
+ *              <Pfad für stdout des Jobs>
+ *              <Pfad für stderr des Jobs>
+ *              <argc>
+ *              <arg 1, URL-encoded>
+ *              ...
+ *   Antwort:   RESULT <exitCode> <heapLiveBytes>
+ *
+ * heapLiveBytes ist der Heap nach der letzten Garbage Collection (siehe heapAfterLastGc), nicht
+ * totalMemory() - freeMemory(): das enthielte den Müll des gerade beendeten Jobs.
+ *
+ * Beim Start meldet der Worker "READY". stdout/stderr der CLI landen ausschließlich in den
+ * Job-Dateien; der echte stdout des Prozesses ist dem Protokoll vorbehalten.
+ */
+public final class MustangWorker {
+
+    private static final String MAIN_CLASS = "org.mustangproject.commandline.Main";
+
+    private static final class ExitTrapped extends SecurityException {
+        final int status;
+
+        ExitTrapped(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    /** Umschaltbarer Stream: Logger, die System.out beim Start cachen, schreiben trotzdem in den aktuellen Job. */
+    private static final class SwitchableOutputStream extends OutputStream {
+        private volatile OutputStream target;
+
+        SwitchableOutputStream(OutputStream initial) {
+            this.target = initial;
+        }
+
+        void switchTo(OutputStream next) {
+            this.target = next;
+        }
+
+        @Override
+        public void write(int b) throws IOException {
+            target.write(b);
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) throws IOException {
+            target.write(b, off, len);
+        }
+
+        @Override
+        public void flush() throws IOException {
+            target.flush();
+        }
+    }
+
+    @SuppressWarnings("removal")
+    public static void main(String[] argv) throws Exception {
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        OutputStream idleSink = new FileOutputStream(FileDescriptor.err);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+
+        SwitchableOutputStream jobOut = new SwitchableOutputStream(idleSink);
+        SwitchableOutputStream jobErr = new SwitchableOutputStream(idleSink);
+        System.setOut(new PrintStream(jobOut, true, "UTF-8"));
+        System.setErr(new PrintStream(jobErr, true, "UTF-8"));
+
+        Method entry = Class.forName(MAIN_CLASS).getMethod("main", String[].class);
+
+        // Requires -Djava.security.manager=allow on Java 18+
+        System.setSecurityManager(new SecurityManager() {
+            @Override
+            public void checkPermission(Permission perm) {
+            }
+
+            @Override
+            public void checkPermission(Permission perm, Object context) {
+            }
+
+            @Override
+            public void checkExit(int status) {
+                throw new ExitTrapped(status);
+            }
+        });
+
+        protocol.println("READY");
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            if (!"JOB".equals(line)) {
+                protocol.println("ERROR unknown command: " + line);
+                continue;
+            }
+            String outPath = in.readLine();
+            String errPath = in.readLine();
+            int argc = Integer.parseInt(in.readLine().trim());
+            String[] args = new String[argc];
+            for (int i = 0; i < argc; i++) {
+                args[i] = URLDecoder.decode(in.readLine(), StandardCharsets.UTF_8);
+            }
+
+            int code;
+            try (FileOutputStream out = new FileOutputStream(outPath);
+                 FileOutputStream err = new FileOutputStream(errPath)) {
+                jobOut.switchTo(out);
+                jobErr.switchTo(err);
+                System.setIn(new ByteArrayInputStream(new byte[0]));
+                code = runJob(entry, args);
+                System.out.flush();
+                System.err.flush();
+            } finally {
+                jobOut.switchTo(idleSink);
+                jobErr.switchTo(idleSink);
+            }
+
+            protocol.println("RESULT " + code + " " + heapAfterLastGc());
+        }
+
+        // stdin closed by the pool: leave without going through the SecurityManager
+        Runtime.getRuntime().halt(0);
+    }
+
+    /**
+     * Summe der Heap-Pools, wie die letzte Collection des jeweiligen Pools sie hinterlassen hat
+     * (lebende Objekte). Ohne System.gc(): ein voller GC pro Job kostete mehr als der Worker spart.
+     * Liefert die JVM keine Werte nach GC, wird der aktuell belegte Heap gemeldet.
+     */
+    private static long heapAfterLastGc() {
+        long live = 0;
+        boolean measured = false;
+        for (MemoryPoolMXBean pool : ManagementFactory.getMemoryPoolMXBeans()) {
+            if (pool.getType() != MemoryType.HEAP) {
+                continue;
+            }
+            MemoryUsage usage = pool.getCollectionUsage();
+            if (usage != null) {
+                live += usage.getUsed();
+                measured = true;
+            }
+        }
+        return measured ? live : ManagementFactory.getMemoryMXBean().getHeapMemoryUsage().getUsed();
+    }
+
+    private static int runJob(Method entry, String[] args) {
+        try {
+            entry.invoke(null, (Object) args);
+            return 0;
+        } catch (InvocationTargetException e) {
+            Throwable cause = e.getCause();
+            if (cause instanceof ExitTrapped) {
+                return ((ExitTrapped) cause).status;
+            }
+            if (cause != null) {
+                cause.printStackTrace();
+            }
+            return 1;
+        } catch (ExitTrapped e) {
+            return e.status;
+        } catch (Exception e) {
+            e.printStackTrace();
+            return 1;
+        }
+    }
+}
@@ -0,0 +1,217 @@
+"""
+Langlebiger Validierungsprozess für /validate?engine=fast (api_service.py, FAST_VALIDATION_*).
+
+Lädt beim Start die XSDs (CII D16B, UBL 2.1) mit lxml und kompiliert die Schematron-XSLTs
+(EN16931 CII/UBL, XRechnung CII/UBL) einmal mit Saxon-HE (saxonche, die XSLTs sind XSLT 2.0).
+Ein Job parst danach nur noch das Dokument und wendet XSD und Schematron an. Der Report hat
+die Form von Mustangs Validierungsreport, damit api_service.py ihn mit demselben Parser liest:
+
+  <validation filename="..." datetime="...">
+    <xml>
+      <info>...</info>
+      <messages>
+        <error type="18" location="...">XSD-Meldung</error>
+        <error type="4" location="..." criterion="XPath-Test">[BR-..]-Regeltext</error>
+        <warning type="4" ...>...</warning>
+      </messages>
+      <summary status="valid|invalid"/>
+    </xml>
+    <summary status="valid|invalid"/>
+  </validation>
+
+Protokoll wie worker/MustangWorker.java (READY / JOB / RESULT <exitCode> <maxRssBytes>), Job-Argumente:
+
+  --source <xml> --syntax CII|UBL --rules en16931|xrechnung
+
+Exit-Code 0 = Report geschrieben (gültig oder nicht), 2 = Dokument nicht prüfbar (Details auf stderr).
+Mit Job-Argumenten aufgerufen läuft eine einzelne Prüfung, Report auf stdout (bench/fast_parity.py).
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+import traceback
+import urllib.parse
+from datetime import datetime
+
+ARTIFACTS_DIR = os.environ.get('FAST_VALIDATION_DIR', '/opt/validation')
+
+# Root element → XSD (file names as shipped in the EN16931 and OASIS UBL 2.1 archives, see Dockerfile)
+_XSD_FILES = {
+    '{urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100}CrossIndustryInvoice':
+        'CrossIndustryInvoice_100pD16B.xsd',
+    '{urn:oasis:names:specification:ubl:schema:xsd:Invoice-2}Invoice': 'UBL-Invoice-2.1.xsd',
+    '{urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2}CreditNote': 'UBL-CreditNote-2.1.xsd',
+}
+_XSD_SYNTAX = {
+    'CrossIndustryInvoice': 'CII',
+    'Invoice': 'UBL',
+    'CreditNote': 'UBL',
+}
+# (syntax, rule set) → compiled schematron (EN16931 validation artefacts, KoSIT xrechnung-schematron)
+_SCHEMATRON_FILES = {
+    ('CII', 'en16931'): 'EN16931-CII-validation.xslt',
+    ('UBL', 'en16931'): 'EN16931-UBL-validation.xslt',
+    ('CII', 'xrechnung'): 'XRechnung-CII-validation.xsl',
+    ('UBL', 'xrechnung'): 'XRechnung-UBL-validation.xsl',
+}
+# XRechnung is a CIUS: its rules come on top of EN16931
+_RULES = {
+    'en16931': ('en16931',),
+    'xrechnung': ('en16931', 'xrechnung'),
+}
+
+# Section codes in the type attribute, as in Mustang's reports
+_TYPE_SCHEMA = '18'
+_TYPE_SCHEMATRON = '4'
+_SVRL = '{http://purl.oclc.org/dsdl/svrl}'
+# SVRL flag → report element; notices are left out like Mustang's --no-notices
+_SVRL_SEVERITY = {'fatal': 'error', 'error': 'error', 'warning': 'warning', 'information': None}
+
+class Unsupported(Exception):
+    """Document outside the loaded schemas/rule sets; api_service.py falls back to Mustang."""
+
+def _find_artifacts(root_dir: str, names) -> dict:
+    """File name → path of its first occurrence below root_dir (sorted walk, so the choice is stable)."""
+    wanted, found = set(names), {}
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for name in sorted(wanted.intersection(filenames)):
+            found.setdefault(name, os.path.join(dirpath, name))
+    missing = wanted.difference(found)
+    if missing:
+        raise FileNotFoundError(f"Validierungsartefakte fehlen in {root_dir}: {', '.join(sorted(missing))}")
+    return found
+
+class Validator:
+    """XSDs and compiled schematrons, loaded once; validate() is called per job."""
+
+    def __init__(self, root_dir: str):
+        from lxml import etree
+        from saxonche import PySaxonProcessor
+        self.etree = etree
+        files = _find_artifacts(root_dir, [*_XSD_FILES.values(), *_SCHEMATRON_FILES.values()])
+        self.schemas = {root: etree.XMLSchema(etree.parse(files[name])) for root, name in _XSD_FILES.items()}
+        self.processor = PySaxonProcessor(license=False)
+        xslt = self.processor.new_xslt30_processor()
+        self.schematrons = {key: xslt.compile_stylesheet(stylesheet_file=files[name])
+                            for key, name in _SCHEMATRON_FILES.items()}
+        # Uploads never need DTDs, entities or the network
+        self.parser = etree.XMLParser(resolve_entities=False, no_network=True, load_dtd=False, huge_tree=True)
+
+    def validate(self, source: str, syntax: str, rules: str) -> bytes:
+        """Mustang-shaped report for one document; raises Unsupported."""
+        started = time.perf_counter()
+        etree = self.etree
+        if rules not in _RULES:
+            raise Unsupported(f"Unbekannter Regelsatz '{rules}'")
+        try:
+            doc = etree.parse(source, self.parser)
+        except etree.XMLSyntaxError as e:
+            raise Unsupported(f"XML ist nicht wohlgeformt: {e}")
+        root_tag = doc.getroot().tag
+        schema = self.schemas.get(root_tag)
+        if schema is None or _XSD_SYNTAX[etree.QName(root_tag).localname] != syntax:
+            raise Unsupported(f"Root-Element {root_tag} passt nicht zu Syntax {syntax}")
+
+        messages = []
+        if not schema.validate(doc):
+            for entry in schema.error_log:
+                messages.append(('error', _TYPE_SCHEMA, entry.path, None, f"{entry.message} (Zeile {entry.line})"))
+        node = self.processor.parse_xml(xml_file_name=source)
+        for rule_set in _RULES[rules]:
+            svrl = self.schematrons[(syntax, rule_set)].transform_to_string(xdm_node=node)
+            messages.extend(self._svrl_messages(svrl))
+
+        status = 'invalid' if any(tag == 'error' for tag, *_ in messages) else 'valid'
+        report = etree.Element('validation', filename=os.path.basename(source),
+                               datetime=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        xml = etree.SubElement(report, 'xml')
+        info = etree.SubElement(xml, 'info')
+        etree.SubElement(info, 'validator').text = 'fast'
+        etree.SubElement(info, 'ruleset').text = '+'.join(_RULES[rules])
+        duration = etree.SubElement(info, 'duration', unit='ms')
+        duration.text = str(round((time.perf_counter() - started) * 1000))
+        container = etree.SubElement(xml, 'messages')
+        for tag, section, location, criterion, text in messages:
+            elem = etree.SubElement(container, tag, type=section)
+            if location:
+                elem.set('location', location)
+            if criterion:
+                elem.set('criterion', criterion)
+            elem.text = text
+        etree.SubElement(xml, 'summary', status=status)
+        etree.SubElement(report, 'summary', status=status)
+        return etree.tostring(report, encoding='UTF-8', xml_declaration=True)
+
+    def _svrl_messages(self, svrl: str):
+        root = self.etree.fromstring(svrl.encode('utf-8'))
+        for elem in root.iter(_SVRL + 'failed-assert', _SVRL + 'successful-report'):
+            tag = _SVRL_SEVERITY.get((elem.get('flag') or 'fatal').lower(), 'error')
+            if tag is None:
+                continue
+            text = ' '.join((elem.findtext(_SVRL + 'text') or '').split())
+            yield tag, _TYPE_SCHEMATRON, elem.get('location'), elem.get('test'), text
+
+def _job_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', required=True)
+    parser.add_argument('--syntax', required=True, choices=('CII', 'UBL'))
+    parser.add_argument('--rules', required=True, choices=tuple(_RULES))
+    return parser
+
+def _run_job(validator: Validator, args: list[str], out, err) -> int:
+    try:
+        job = _job_parser().parse_args(args)
+    except SystemExit:
+        err.write(f"Ungültige Job-Argumente: {args!r}\n")
+        return 2
+    try:
+        report = validator.validate(job.source, job.syntax, job.rules)
+    except Unsupported as e:
+        err.write(f"Nicht prüfbar: {e}\n")
+        return 2
+    except Exception:
+        err.write(traceback.format_exc())
+        return 2
+    out.write(report)
+    return 0
+
+def serve(validator: Validator) -> int:
+    # Saxon may print to fd 1 (xsl:message); the protocol runs over a duplicate of the original stdout
+    protocol = os.fdopen(os.dup(1), 'w', encoding='utf-8', buffering=1)
+    os.dup2(2, 1)
+    protocol.write("READY\n")
+    for line in sys.stdin:
+        line = line.rstrip('\n')
+        if not line:
+            continue
+        if line != 'JOB':
+            protocol.write(f"ERROR unknown command: {line}\n")
+            continue
+        out_path = sys.stdin.readline().rstrip('\n')
+        err_path = sys.stdin.readline().rstrip('\n')
+        argc = int(sys.stdin.readline())
+        args = [urllib.parse.unquote(sys.stdin.readline().rstrip('\n')) for _ in range(argc)]
+
+        with open(out_path, 'wb') as out, open(err_path, 'w', encoding='utf-8') as err:
+            code = _run_job(validator, args, out, err)
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        protocol.write(f"RESULT {code} {max_rss}\n")
+    return 0
+
+def main() -> int:
+    try:
+        validator = Validator(ARTIFACTS_DIR)
+    except Exception as e:
+        # Before READY: the pool treats the worker as failed and api_service.py uses Mustang
+        print(f"Fast-Validator nicht verfügbar: {e}", file=sys.stderr)
+        return 1
+    if len(sys.argv) > 1:
+        return _run_job(validator, sys.argv[1:], sys.stdout.buffer, sys.stderr)
+    return serve(validator)
+
+if __name__ == '__main__':
+    sys.exit(main())